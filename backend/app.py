@@ -2,19 +2,66 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from core.meta_controller import handle_query as meta_handle_query
-from core.intent_classifier import IntentClassifier
-from engines.retrieval_engine import RetrievalEngine
-from feedback.feedback_store import store_feedback
-import subprocess
-import threading
+from typing import List
+import config
+from core.meta_controller import (
+    handle_query as meta_handle_query,
+    handle_query_async as meta_handle_query_async,
+    handle_queries as meta_handle_queries,
+    stream_query as meta_stream_query,
+    engine_manager,
+    response_cache,
+    admission,
+)
+from core.admission import EngineBusy
+from core.latency import tracer
+from core.model_registry import model_registry
+from core.routing_rules import routing_rules
+from feedback.feedback_store import store_feedback, feedback_writer
+from feedback.feedback_maintenance import FeedbackMaintenance
+from ml.retrain_scheduler import RetrainScheduler
+from engines.transformer_engine import generation_stats
+import json
+import logging
 import os
-import pandas as pd
-import joblib
-from fastapi.responses import JSONResponse
+import threading
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from contextlib import asynccontextmanager
+
 
+def load_warmup_queries():
+    if not os.path.exists(config.WARMUP_QUERIES_PATH):
+        return []
+    with open(config.WARMUP_QUERIES_PATH, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
 
-app = FastAPI(title="Student Meta-Learning AI Backend")
+def start_engines():
+    # Load every engine in parallel, then run the warm-up set end to end
+    if engine_manager.load_all():
+        engine_manager.warm_up(meta_handle_query, load_warmup_queries())
+
+def is_ready():
+    if config.ENGINE_LOAD_MODE == "lazy":
+        return True
+    return engine_manager.all_ready() and engine_manager.warmed_up
+
+@asynccontextmanager
+async def lifespan(app):
+    # Open the feedback DB and run its schema migration before serving
+    feedback_writer.start()
+    retrain_scheduler.start()
+    feedback_maintenance.start()
+    # Engines load in the background so the server binds (and is live) at once;
+    # /health/ready reports 503 until loading and warm-up have finished
+    if config.ENGINE_LOAD_MODE != "lazy":
+        threading.Thread(target=start_engines, name="engine-startup", daemon=True).start()
+    yield
+    feedback_maintenance.stop()
+    # Commit whatever is still queued before the process exits
+    feedback_writer.close()
+
+app = FastAPI(title="Student Meta-Learning AI Backend", lifespan=lifespan)
 
 # Enable CORS for all origins (for development)
 app.add_middleware(
@@ -28,44 +75,66 @@ app.add_middleware(
 from feedback.feedback_metrics import router as feedback_metrics_router
 app.include_router(feedback_metrics_router)
 
+@app.exception_handler(EngineBusy)
+async def engine_busy(request, exc):
+    # Raised by admission control in "reject" mode (see ADMISSION_MODE)
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "engine": exc.engine},
+        headers={"Retry-After": str(exc.retry_after_s)},
+    )
+
 
 
 class QueryRequest(BaseModel):
     query: str
 
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+
 class FeedbackRequest(BaseModel):
     query: str
     engine_used: str
     feedback: int
 
-def retrain_models_async():
-    # Export feedback to CSV and retrain all models (except transformers)
-    try:
-        feedback_path = os.path.join("feedback", "feedback.db")
-        if os.path.exists(feedback_path):
-            import sqlite3
-            conn = sqlite3.connect(feedback_path)
-            df = pd.read_sql_query("SELECT * FROM feedback", conn)
-            df.to_csv(os.path.join("datasets", "feedback_export.csv"), index=False)
-            conn.close()
-        # Retrain domain, intent, quality models
-        subprocess.run(["python", "ml/train_domain.py"])
-        subprocess.run(["python", "ml/train_intent.py"])
-        subprocess.run(["python", "ml/train_quality.py"])
-        # Reload models in memory
-        global intent_classifier
-        intent_classifier = IntentClassifier()
-        global retrieval_engine
-        retrieval_engine = RetrievalEngine()
-    except Exception as e:
-        print(f"Retraining failed: {e}")
+def on_models_swapped(heads, version):
+    # Load, warm and swap the retrained heads in the background
+    model_registry.reload_async(source=f"online-v{version}")
 
-@app.post("/query")
-def handle_query(request: QueryRequest):
-    query = request.query.strip()
-    if not query or len(query) > 300:
-        raise HTTPException(status_code=400, detail="Query must be non-empty and <= 300 characters.")
-    result = meta_handle_query(query)
+# Feedback bursts collapse into one incremental retrain over the new rows only
+retrain_scheduler = RetrainScheduler(
+    config.FEEDBACK_DB_PATH,
+    config.ONLINE_MODELS_DIR,
+    debounce_s=config.RETRAIN_DEBOUNCE_S,
+    max_delay_s=config.RETRAIN_MAX_DELAY_S,
+    flush=feedback_writer.flush,
+    on_swap=on_models_swapped,
+)
+
+# Exports the feedback log to Parquet and rolls rows past retention into daily
+# aggregates, never touching rows the retrain scheduler has not consumed
+feedback_maintenance = FeedbackMaintenance(
+    config.FEEDBACK_DB_PATH,
+    retain_days=config.FEEDBACK_RETENTION_DAYS,
+    interval_s=config.FEEDBACK_MAINTENANCE_INTERVAL_S,
+    export_dir=config.FEEDBACK_EXPORT_DIR or None,
+    consumed_id=retrain_scheduler.consumed_id,
+    flush=feedback_writer.flush,
+)
+
+def format_response(result):
+    # Ensure output format matches frontend expectations
+    return {
+        "answer": result.get("answer"),
+        "domain": result.get("domain"),
+        "intent": result.get("intent"),
+        "difficulty": result.get("difficulty"),
+        "engine_used": result.get("engine"),
+        "confidence": result.get("confidence"),
+        "reason": f"{result.get('domain')} {result.get('intent')} query routed to {result.get('engine')} engine"
+    }
+
+def log_query(query, result):
     # Optionally: store feedback, but do NOT retrain here
     try:
         store_feedback(
@@ -79,16 +148,75 @@ def handle_query(request: QueryRequest):
         import logging
         logging.basicConfig(level=logging.ERROR)
         logging.error(f"Feedback store error: {e}")
-    # Ensure output format matches frontend expectations
-    return {
-        "answer": result.get("answer"),
-        "domain": result.get("domain"),
-        "intent": result.get("intent"),
-        "difficulty": result.get("difficulty"),
-        "engine_used": result.get("engine"),
-        "confidence": result.get("confidence"),
-        "reason": f"{result.get('domain')} {result.get('intent')} query routed to {result.get('engine')} engine"
-    }
+
+def clean_query(query):
+    query = query.strip()
+    if not query or len(query) > 300:
+        raise HTTPException(status_code=400, detail="Query must be non-empty and <= 300 characters.")
+    return query
+
+@app.post("/query")
+async def handle_query(request: QueryRequest):
+    query = clean_query(request.query)
+    result = await meta_handle_query_async(query)
+    log_query(query, result)
+    return format_response(result)
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_response(query):
+    # meta -> token* -> done, as Server-Sent Events. Routing and generation
+    # block, so the generator is advanced on the threadpool. The first event
+    # is produced before the response starts, so a request shed by admission
+    # control still gets a 503.
+    stream = meta_stream_query(query)
+    first = await run_in_threadpool(next, stream)
+
+    async def rest():
+        yield first
+        async for item in iterate_in_threadpool(stream):
+            yield item
+
+    async def events():
+        try:
+            async for event, data in rest():
+                if event == "done":
+                    log_query(query, data)
+                    data = {**format_response(data), "quality": data.get("quality"),
+                            "blocked": data["blocked"], "degraded": data["degraded"]}
+                yield sse_event(event, data)
+        except Exception as e:
+            logging.error(f"Stream error: {e}")
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/query/stream")
+async def handle_query_stream(request: QueryRequest):
+    return await stream_response(clean_query(request.query))
+
+@app.get("/query/stream")
+async def handle_query_stream_get(query: str):
+    # For EventSource clients, which can only issue GET requests
+    return await stream_response(clean_query(query))
+
+@app.post("/query/batch")
+def handle_query_batch(request: BatchQueryRequest):
+    queries = [query.strip() for query in request.queries]
+    if not queries or len(queries) > config.QUERY_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch must contain 1 to {config.QUERY_BATCH_MAX_SIZE} queries.")
+    for i, query in enumerate(queries):
+        if not query or len(query) > 300:
+            raise HTTPException(status_code=400, detail=f"Query {i} must be non-empty and <= 300 characters.")
+    results = meta_handle_queries(queries)
+    for query, result in zip(queries, results):
+        log_query(query, result)
+    return {"results": [format_response(result) for result in results]}
 
 @app.post("/feedback")
 def feedback_endpoint(request: FeedbackRequest):
@@ -96,7 +224,7 @@ def feedback_endpoint(request: FeedbackRequest):
         # Optionally, fetch last query's domain/intent/engine for richer feedback
         store_feedback(request.query, request.feedback, None, None, request.engine_used)
         # Retrain models only when feedback is received
-        threading.Thread(target=retrain_models_async, daemon=True).start()
+        retrain_scheduler.trigger()
         return {"status": "success"}
     except Exception as e:
         import logging
@@ -104,7 +232,6 @@ def feedback_endpoint(request: FeedbackRequest):
         logging.error(f"Feedback endpoint error: {e}")
         return JSONResponse(status_code=500, content={"status": "error", "detail": str(e)})
 
-import json
 def get_metrics(model_name):
     metrics_path = os.path.join("models", f"{model_name}_metrics.json")
     if os.path.exists(metrics_path):
@@ -140,6 +267,64 @@ def metrics_intent():
 def metrics_quality():
     return get_metrics("quality")
 
+@app.get("/metrics/retrain")
+def metrics_retrain():
+    return retrain_scheduler.stats()
+
+@app.get("/metrics/feedback/maintenance")
+def metrics_feedback_maintenance():
+    return feedback_maintenance.stats()
+
+@app.get("/metrics/cache")
+def metrics_cache():
+    return response_cache.stats()
+
+@app.get("/metrics/admission")
+def metrics_admission():
+    # Per-engine limits, queue depth and shed counts
+    return admission.stats()
+
+@app.get("/metrics/generation")
+def metrics_generation():
+    return generation_stats()
+
+@app.get("/metrics/latency")
+def metrics_latency():
+    # Prometheus text exposition: per stage and engine histograms plus
+    # p50/p95/p99 gauges estimated from them
+    return PlainTextResponse(tracer.prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/latency/summary")
+def metrics_latency_summary():
+    return tracer.summary()
+
+@app.get("/metrics/latency/slow")
+def metrics_latency_slow():
+    return {"threshold_ms": config.LATENCY_SLOW_MS, "requests": list(tracer.slow)}
+
+@app.post("/models/reload")
+def reload_models():
+    # Pick up artifacts written by the ml/ scripts or an edited knowledge base
+    model_registry.reload_async(source="manual")
+    return {"status": "reloading", "models": model_registry.status()}
+
+@app.post("/rules/reload")
+def reload_rules():
+    # Edits are also picked up on their own within ROUTING_RULES_CHECK_S
+    status = routing_rules.reload()
+    if status["last_error"]:
+        raise HTTPException(status_code=400, detail=status)
+    return {"status": "reloaded", "rules": status}
+
 @app.get("/health")
 def health():
-    return {"status": "Backend running"}
+    return {"status": "Backend running", "ready": is_ready(), "models": model_registry.status(), **engine_manager.status()}
+
+@app.get("/health/live")
+def health_live():
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def health_ready():
+    body = {"ready": is_ready(), "mode": config.ENGINE_LOAD_MODE, **engine_manager.status()}
+    return JSONResponse(status_code=200 if body["ready"] else 503, content=body)
@@ -0,0 +1,63 @@
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from sentence_transformers import SentenceTransformer
+from engines.batch_encoder import BatchingEncoder
+
+# Throughput of single-query encodes against client concurrency,
+# with and without the micro-batching queue in front of the model.
+#
+#   python benchmarks/bench_batch_encoder.py --requests 512 --concurrency 1 4 16 32
+
+
+def load_queries(limit):
+    path = os.path.join(BASE_DIR, "datasets", "intent_dataset.csv")
+    with open(path, newline="", encoding="utf-8") as f:
+        queries = [row["query"] for row in csv.DictReader(f) if row.get("query")]
+    return (queries * (limit // max(len(queries), 1) + 1))[:limit]
+
+
+def run(encode_one, queries, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(encode_one, queries))
+    elapsed = time.perf_counter() - start
+    return len(queries) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    model = SentenceTransformer(args.model)
+    queries = load_queries(args.requests)
+    model.encode(queries[:8], convert_to_numpy=True)  # warm-up
+
+    def unbatched(text):
+        return model.encode([text], convert_to_numpy=True)[0]
+
+    print(f"{'concurrency':>11} {'unbatched q/s':>14} {'batched q/s':>12} {'speedup':>8} {'avg batch':>10}")
+    for concurrency in args.concurrency:
+        plain_qps = run(unbatched, queries, concurrency)
+        encoder = BatchingEncoder(model, args.max_batch_size, args.max_wait_ms)
+        batched_qps = run(lambda text: encoder.submit(text).result(), queries, concurrency)
+        stats = encoder.stats()
+        encoder.close()
+        print(f"{concurrency:>11} {plain_qps:>14.1f} {batched_qps:>12.1f} "
+              f"{batched_qps / plain_qps:>7.2f}x {stats['avg_batch_size']:>10}")
+
+
+if __name__ == "__main__":
+    main()
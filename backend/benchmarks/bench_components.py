@@ -0,0 +1,125 @@
+import argparse
+import csv
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+# Micro-benchmarks of the single-query calls on the routing hot path, each
+# timed in isolation on already-loaded engines.
+#
+#   python benchmarks/bench_components.py --iterations 500
+#   python benchmarks/bench_components.py --only retrieval intent
+
+
+def load_queries():
+    path = os.path.join(BASE_DIR, "datasets", "intent_dataset.csv")
+    with open(path, newline="", encoding="utf-8") as f:
+        return [row["query"] for row in csv.DictReader(f) if row.get("query")]
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def timed_calls(fn, queries, iterations, warmup=5):
+    for query in queries[:warmup]:
+        fn(query)
+    latencies = []
+    for i in range(iterations):
+        query = queries[i % len(queries)]
+        start = time.perf_counter()
+        fn(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def bench_faiss(queries, iterations):
+    from engines.faiss_engine import FaissSemanticEngine
+    engine = FaissSemanticEngine()
+    return timed_calls(engine.search, queries, iterations)
+
+
+def bench_retrieval(queries, iterations):
+    from engines.retrieval_engine import RetrievalEngine
+    engine = RetrievalEngine()
+    return timed_calls(engine.retrieve, queries, iterations)
+
+
+def bench_intent(queries, iterations):
+    from core.intent_classifier import IntentClassifier
+    classifier = IntentClassifier()
+    return timed_calls(classifier.predict, queries, iterations)
+
+
+def bench_feedback(queries, iterations):
+    # Latency of store_feedback itself (the enqueue); the commit cost shows in
+    # the flush line printed after the table
+    with tempfile.TemporaryDirectory() as tmp:
+        import config
+        # Read when feedback_store creates its writer, so set before importing it
+        config.FEEDBACK_DB_PATH = os.path.join(tmp, "feedback.db")
+        from feedback.feedback_store import feedback_writer, store_feedback
+        feedback_writer.start()
+        latencies = timed_calls(lambda q: store_feedback(q, 1, "STUDENT", "FACTUAL", "HYBRID"), queries, iterations)
+        start = time.perf_counter()
+        feedback_writer.flush()
+        flush_ms = (time.perf_counter() - start) * 1000
+        stats = feedback_writer.stats()
+        feedback_writer.close()
+    bench_feedback.note = (f"feedback: flush after {iterations} submits took {flush_ms:.1f} ms, "
+                           f"{stats['written']} rows in {stats['batches']} batches")
+    return latencies
+
+
+BENCHMARKS = {
+    "faiss": ("FaissSemanticEngine.search", bench_faiss),
+    "retrieval": ("RetrievalEngine.retrieve", bench_retrieval),
+    "intent": ("IntentClassifier.predict", bench_intent),
+    "feedback": ("store_feedback", bench_feedback),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of single-query hot-path calls")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    # Relative model and DB paths resolve against the backend directory
+    os.chdir(BASE_DIR)
+    queries = load_queries()
+    results = {}
+    print(f"{'benchmark':>28} {'calls/s':>9} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name in args.only:
+        label, bench = BENCHMARKS[name]
+        latencies = bench(queries, args.iterations)
+        mean = statistics.mean(latencies)
+        results[name] = {
+            "call": label,
+            "iterations": len(latencies),
+            "calls_per_s": round(1000 / mean, 1),
+            "mean_ms": round(mean, 4),
+            **{f"p{p}_ms": round(percentile(latencies, p), 4) for p in (50, 95, 99)},
+        }
+        r = results[name]
+        print(f"{label:>28} {r['calls_per_s']:>9.1f} {r['mean_ms']:>9.3f} {r['p50_ms']:>8.3f} "
+              f"{r['p95_ms']:>8.3f} {r['p99_ms']:>8.3f}")
+    if hasattr(bench_feedback, "note"):
+        print(bench_feedback.note)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import argparse
+import csv
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+# End-to-end replay of query sets through the whole routing pipeline, either
+# in-process against meta_controller.handle_query or over HTTP against /query
+# on a local uvicorn. Reports throughput, per-engine latency percentiles and
+# peak RSS, and compares them with a stored baseline report.
+#
+#   python benchmarks/bench_pipeline.py --mode inprocess --repeat 5 --concurrency 4
+#   python benchmarks/bench_pipeline.py --mode http --save-baseline benchmarks/baseline_http.json
+#   python benchmarks/bench_pipeline.py --mode http --baseline benchmarks/baseline_http.json
+
+DATASETS = {
+    "intent": os.path.join(BASE_DIR, "datasets", "intent_dataset.csv"),
+    "feedback": os.path.join(BASE_DIR, "datasets", "feedback_export.csv"),
+}
+PERCENTILES = (50, 95, 99)
+# /query rejects anything else with a 400
+MAX_QUERY_CHARS = 300
+
+
+def load_queries(names, repeat):
+    queries = []
+    for name in names:
+        with open(DATASETS.get(name, name), newline="", encoding="utf-8") as f:
+            queries += [q for q in (row.get("query", "").strip() for row in csv.DictReader(f))
+                        if q and len(q) <= MAX_QUERY_CHARS]
+    return queries * repeat
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def latency_stats(latencies):
+    return {
+        "count": len(latencies),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        **{f"p{p}_ms": round(percentile(latencies, p), 3) for p in PERCENTILES},
+    }
+
+
+def peak_rss_mb(pid=None):
+    # VmHWM is the resident high-water mark; getrusage covers this process
+    # where /proc is not available
+    try:
+        with open(f"/proc/{pid or 'self'}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if pid is None:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Bytes on macOS, kilobytes on Linux
+        return round(maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    return None
+
+
+def replay(run_one, queries, concurrency):
+    # run_one returns the engine that answered; errors are counted per engine
+    # label "ERROR" and keep their latency
+    def timed(query):
+        start = time.perf_counter()
+        try:
+            engine = run_one(query)
+        except Exception:
+            engine = "ERROR"
+        return engine, (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, queries))
+    elapsed = time.perf_counter() - start
+
+    by_engine = {}
+    for engine, ms in results:
+        by_engine.setdefault(engine or "none", []).append(ms)
+    return {
+        "requests": len(results),
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_qps": round(len(results) / elapsed, 2),
+        "overall": latency_stats([ms for _, ms in results]),
+        "engines": {engine: latency_stats(ms) for engine, ms in sorted(by_engine.items())},
+    }
+
+
+def run_inprocess(queries, args):
+    import config
+    config.CACHE_ENABLED = not args.no_cache
+    from core.meta_controller import engine_manager, handle_query
+
+    load_started = time.perf_counter()
+    engine_manager.load_all()
+    load_s = time.perf_counter() - load_started
+    for query in queries[:args.warmup]:
+        handle_query(query)
+
+    report = replay(lambda q: handle_query(q)["engine"], queries, args.concurrency)
+    report["load_s"] = round(load_s, 3)
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def http_get(url, timeout):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.status
+
+
+def wait_ready(base_url, server, timeout_s):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+        try:
+            if http_get(f"{base_url}/health/ready", timeout=2) == 200:
+                return time.monotonic() - (deadline - timeout_s)
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"server not ready after {timeout_s}s")
+
+
+def run_http(queries, args):
+    port = args.port or free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        # /query logs every request to feedback; keep it out of the real DB
+        env = dict(os.environ, FEEDBACK_DB_PATH=os.path.join(tmp, "feedback.db"))
+        if args.no_cache:
+            env["CACHE_ENABLED"] = "0"
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=BASE_DIR, env=env,
+        )
+        try:
+            load_s = wait_ready(base_url, server, args.startup_timeout)
+
+            def post(query):
+                request = urllib.request.Request(
+                    f"{base_url}/query", data=json.dumps({"query": query}).encode(),
+                    headers={"Content-Type": "application/json"},
+                )
+                with urllib.request.urlopen(request, timeout=args.request_timeout) as response:
+                    return json.load(response)["engine_used"]
+
+            for query in queries[:args.warmup]:
+                post(query)
+            report = replay(post, queries, args.concurrency)
+            report["load_s"] = round(load_s, 3)
+            # Single-worker servers only; with --workers the parent is idle
+            report["peak_rss_mb"] = peak_rss_mb(server.pid)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    return report
+
+
+def compare(report, baseline, tolerance):
+    # Flags throughput drops, latency and memory growth beyond tolerance
+    regressions = []
+
+    def check(name, current, previous, higher_is_better=False):
+        if current is None or previous is None or not previous:
+            return
+        change = (current - previous) / previous
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f"{name}: {previous} -> {current} ({change:+.1%})")
+
+    check("throughput_qps", report["throughput_qps"], baseline.get("throughput_qps"), higher_is_better=True)
+    check("peak_rss_mb", report["peak_rss_mb"], baseline.get("peak_rss_mb"))
+    sections = [("overall", report["overall"], baseline.get("overall", {}))]
+    sections += [(engine, stats, baseline.get("engines", {}).get(engine, {}))
+                 for engine, stats in report["engines"].items()]
+    for name, stats, previous in sections:
+        for p in PERCENTILES:
+            check(f"{name} p{p}_ms", stats[f"p{p}_ms"], previous.get(f"p{p}_ms"))
+    return regressions
+
+
+def print_report(report):
+    print(f"{report['mode']}: {report['requests']} requests, concurrency {report['concurrency']}, "
+          f"{report['throughput_qps']} q/s, peak RSS {report['peak_rss_mb']} MB, startup {report['load_s']}s")
+    print(f"{'engine':>12} {'count':>6} {'mean ms':>9} " + " ".join(f"{f'p{p} ms':>9}" for p in PERCENTILES))
+    for name, stats in [("overall", report["overall"]), *report["engines"].items()]:
+        print(f"{name:>12} {stats['count']:>6} {stats['mean_ms']:>9.2f} "
+              + " ".join(f"{stats[f'p{p}_ms']:>9.2f}" for p in PERCENTILES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay query sets through the full query pipeline")
+    parser.add_argument("--mode", choices=("inprocess", "http"), default="inprocess")
+    parser.add_argument("--datasets", nargs="+", default=["intent", "feedback"],
+                        help="intent, feedback or paths to CSVs with a query column")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--no-cache", action="store_true", help="disable the response cache so every repeat is routed")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--request-timeout", type=float, default=60.0)
+    parser.add_argument("--baseline", help="report JSON to compare against; exits 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--save-baseline", help="write this run's report as the new baseline")
+    parser.add_argument("--output", help="write this run's report as JSON")
+    args = parser.parse_args()
+
+    # Relative model and DB paths resolve against the backend directory
+    os.chdir(BASE_DIR)
+    queries = load_queries(args.datasets, args.repeat)
+    report = run_http(queries, args) if args.mode == "http" else run_inprocess(queries, args)
+    report = {"mode": args.mode, "datasets": args.datasets, "cache": not args.no_cache, **report}
+    print_report(report)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            print(f"Report written to {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for key in ("mode", "datasets", "cache"):
+            if baseline.get(key) != report[key]:
+                print(f"Warning: baseline {key} is {baseline.get(key)}, this run's is {report[key]}")
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+# TF-IDF QA retrieval latency against knowledge bases of growing size, with
+# inverted-index scoring next to the full matmul it replaces. Knowledge bases
+# are synthetic: questions drawn, by Zipf's law, from the real questions'
+# vocabulary plus made-up terms, queried with perturbed copies of stored
+# questions.
+#
+#   python benchmarks/bench_retrieval.py
+#   python benchmarks/bench_retrieval.py --sizes 1000 100000 --queries 500 --top-k 10
+
+
+def synthetic_kb(size, seed=0, vocabulary_size=50_000, min_words=5, max_words=12):
+    from engines.kb_store import load_qa_entries
+
+    rng = np.random.default_rng(seed)
+    real = sorted({w for entry in load_qa_entries() for w in entry["question"].lower().split()})
+    vocabulary = real + [f"term{i}" for i in range(vocabulary_size - len(real))]
+    lengths = rng.integers(min_words, max_words + 1, size)
+    # Zipf's law over the vocabulary: a few common terms with long postings,
+    # a long tail of rare ones
+    frequency = 1.0 / np.arange(1, len(vocabulary) + 1)
+    words = rng.choice(len(vocabulary), lengths.sum(), p=frequency / frequency.sum())
+    bounds = np.concatenate([[0], np.cumsum(lengths)])
+    answer = "Synthetic answer used for retrieval benchmarks."
+    return [
+        {"question": " ".join(vocabulary[w] for w in words[bounds[i]:bounds[i + 1]]),
+         "answer": answer, "category": "Synthetic"}
+        for i in range(size)
+    ]
+
+
+def synthetic_queries(entries, count, seed=1):
+    # Stored questions with one word dropped, so most queries have a close
+    # but inexact match
+    rng = np.random.default_rng(seed)
+    queries = []
+    for i in rng.integers(0, len(entries), count):
+        words = entries[i]["question"].split()
+        del words[rng.integers(0, len(words))]
+        queries.append(" ".join(words))
+    return queries
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def timed_calls(fn, queries, warmup=5):
+    for query in queries[:warmup]:
+        fn(query)
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, results
+
+
+def bench_size(size, args):
+    from engines.retrieval_engine import RetrievalEngine
+
+    entries = synthetic_kb(size, seed=args.seed)
+    queries = synthetic_queries(entries, args.queries, seed=args.seed + 1)
+    start = time.perf_counter()
+    inverted = RetrievalEngine(scoring="inverted", entries=entries)
+    build_s = time.perf_counter() - start
+    # Same fitted matrix, scored the old way
+    store = SimpleNamespace(qa=entries, tfidf={"qa": (inverted.vectorizer, inverted.tfidf_matrix)})
+    engines = {"inverted": inverted}
+    if size <= args.matmul_max_size:
+        engines["matmul"] = RetrievalEngine(scoring="matmul", store=store)
+
+    report = {"size": size, "nnz": int(inverted.tfidf_matrix.nnz), "build_s": round(build_s, 3), "scoring": {}}
+    ranked = {}
+    for name, engine in engines.items():
+        latencies, ranked[name] = timed_calls(lambda q: engine.retrieve_topk(q, args.top_k), queries)
+        mean = statistics.mean(latencies)
+        report["scoring"][name] = {
+            "calls_per_s": round(1000 / mean, 1),
+            "mean_ms": round(mean, 4),
+            **{f"p{p}_ms": round(percentile(latencies, p), 4) for p in (50, 95, 99)},
+        }
+    if "matmul" in ranked:
+        report["same_top_k"] = all(
+            [c["question"] for c in a] == [c["question"] for c in b]
+            for a, b in zip(ranked["inverted"], ranked["matmul"])
+        )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TF-IDF retrieval latency against knowledge-base size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--matmul-max-size", type=int, default=1_000_000,
+                        help="skip the full-matmul comparison above this size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    os.chdir(BASE_DIR)
+    results = []
+    print(f"{'entries':>9} {'nnz':>10} {'build s':>8} {'scoring':>9} {'calls/s':>9} {'mean ms':>9} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for size in args.sizes:
+        report = bench_size(size, args)
+        results.append(report)
+        for name, r in report["scoring"].items():
+            print(f"{size:>9} {report['nnz']:>10} {report['build_s']:>8.2f} {name:>9} {r['calls_per_s']:>9.1f} "
+                  f"{r['mean_ms']:>9.3f} {r['p50_ms']:>8.3f} {r['p95_ms']:>8.3f} {r['p99_ms']:>8.3f}")
+        if "same_top_k" in report:
+            print(f"{'':>9} top-{args.top_k} identical across scoring: {report['same_top_k']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import csv
+import os
+import statistics
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+import config
+from engines.transformer_engine import build_pipeline
+
+# Latency of flan-t5 generation in fp32 vs dynamic int8, and how often the
+# quantized model produces the same answer.
+#
+#   python benchmarks/bench_transformer.py --threads 1 2 4 --repeats 3
+
+
+def load_prompts(limit):
+    path = os.path.join(BASE_DIR, "datasets", "intent_dataset.csv")
+    with open(path, newline="", encoding="utf-8") as f:
+        prompts = [row["query"] for row in csv.DictReader(f) if row.get("intent") == "EXPLANATION"]
+    return prompts[:limit]
+
+
+def timed_generate(pipe, prompts, repeats, max_length):
+    latencies = []
+    outputs = []
+    for prompt in prompts:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = pipe(prompt, max_length=max_length)
+            latencies.append((time.perf_counter() - start) * 1000)
+        outputs.append(result[0]["generated_text"])
+    return latencies, outputs
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def jaccard(a, b):
+    ta, tb = set(a.lower().split()), set(b.lower().split())
+    return len(ta & tb) / len(ta | tb) if ta | tb else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=config.TRANSFORMER_MODEL)
+    parser.add_argument("--prompts", type=int, default=12)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, nargs="+", default=[0])
+    parser.add_argument("--max-length", type=int, default=config.TRANSFORMER_MAX_LENGTH)
+    args = parser.parse_args()
+
+    prompts = load_prompts(args.prompts)
+    print(f"{len(prompts)} prompts x {args.repeats} repeats, max_length={args.max_length}")
+    print(f"{'variant':>8} {'threads':>7} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'exact':>6} {'jaccard':>8}")
+    for threads in args.threads:
+        baseline = None
+        for quantize in (None, "int8"):
+            pipe = build_pipeline(args.model, quantize=quantize, threads=threads)
+            pipe(prompts[0], max_length=args.max_length)  # warm-up
+            latencies, outputs = timed_generate(pipe, prompts, args.repeats, args.max_length)
+            if baseline is None:
+                baseline = outputs
+            exact = sum(a == b for a, b in zip(baseline, outputs)) / len(outputs)
+            overlap = statistics.mean(jaccard(a, b) for a, b in zip(baseline, outputs))
+            print(f"{quantize or 'fp32':>8} {threads or 'default':>7} {statistics.mean(latencies):>8.1f} "
+                  f"{percentile(latencies, 50):>8.1f} {percentile(latencies, 95):>8.1f} {exact:>6.2f} {overlap:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
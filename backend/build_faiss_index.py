@@ -1,28 +1,255 @@
+import argparse
+import datetime
+import hashlib
 import json
+import logging
+import math
+import os
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent builds are not serialized
+    fcntl = None
+
 import faiss
-from sentence_transformers import SentenceTransformer
 import numpy as np
 
-# Load vector-db ready records
-data_path = 'datasets/knowledge_base_vector.jsonl'
-with open(data_path, 'r', encoding='utf-8') as f:
-    records = [json.loads(line) for line in f]
+import config
+from engines.encoder import BACKENDS, load_encoder
+from engines.kb_store import load_corpus
+
+BASE = Path(__file__).parent / 'datasets'
+DATA_PATH = BASE / 'knowledge_base_vector.jsonl'
+INDEX_PATH = BASE / 'knowledge_base_faiss.index'
+MAPPING_PATH = BASE / 'knowledge_base_faiss_mapping.json'
+MANIFEST_PATH = BASE / 'knowledge_base_faiss_manifest.json'
+CACHE_PATH = BASE / 'knowledge_base_embeddings.npz'
+LOCK_PATH = BASE / 'knowledge_base_faiss.lock'
+
+# Corpus sizes at which "auto" switches index type
+HNSW_MIN_RECORDS = 20_000
+IVF_MIN_RECORDS = 200_000
+# Index types whose IndexIDMap supports remove_ids, so updates can be in place
+REMOVABLE_TYPES = ('flat', 'ivf')
+
+
+def record_label(record_id):
+    # Stable positive int64 label per record id, used with IndexIDMap
+    return int(hashlib.sha1(record_id.encode('utf-8')).hexdigest()[:15], 16)
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def choose_index_type(count):
+    if count >= IVF_MIN_RECORDS:
+        return 'ivf'
+    if count >= HNSW_MIN_RECORDS:
+        return 'hnsw'
+    return 'flat'
+
+
+def load_embedding_cache(model_name, cache_path=CACHE_PATH):
+    if not os.path.exists(cache_path):
+        return {}
+    cache = np.load(cache_path, allow_pickle=False)
+    if str(cache['model']) != model_name:
+        return {}
+    return {
+        (rid, h): emb
+        for rid, h, emb in zip(cache['ids'].tolist(), cache['hashes'].tolist(), cache['embeddings'])
+    }
+
+
+def save_embedding_cache(model_name, keys, embeddings, cache_path=CACHE_PATH):
+    tmp = f'{cache_path}.tmp.npz'
+    np.savez(
+        tmp,
+        model=np.array(model_name),
+        ids=np.array([rid for rid, _ in keys]),
+        hashes=np.array([h for _, h in keys]),
+        embeddings=embeddings.astype(np.float32),
+    )
+    os.replace(tmp, cache_path)
+
+
+def embed_records(records, model_name, encode, cache_path=CACHE_PATH):
+    # Only records whose (id, content hash) is not cached are re-encoded
+    cached = load_embedding_cache(model_name, cache_path)
+    keys = [(rec['id'], content_hash(rec['text'])) for rec in records]
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    if missing:
+        fresh = encode([records[i]['text'] for i in missing])
+        for i, emb in zip(missing, fresh):
+            cached[keys[i]] = emb
+    embeddings = np.vstack([cached[key] for key in keys]).astype(np.float32) if keys else np.zeros((0, 0), np.float32)
+    save_embedding_cache(model_name, keys, embeddings, cache_path)
+    print(f"Embeddings: {len(records) - len(missing)} cached, {len(missing)} encoded")
+    return keys, embeddings
+
+
+def prepare(embeddings, metric):
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if metric == 'cosine':
+        faiss.normalize_L2(embeddings)
+    return embeddings
+
+
+def new_index(index_type, dim, metric, count):
+    faiss_metric = faiss.METRIC_INNER_PRODUCT if metric == 'cosine' else faiss.METRIC_L2
+    if index_type == 'hnsw':
+        base = faiss.IndexHNSWFlat(dim, 32, faiss_metric)
+    elif index_type == 'ivf':
+        nlist = max(1, min(int(4 * math.sqrt(count)), count // 39 or 1))
+        quantizer = faiss.IndexFlatIP(dim) if metric == 'cosine' else faiss.IndexFlatL2(dim)
+        base = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss_metric)
+    elif metric == 'cosine':
+        base = faiss.IndexFlatIP(dim)
+    else:
+        base = faiss.IndexFlatL2(dim)
+    return faiss.IndexIDMap(base)
+
+
+def read_manifest(manifest_path=MANIFEST_PATH):
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def build(records, model_name, encode, metric='cosine', index_type='auto', rebuild=False,
+          index_path=INDEX_PATH, mapping_path=MAPPING_PATH, manifest_path=MANIFEST_PATH,
+          cache_path=CACHE_PATH, encoder='torch'):
+    # Cached embeddings are only reused from the same model on the same runtime
+    cache_key = model_name if encoder == 'torch' else f'{model_name}@{encoder}'
+    keys, embeddings = embed_records(records, cache_key, encode, cache_path)
+    vectors = prepare(embeddings, metric)
+    dim = vectors.shape[1]
+    index_type = choose_index_type(len(records)) if index_type == 'auto' else index_type
+    entries = {record_label(rid): {'id': rid, 'hash': h} for rid, h in keys}
+    if len(entries) != len(keys):
+        raise ValueError("Duplicate record ids in knowledge base")
+    labels = np.array([record_label(rid) for rid, _ in keys], dtype=np.int64)
+
+    manifest = read_manifest(manifest_path)
+    incremental = (
+        not rebuild
+        and manifest is not None
+        and os.path.exists(index_path)
+        and os.path.exists(mapping_path)
+        and manifest.get('model') == model_name
+        and manifest.get('encoder', 'torch') == encoder
+        and manifest.get('metric') == metric
+        and manifest.get('dim') == dim
+        and manifest.get('index_type') == index_type
+        and index_type in REMOVABLE_TYPES
+    )
+    if incremental:
+        index = faiss.read_index(str(index_path))
+        with open(mapping_path, 'r', encoding='utf-8') as f:
+            old = {int(label): entry for label, entry in json.load(f).items()}
+        stale = [l for l, e in old.items() if l not in entries or entries[l]['hash'] != e['hash']]
+        fresh = [i for i, l in enumerate(labels) if l not in old or old[l]['hash'] != entries[l]['hash']]
+        if stale:
+            index.remove_ids(np.array(stale, dtype=np.int64))
+        if fresh:
+            index.add_with_ids(vectors[fresh], labels[fresh])
+        print(f"Incremental update: removed {len(stale)}, added {len(fresh)}")
+    else:
+        index = new_index(index_type, dim, metric, len(records))
+        if not index.is_trained:
+            index.train(vectors)
+        index.add_with_ids(vectors, labels)
+        print(f"Full build: {len(records)} records")
+
+    tmp_index = f'{index_path}.tmp'
+    faiss.write_index(index, tmp_index)
+    os.replace(tmp_index, index_path)
+    _write_json(mapping_path, {str(label): entry for label, entry in entries.items()})
+    _write_json(manifest_path, {
+        'model': model_name,
+        'encoder': encoder,
+        'dim': dim,
+        'metric': metric,
+        'index_type': index_type,
+        'count': int(index.ntotal),
+        'id_map': True,
+        'built_at': datetime.datetime.utcnow().isoformat(),
+    })
+    return index
+
+
+def encoder_name(backend, onnx_variant=config.EMBEDDING_ONNX_VARIANT):
+    return backend if backend == 'torch' else f'onnx-{onnx_variant}'
+
+
+def is_current(records, model_name, encoder='torch', index_path=INDEX_PATH, mapping_path=MAPPING_PATH,
+               manifest_path=MANIFEST_PATH):
+    # Built by this model and runtime from exactly these records; legacy
+    # indexes without a manifest never are
+    manifest = read_manifest(manifest_path)
+    if manifest is None or not os.path.exists(index_path) or not os.path.exists(mapping_path):
+        return False
+    if manifest.get('model') != model_name or manifest.get('encoder', 'torch') != encoder:
+        return False
+    with open(mapping_path, 'r', encoding='utf-8') as f:
+        indexed = {entry['id']: entry['hash'] for entry in json.load(f).values()}
+    return indexed == {rec['id']: content_hash(rec['text']) for rec in records}
+
+
+def ensure_index(model=None, model_name=config.EMBEDDING_MODEL, backend=config.EMBEDDING_BACKEND):
+    # Run by the server before it loads the FAISS engine: builds the index,
+    # or updates it in place, when it is not current. Workers starting
+    # together take a lock, so one builds and the rest find it current.
+    # model: an already loaded encoder to build with.
+    records = load_corpus(DATA_PATH)
+    encoder = encoder_name(backend)
+    if is_current(records, model_name, encoder):
+        return False
+    with open(LOCK_PATH, 'w') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        if is_current(records, model_name, encoder):
+            return False
+        model = model or load_encoder(model_name, backend, config.EMBEDDING_ONNX_DIR,
+                                      config.EMBEDDING_ONNX_VARIANT, config.EMBEDDING_ONNX_THREADS)
+        index = build(records, model_name, lambda texts: model.encode(texts, convert_to_numpy=True),
+                      encoder=encoder)
+    logging.info(f"FAISS index brought up to date with {index.ntotal} records")
+    return True
+
+
+def _write_json(path, data):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update the knowledge-base FAISS index")
+    parser.add_argument('--metric', choices=['cosine', 'l2'], default='cosine')
+    parser.add_argument('--index-type', choices=['auto', 'flat', 'hnsw', 'ivf'], default='auto')
+    parser.add_argument('--rebuild', action='store_true', help="ignore the existing index and build from scratch")
+    parser.add_argument('--model', default=config.EMBEDDING_MODEL)
+    parser.add_argument('--backend', choices=BACKENDS, default=config.EMBEDDING_BACKEND,
+                        help="encoder runtime; use the one the server runs so index and queries match")
+    args = parser.parse_args()
 
-# Use a strong embedding model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+    model = load_encoder(args.model, args.backend, config.EMBEDDING_ONNX_DIR,
+                         config.EMBEDDING_ONNX_VARIANT, config.EMBEDDING_ONNX_THREADS)
 
-# Compute embeddings
-texts = [rec['text'] for rec in records]
-embeddings = model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
+    def encode(texts):
+        return model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
 
-# Build FAISS index
-embedding_dim = embeddings.shape[1]
-index = faiss.IndexFlatL2(embedding_dim)
-index.add(embeddings)
+    records = load_corpus(DATA_PATH)
+    encoder = encoder_name(args.backend)
+    index = build(records, args.model, encode, metric=args.metric, index_type=args.index_type,
+                  rebuild=args.rebuild, encoder=encoder)
+    print(f"FAISS index built with {index.ntotal} records.")
 
-# Save index and mapping
-faiss.write_index(index, 'datasets/knowledge_base_faiss.index')
-with open('datasets/knowledge_base_faiss_mapping.json', 'w', encoding='utf-8') as f:
-    json.dump([rec['id'] for rec in records], f, ensure_ascii=False, indent=2)
 
-print(f"FAISS index built with {len(records)} records.")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import json
+from pathlib import Path
+
+from build_faiss_index import DATA_PATH, INDEX_PATH, MAPPING_PATH
+from engines.kb_store import FACTS_PATH, KnowledgeBaseStore, load_corpus, load_qa_entries, write_store
+from engines.retrieval_engine import fit_tfidf
+
+# Packs the knowledge base into the memory-mapped store read by the FAISS and
+# retrieval engines. Re-run after build_faiss_index.py or any change to
+# knowledge_base.json; engines fall back to the JSON files while it is stale.
+#
+#   python build_kb_store.py
+
+STORE_DIR = Path(__file__).parent / 'datasets' / 'kb_store'
+
+
+def record_labels(records, mapping_path=MAPPING_PATH):
+    with open(mapping_path, 'r', encoding='utf-8') as f:
+        mapping = json.load(f)
+    if isinstance(mapping, list):
+        id_to_label = {rid: label for label, rid in enumerate(mapping)}
+    else:
+        id_to_label = {entry['id']: int(label) for label, entry in mapping.items()}
+    # Records missing from the index get -1, which FAISS never returns
+    return [id_to_label.get(rec['id'], -1) for rec in records]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the memory-mapped knowledge base store")
+    parser.add_argument('--out', default=str(STORE_DIR))
+    args = parser.parse_args()
+
+    records = load_corpus(DATA_PATH, FACTS_PATH)
+    labels = record_labels(records)
+    qa_entries = load_qa_entries(FACTS_PATH)
+    tfidf = {
+        # Questions only, for RetrievalEngine
+        'qa': fit_tfidf([entry['question'] for entry in qa_entries]),
+        # The whole corpus, sparse side of the hybrid retriever
+        'records': fit_tfidf([rec['text'] for rec in records]),
+    }
+    write_store(args.out, records, labels, qa_entries, tfidf,
+                sources=[DATA_PATH, MAPPING_PATH, INDEX_PATH, FACTS_PATH])
+
+    store = KnowledgeBaseStore(args.out)
+    print(f"Knowledge base store at {args.out}: {len(store.records)} records "
+          f"({sum(label >= 0 for label in labels)} indexed by FAISS), {len(store.qa)} QA entries, "
+          f"TF-IDF terms {store.manifest['tfidf']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+import os
+
+# Runtime settings, overridable through environment variables
+
+
+def env_bool(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+# Micro-batching in front of the MiniLM query encoder
+FAISS_BATCHING = env_bool("FAISS_BATCHING", True)
+FAISS_BATCH_MAX_SIZE = env_int("FAISS_BATCH_MAX_SIZE", 32)
+FAISS_BATCH_MAX_WAIT_MS = env_float("FAISS_BATCH_MAX_WAIT_MS", 5.0)
+
+# Upper bound on the number of queries accepted by /query/batch
+QUERY_BATCH_MAX_SIZE = env_int("QUERY_BATCH_MAX_SIZE", 1000)
+
+# Background feedback writer
+FEEDBACK_DB_PATH = os.getenv("FEEDBACK_DB_PATH", "feedback/feedback.db")
+FEEDBACK_BATCH_SIZE = env_int("FEEDBACK_BATCH_SIZE", 64)
+FEEDBACK_FLUSH_INTERVAL_MS = env_float("FEEDBACK_FLUSH_INTERVAL_MS", 200.0)
+FEEDBACK_QUEUE_MAX = env_int("FEEDBACK_QUEUE_MAX", 10000)
+# /metrics/feedback results are reused for this long per time window
+FEEDBACK_METRICS_TTL_S = env_float("FEEDBACK_METRICS_TTL_S", 5.0)
+# Raw feedback rows older than this are rolled into daily aggregates
+FEEDBACK_RETENTION_DAYS = env_int("FEEDBACK_RETENTION_DAYS", 30)
+# How often the server exports and compacts the feedback log (0 disables)
+FEEDBACK_MAINTENANCE_INTERVAL_S = env_float("FEEDBACK_MAINTENANCE_INTERVAL_S", 3600.0)
+# Parquet export read by training; empty disables the export
+FEEDBACK_EXPORT_DIR = os.getenv("FEEDBACK_EXPORT_DIR", "feedback/exports")
+
+# Debounced incremental retraining on /feedback
+ONLINE_MODELS_DIR = os.getenv("ONLINE_MODELS_DIR", "models/online")
+RETRAIN_DEBOUNCE_S = env_float("RETRAIN_DEBOUNCE_S", 5.0)
+RETRAIN_MAX_DELAY_S = env_float("RETRAIN_MAX_DELAY_S", 60.0)
+
+# Engine startup: "eager" loads every engine in parallel during app startup,
+# "lazy" loads each one on first use
+ENGINE_LOAD_MODE = os.getenv("ENGINE_LOAD_MODE", "eager")
+ENGINE_LOAD_WORKERS = env_int("ENGINE_LOAD_WORKERS", 3)
+# One query per line, run through the full pipeline before reporting ready
+WARMUP_QUERIES_PATH = os.getenv("WARMUP_QUERIES_PATH", "datasets/warmup_queries.txt")
+
+# Response cache in front of handle_query
+CACHE_ENABLED = env_bool("CACHE_ENABLED", True)
+CACHE_MAX_ENTRIES = env_int("CACHE_MAX_ENTRIES", 2048)
+CACHE_TTL_S = env_float("CACHE_TTL_S", 900.0)
+CACHE_SEMANTIC_THRESHOLD = env_float("CACHE_SEMANTIC_THRESHOLD", 0.95)
+
+# flan-t5 generation
+TRANSFORMER_MODEL = os.getenv("TRANSFORMER_MODEL", "google/flan-t5-small")
+TRANSFORMER_MAX_LENGTH = env_int("TRANSFORMER_MAX_LENGTH", 120)
+# "int8" swaps in a dynamically quantized copy of the model
+TRANSFORMER_QUANTIZE = os.getenv("TRANSFORMER_QUANTIZE") or None
+# 0 keeps torch's default intra-op thread count
+TORCH_INTRA_OP_THREADS = env_int("TORCH_INTRA_OP_THREADS", 0)
+TRANSFORMER_CACHE_SIZE = env_int("TRANSFORMER_CACHE_SIZE", 1024)
+TRANSFORMER_WORKERS = env_int("TRANSFORMER_WORKERS", 4)
+# Per-request generation budget; past it the answer falls back to retrieval (0 disables)
+TRANSFORMER_DEADLINE_MS = env_float("TRANSFORMER_DEADLINE_MS", 3000.0)
+# /query/stream gives up on a generation that produces no token for this long (0 disables)
+TRANSFORMER_STREAM_STALL_MS = env_float("TRANSFORMER_STREAM_STALL_MS", 3000.0)
+
+# Overall budget for one /query request (0 disables)
+QUERY_DEADLINE_MS = env_float("QUERY_DEADLINE_MS", 8000.0)
+
+# Admission control: concurrent requests allowed inside each expensive engine
+# (0 disables the limit) and how many more may wait, for at most
+# ADMISSION_QUEUE_TIMEOUT_MS. Requests beyond that are shed: "degrade" answers
+# them from TF-IDF retrieval (or a busy notice), "reject" returns 503 with
+# Retry-After.
+ADMISSION_MODE = os.getenv("ADMISSION_MODE", "degrade")
+ADMISSION_QUEUE_TIMEOUT_MS = env_float("ADMISSION_QUEUE_TIMEOUT_MS", 500.0)
+TRANSFORMER_MAX_CONCURRENCY = env_int("TRANSFORMER_MAX_CONCURRENCY", TRANSFORMER_WORKERS)
+TRANSFORMER_MAX_QUEUE = env_int("TRANSFORMER_MAX_QUEUE", 8)
+HYBRID_MAX_CONCURRENCY = env_int("HYBRID_MAX_CONCURRENCY", 8)
+HYBRID_MAX_QUEUE = env_int("HYBRID_MAX_QUEUE", 32)
+
+# Sentence embedding model shared by the FAISS index builder and the engine
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# Encoder runtime: "torch" (sentence-transformers) or "onnx" (ONNX Runtime on
+# the export written by export_onnx_encoder.py)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", "models/encoder_onnx")
+# "int8" (dynamically quantized) or "fp32"
+EMBEDDING_ONNX_VARIANT = os.getenv("EMBEDDING_ONNX_VARIANT", "int8")
+# ONNX Runtime intra-op threads (0 lets it use every core)
+EMBEDDING_ONNX_THREADS = env_int("EMBEDDING_ONNX_THREADS", 0)
+# Dense cosine similarity that hybrid retrieval calibrates to 0.5
+FAISS_MIN_SIMILARITY = env_float("FAISS_MIN_SIMILARITY", 0.35)
+# Build the FAISS index (or update it in place) when the server finds it
+# missing, built before manifests, or out of date with the knowledge base or
+# EMBEDDING_MODEL; off, the index must come from build_faiss_index.py
+FAISS_AUTO_BUILD = env_bool("FAISS_AUTO_BUILD", True)
+# Search-time knobs for IVF / HNSW indexes (0 keeps the FAISS defaults)
+FAISS_NPROBE = env_int("FAISS_NPROBE", 16)
+FAISS_EF_SEARCH = env_int("FAISS_EF_SEARCH", 64)
+
+# Hybrid FACTUAL retrieval: FAISS and TF-IDF scores over one corpus, fused
+# "weighted" (calibrated score average) or "rrf" (reciprocal-rank fusion)
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "weighted")
+HYBRID_DENSE_WEIGHT = env_float("HYBRID_DENSE_WEIGHT", 0.6)
+HYBRID_RRF_K = env_int("HYBRID_RRF_K", 60)
+# Candidates taken from each side before fusion
+HYBRID_CANDIDATES = env_int("HYBRID_CANDIDATES", 20)
+# TF-IDF cosine similarity that hybrid retrieval calibrates to 0.5
+HYBRID_SPARSE_THRESHOLD = env_float("HYBRID_SPARSE_THRESHOLD", 0.8)
+# The one retrieval threshold: below this fused score FACTUAL queries go to the transformer
+HYBRID_MIN_SCORE = env_float("HYBRID_MIN_SCORE", 0.4)
+
+# Learned engine order for FACTUAL/EXPLANATION queries, trained by ml/router.py
+# from the replayed feedback log. Without models/router.pkl the fixed cascade
+# (hybrid, then the transformer) is used.
+ROUTER_ENABLED = env_bool("ROUTER_ENABLED", True)
+# Engines predicted to succeed less often than this are never tried
+ROUTER_MIN_SUCCESS = env_float("ROUTER_MIN_SUCCESS", 0.2)
+# Expected flan-t5 latency the router weighs the cheaper engines against
+ROUTER_TRANSFORMER_COST_MS = env_float("ROUTER_TRANSFORMER_COST_MS", 1500.0)
+
+# TF-IDF QA retrieval: "inverted" scores only questions sharing a term with the
+# query, "matmul" scores every question; both return the same answers
+RETRIEVAL_SCORING = os.getenv("RETRIEVAL_SCORING", "inverted")
+# Lowest TF-IDF QA confidence the cascade serves, and the bar ml/router.py
+# replays the RETRIEVAL engine against
+RETRIEVAL_MIN_CONFIDENCE = env_float("RETRIEVAL_MIN_CONFIDENCE", 0.8)
+
+# Memory-mapped knowledge base built by build_kb_store.py; used when present and
+# newer than its JSON sources, otherwise each worker parses the JSON itself
+KB_STORE_ENABLED = env_bool("KB_STORE_ENABLED", True)
+KB_STORE_DIR = os.getenv("KB_STORE_DIR", "datasets/kb_store")
+# Map the FAISS index read-only instead of reading it into each worker's memory
+FAISS_MMAP = env_bool("FAISS_MMAP", True)
+
+# Guard, calculator, risk and difficulty rules; edits are picked up within
+# ROUTING_RULES_CHECK_S without a restart
+ROUTING_RULES_PATH = os.getenv(
+    "ROUTING_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "datasets", "routing_rules.json")
+)
+ROUTING_RULES_CHECK_S = env_float("ROUTING_RULES_CHECK_S", 2.0)
+
+# Root log level; per-request routing details are logged at DEBUG
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Per-stage latency histograms served at /metrics/latency
+LATENCY_TRACING = env_bool("LATENCY_TRACING", True)
+# Requests at least this slow are sampled into a ring buffer (/metrics/latency/slow)
+LATENCY_SLOW_MS = env_float("LATENCY_SLOW_MS", 1000.0)
+LATENCY_SLOW_SAMPLE_RATE = env_float("LATENCY_SLOW_SAMPLE_RATE", 1.0)
+LATENCY_SLOW_BUFFER = env_int("LATENCY_SLOW_BUFFER", 100)
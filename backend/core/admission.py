@@ -0,0 +1,134 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Per-engine concurrency limit with a bounded wait queue; requests that cannot
+# get in are shed with EngineBusy.
+
+
+class EngineBusy(Exception):
+    def __init__(self, engine, retry_after_s):
+        super().__init__(f"{engine} engine is at capacity")
+        self.engine = engine
+        self.retry_after_s = retry_after_s
+
+
+class AdmissionGate:
+    def __init__(self, name, limit, queue_size=0, timeout_s=1.0):
+        self.name = name
+        # 0 disables the limit; the gate then only counts
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout_s = timeout_s
+        self.active = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.admitted = 0
+        self.shed = {"queue_full": 0, "timeout": 0}
+        self.degraded = 0
+        self.rejected = 0
+        # Moving average of time spent inside the gate, for Retry-After
+        self.service_s = None
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            if not self.limit or self.active < self.limit:
+                return self._admit()
+            if self.waiting >= self.queue_size:
+                self.shed["queue_full"] += 1
+                return False
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+            deadline = time.monotonic() + self.timeout_s
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed["timeout"] += 1
+                        return False
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            return self._admit()
+
+    def _admit(self):
+        self.active += 1
+        self.admitted += 1
+        return True
+
+    def release(self, elapsed_s):
+        with self._cond:
+            self.active -= 1
+            self.service_s = elapsed_s if self.service_s is None else 0.9 * self.service_s + 0.1 * elapsed_s
+            self._cond.notify()
+
+    def enter(self):
+        # For generators, which cannot use admit(); pass the token to leave()
+        if not self.acquire():
+            raise EngineBusy(self.name, self.retry_after())
+        return time.perf_counter()
+
+    def leave(self, started):
+        self.release(time.perf_counter() - started)
+
+    @contextmanager
+    def admit(self):
+        started = self.enter()
+        try:
+            yield
+        finally:
+            self.leave(started)
+
+    def retry_after(self):
+        # Whole seconds until the current queue would have drained
+        with self._cond:
+            service_s = self.service_s or self.timeout_s
+            backlog = (self.waiting + 1) / max(1, self.limit)
+        return max(1, math.ceil(service_s * backlog))
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "queue_size": self.queue_size,
+                "timeout_ms": self.timeout_s * 1000,
+                "active": self.active,
+                "queue_depth": self.waiting,
+                "peak_queue_depth": self.peak_waiting,
+                "admitted": self.admitted,
+                "shed": dict(self.shed, total=sum(self.shed.values())),
+                "degraded": self.degraded,
+                "rejected": self.rejected,
+                "mean_service_ms": round(self.service_s * 1000, 3) if self.service_s is not None else None,
+            }
+
+
+class AdmissionController:
+    def __init__(self, mode="degrade"):
+        # "degrade": shed requests are answered by a cheaper engine;
+        # "reject": they fail with EngineBusy (503 + Retry-After at the API)
+        self.mode = mode
+        self.gates = {}
+
+    def add(self, name, limit, queue_size=0, timeout_s=1.0):
+        self.gates[name] = AdmissionGate(name, limit, queue_size, timeout_s)
+        return self.gates[name]
+
+    def admit(self, name):
+        return self.gates[name].admit()
+
+    def shed(self, busy):
+        # Counts a caught EngineBusy; re-raises it unless degrading is allowed
+        gate = self.gates[busy.engine]
+        with gate._cond:
+            if self.mode == "reject":
+                gate.rejected += 1
+            else:
+                gate.degraded += 1
+        if self.mode == "reject":
+            raise busy
+
+    def stats(self):
+        return {"mode": self.mode, "engines": {name: gate.stats() for name, gate in self.gates.items()}}
@@ -1,6 +1,7 @@
-def predict_difficulty(query: str):
-    if len(query.split()) < 4:
-        return "EASY"
-    if len(query.split()) < 8:
-        return "MEDIUM"
-    return "HARD"
+from core.routing_rules import routing_rules
+
+def predict_difficulty(query: str, analysis=None):
+    # Word-count thresholds live in the routing rules
+    if analysis is None:
+        analysis = routing_rules.analyze(query)
+    return analysis.difficulty
@@ -1,10 +1,17 @@
 import joblib
+import os
 
-model = joblib.load("models/domain_model.pkl")
-vectorizer = joblib.load("models/domain_vectorizer.pkl")
+class DomainClassifier:
+    def __init__(self, model_path=None, vectorizer_path=None):
+        self.model = joblib.load(model_path or os.path.join("models", "domain_model.pkl"))
+        self.vectorizer = joblib.load(vectorizer_path or os.path.join("models", "domain_vectorizer.pkl"))
 
-def predict_domain(query):
-    vec = vectorizer.transform([query])
-    pred = model.predict(vec)[0]
-    conf = max(model.predict_proba(vec)[0])
-    return pred, round(conf, 2)
+    def predict(self, query):
+        # predict_proba alone gives both the label and its confidence
+        return self.predict_batch([query])[0]
+
+    def predict_batch(self, queries):
+        # One sparse matrix and one predict_proba for the whole batch
+        proba = self.model.predict_proba(self.vectorizer.transform(queries))
+        labels = self.model.classes_[proba.argmax(axis=1)]
+        return [(label, round(conf, 2)) for label, conf in zip(labels, proba.max(axis=1))]
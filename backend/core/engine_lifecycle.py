@@ -0,0 +1,103 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class EngineSlot:
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.state = PENDING
+        self.value = None
+        self.error = None
+        self.load_seconds = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        # Concurrent callers block on the lock and reuse the first load
+        with self.lock:
+            if self.state == READY:
+                return self.value
+            self.state = LOADING
+            started = time.perf_counter()
+            try:
+                self.value = self.loader()
+            except Exception as e:
+                self.state = FAILED
+                self.error = str(e)
+                self.load_seconds = round(time.perf_counter() - started, 3)
+                logging.error(f"Engine {self.name} failed to load: {e}")
+                raise
+            self.load_seconds = round(time.perf_counter() - started, 3)
+            self.error = None
+            self.state = READY
+            logging.info(f"Engine {self.name} loaded in {self.load_seconds}s")
+            return self.value
+
+
+# Loads heavy engines in parallel on a thread pool (or lazily on first use)
+# and tracks per-engine state for the liveness/readiness endpoints.
+class EngineManager:
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.slots = {}
+        self.warmed_up = False
+        self.warmup_seconds = None
+        self.warmup_error = None
+
+    def register(self, name, loader):
+        self.slots[name] = EngineSlot(name, loader)
+
+    def replace(self, name, value):
+        # Swaps in a rebuilt engine; requests already holding the old one
+        # finish with it
+        slot = self.slots[name]
+        with slot.lock:
+            slot.value = value
+            slot.error = None
+            slot.state = READY
+
+    def get(self, name):
+        slot = self.slots[name]
+        if slot.state == READY:
+            return slot.value
+        return slot.load()
+
+    def load_all(self):
+        # Returns once every engine has either loaded or failed
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="engine-load") as pool:
+            futures = [pool.submit(slot.load) for slot in self.slots.values()]
+        return all(future.exception() is None for future in futures)
+
+    def warm_up(self, run_query, queries):
+        started = time.perf_counter()
+        try:
+            for query in queries:
+                run_query(query)
+            self.warmed_up = True
+            self.warmup_error = None
+        except Exception as e:
+            self.warmup_error = str(e)
+            logging.error(f"Warm-up failed: {e}")
+        self.warmup_seconds = round(time.perf_counter() - started, 3)
+        return self.warmed_up
+
+    def all_ready(self):
+        return all(slot.state == READY for slot in self.slots.values())
+
+    def status(self):
+        return {
+            "engines": {
+                name: {"state": slot.state, "load_seconds": slot.load_seconds, "error": slot.error}
+                for name, slot in self.slots.items()
+            },
+            "warmed_up": self.warmed_up,
+            "warmup_seconds": self.warmup_seconds,
+            "warmup_error": self.warmup_error,
+        }
@@ -0,0 +1,43 @@
+import os
+
+import joblib
+
+FUSED_PATH = os.path.join("models", "classifier_heads.pkl")
+
+
+def _labels(model, proba):
+    labels = model.classes_[proba.argmax(axis=1)]
+    return [(label, round(conf, 2)) for label, conf in zip(labels, proba.max(axis=1))]
+
+
+# One vectorizer shared by every head (built by ml/train.py): a query is
+# tokenized and TF-IDF-transformed once, then each head runs a single
+# predict_proba over the same sparse row.
+class FusedClassifier:
+    def __init__(self, path=None):
+        artifact = joblib.load(path or FUSED_PATH)
+        self.version = artifact.get("version")
+        self.vectorizer = artifact["vectorizer"]
+        self.heads = artifact["heads"]
+
+    def predict_heads(self, queries, names):
+        # One (label, confidence) tuple per query, in the order of names
+        X = self.vectorizer.transform(queries)
+        per_head = [_labels(self.heads[name], self.heads[name].predict_proba(X)) for name in names]
+        return list(zip(*per_head))
+
+    def head(self, name):
+        return FusedHead(self, name)
+
+
+# DomainClassifier-compatible view of one head of a FusedClassifier
+class FusedHead:
+    def __init__(self, fused, name):
+        self.fused = fused
+        self.name = name
+
+    def predict(self, query: str):
+        return self.predict_batch([query])[0]
+
+    def predict_batch(self, queries):
+        return [labels[0] for labels in self.fused.predict_heads(queries, (self.name,))]
@@ -1,4 +1,7 @@
-def predict_risk(query: str):
-    if query.lower().startswith(("who", "when", "where")):
-        return "HIGH_RISK"
-    return "LOW_RISK"
+from core.routing_rules import routing_rules
+
+def predict_risk(query: str, analysis=None):
+    # High-risk question prefixes live in the routing rules
+    if analysis is None:
+        analysis = routing_rules.analyze(query)
+    return analysis.risk
@@ -2,17 +2,20 @@ import joblib
 import os
 
 class IntentClassifier:
-    def __init__(self):
-        model_path = os.path.join("models", "intent_model.pkl")
-        vectorizer_path = os.path.join("models", "intent_vectorizer.pkl")
+    def __init__(self, model_path=None, vectorizer_path=None):
+        model_path = model_path or os.path.join("models", "intent_model.pkl")
+        vectorizer_path = vectorizer_path or os.path.join("models", "intent_vectorizer.pkl")
 
         self.model = joblib.load(model_path)
         self.vectorizer = joblib.load(vectorizer_path)
 
     def predict(self, query: str):
-        X = self.vectorizer.transform([query])
-        intent = self.model.predict(X)[0]
-        confidence = max(self.model.predict_proba(X)[0])
+        # predict_proba alone gives both the label and its confidence
+        return self.predict_batch([query])[0]
 
-        return intent, round(confidence, 2)
+    def predict_batch(self, queries):
+        # One sparse matrix and one predict_proba for the whole batch
+        proba = self.model.predict_proba(self.vectorizer.transform(queries))
+        intents = self.model.classes_[proba.argmax(axis=1)]
+        return [(intent, round(conf, 2)) for intent, conf in zip(intents, proba.max(axis=1))]
 
@@ -0,0 +1,211 @@
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+
+import config
+
+# Upper bucket bounds in seconds, Prometheus style (cumulative, +Inf last)
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+QUANTILES = (0.5, 0.95, 0.99)
+# Engine label for stages timed outside a traced request (e.g. the feedback writer)
+NO_ENGINE = "none"
+
+_current = contextvars.ContextVar("latency_trace", default=None)
+
+
+def _bucket(seconds):
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            return i
+    return len(BUCKETS) - 1
+
+
+class _Shard:
+    # One thread's histograms: only the owning thread writes, readers merge
+    # every shard, so recording takes no lock
+    def __init__(self):
+        self.series = {}
+
+    def record(self, key, seconds):
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * len(BUCKETS), 0.0]
+        series[0][_bucket(seconds)] += 1
+        series[1] += seconds
+
+
+class Trace:
+    __slots__ = ("query", "started", "stages")
+
+    def __init__(self, query):
+        self.query = query
+        self.started = time.perf_counter()
+        self.stages = []
+
+
+class _Stage:
+    __slots__ = ("tracer", "name", "trace", "started")
+
+    def __init__(self, tracer, name, trace):
+        self.tracer = tracer
+        self.name = name
+        self.trace = trace
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer._stage_done(self.name, time.perf_counter() - self.started, self.trace)
+        return False
+
+
+class _NoopStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopStage()
+
+
+# Per-stage latency histograms by stage and engine. A request's stages are
+# recorded under the engine that finally answered it.
+class LatencyTracer:
+    def __init__(self, enabled=True, slow_ms=1000.0, slow_sample_rate=1.0, slow_buffer=100):
+        self.enabled = enabled
+        self.slow_s = slow_ms / 1000.0
+        self.slow_sample_rate = slow_sample_rate
+        self.slow = deque(maxlen=slow_buffer)
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def stage(self, name, trace=None):
+        # Times a block into the given trace, else the current request's
+        return _Stage(self, name, trace) if self.enabled else _NOOP
+
+    def _stage_done(self, name, seconds, trace):
+        trace = trace or _current.get()
+        if trace is not None:
+            trace.stages.append((name, seconds))
+        else:
+            self._shard().record((name, NO_ENGINE), seconds)
+
+    def start(self, query):
+        # None when disabled or already inside a traced request
+        if not self.enabled or _current.get() is not None:
+            return None
+        trace = Trace(query)
+        _current.set(trace)
+        return trace
+
+    def finish(self, trace, engine):
+        if trace is None:
+            return
+        if _current.get() is trace:
+            _current.set(None)
+        total = time.perf_counter() - trace.started
+        engine = engine or NO_ENGINE
+        shard = self._shard()
+        for name, seconds in trace.stages:
+            shard.record((name, engine), seconds)
+        shard.record(("total", engine), total)
+        if total >= self.slow_s and random.random() < self.slow_sample_rate:
+            self.slow.append({
+                "query": trace.query,
+                "engine": engine,
+                "total_ms": round(total * 1000, 2),
+                "stages_ms": [(name, round(seconds * 1000, 2)) for name, seconds in trace.stages],
+                "at": time.time(),
+            })
+
+    def snapshot(self):
+        merged = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for key, (counts, total) in list(shard.series.items()):
+                series = merged.setdefault(key, [[0] * len(BUCKETS), 0.0])
+                series[0] = [a + b for a, b in zip(series[0], counts)]
+                series[1] += total
+        return merged
+
+    def summary(self):
+        out = {}
+        for (stage, engine), (counts, total) in sorted(self.snapshot().items()):
+            count = sum(counts)
+            out.setdefault(engine, {})[stage] = {
+                "count": count,
+                "mean_ms": round(total / count * 1000, 3) if count else None,
+                **{f"p{int(q * 100)}_ms": _ms(quantile(counts, q)) for q in QUANTILES},
+            }
+        return out
+
+    def prometheus(self, name="query_stage_latency_seconds"):
+        snapshot = sorted(self.snapshot().items())
+        lines = [
+            f"# HELP {name} Time spent per request stage, by answering engine.",
+            f"# TYPE {name} histogram",
+        ]
+        for (stage, engine), (counts, total) in snapshot:
+            labels = f'stage="{stage}",engine="{engine}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {total:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {cumulative}")
+        lines.append(f"# HELP {name}_quantile Quantiles estimated from the histogram buckets.")
+        lines.append(f"# TYPE {name}_quantile gauge")
+        for (stage, engine), (counts, _) in snapshot:
+            for q in QUANTILES:
+                value = quantile(counts, q)
+                if value is not None:
+                    lines.append(f'{name}_quantile{{stage="{stage}",engine="{engine}",quantile="{q}"}} {value:.6f}')
+        return "\n".join(lines) + "\n"
+
+
+def quantile(counts, q):
+    # Linear interpolation inside the bucket holding the q-th observation,
+    # as Prometheus' histogram_quantile does
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    for i, count in enumerate(counts):
+        if cumulative + count >= rank and count:
+            lower = BUCKETS[i - 1] if i else 0.0
+            upper = BUCKETS[i]
+            if upper == float("inf"):
+                return lower
+            return lower + (upper - lower) * (rank - cumulative) / count
+        cumulative += count
+    return BUCKETS[-2]
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+tracer = LatencyTracer(
+    enabled=config.LATENCY_TRACING,
+    slow_ms=config.LATENCY_SLOW_MS,
+    slow_sample_rate=config.LATENCY_SLOW_SAMPLE_RATE,
+    slow_buffer=config.LATENCY_SLOW_BUFFER,
+)
@@ -0,0 +1,62 @@
+import os
+
+import joblib
+import numpy as np
+import scipy.sparse as sp
+
+ROUTER_PATH = os.path.join("models", "router.pkl")
+# Engines a FACTUAL or EXPLANATION query can be answered by, and the order
+# the fixed cascade tries them in. The transformer always answers, so every
+# plan ends with it.
+ROUTED_INTENTS = ("FACTUAL", "EXPLANATION")
+FIXED_CASCADE = {"FACTUAL": ("HYBRID", "TRANSFORMER"), "EXPLANATION": ("TRANSFORMER",)}
+SKIPPABLE = ("HYBRID", "RETRIEVAL")
+
+
+def router_features(vectorizer, queries, intents):
+    # Query TF-IDF plus a one-hot intent column per routed intent
+    onehot = np.array([[intent == name for name in ROUTED_INTENTS] for intent in intents], dtype=np.float64)
+    return sp.hstack([vectorizer.transform(queries), sp.csr_matrix(onehot)], format="csr")
+
+
+def order_engines(success, costs_ms, min_success=0.0):
+    # Trying engines in ascending cost / P(success) minimizes the expected
+    # latency of a cascade. An engine is skipped when going straight to the
+    # transformer is cheaper in expectation, or when it rarely succeeds.
+    bar = costs_ms["TRANSFORMER"] / max(success["TRANSFORMER"], 1e-6)
+    ratio = {e: costs_ms[e] / max(success[e], 1e-6) for e in SKIPPABLE}
+    tried = sorted((e for e in SKIPPABLE if success[e] >= min_success and ratio[e] < bar), key=ratio.get)
+    return (*tried, "TRANSFORMER")
+
+
+# Predicts, per query, which retrieval engines are likely to produce an
+# accepted and helpful answer (built by ml/router.py from replayed feedback
+# logs) and orders the cascade by expected cost.
+class LearnedRouter:
+    def __init__(self, path=None, min_success=0.0, artifact=None):
+        # artifact: an already loaded router, as ml/router.py evaluates them
+        artifact = artifact or joblib.load(path or ROUTER_PATH)
+        self.version = artifact.get("version")
+        self.vectorizer = artifact["vectorizer"]
+        # Engine -> classifier, or a constant probability when every training
+        # outcome for that engine was the same
+        self.heads = artifact["heads"]
+        self.costs_ms = artifact["costs_ms"]
+        self.min_success = min_success
+
+    def success_batch(self, queries, intents):
+        X = router_features(self.vectorizer, queries, intents)
+        return [
+            dict(zip(self.heads, values))
+            for values in zip(*(
+                np.full(len(queries), head) if isinstance(head, float) else head.predict_proba(X)[:, 1]
+                for head in self.heads.values()
+            ))
+        ]
+
+    def plan_batch(self, queries, intents):
+        return [order_engines(success, self.costs_ms, self.min_success)
+                for success in self.success_batch(queries, intents)]
+
+    def plan(self, query, intent):
+        return self.plan_batch([query], [intent])[0]
@@ -1,8 +1,20 @@
+import asyncio
+import contextvars
 import logging
-logging.basicConfig(level=logging.INFO)
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from core.domain_classifier import predict_domain
-from core.intent_classifier import IntentClassifier
+import config
+logging.basicConfig(level=config.LOG_LEVEL)
+
+from core.admission import AdmissionController, EngineBusy
+from core.latency import tracer
+from core.learned_router import FIXED_CASCADE, ROUTED_INTENTS
+from core.model_registry import model_registry
+from core.engine_lifecycle import EngineManager
+from core.response_cache import ResponseCache
+from core.routing_rules import routing_rules
 from core.difficulty_predictor import predict_difficulty
 from core.hallucination_predictor import predict_risk
 from core.engine_predictor import predict_engine
@@ -10,107 +22,268 @@ from core.quality_predictor import predict_quality
 from core.validator import validate
 
 from engines.rule_engine import rule_engine
-from engines.retrieval_engine import RetrievalEngine
 from engines.calculator import calculate
-from engines.transformer_engine import explain
+from engines.transformer_engine import explain, explain_batch, stream_generate, GenerationTimeout, load_model as load_transformer
 from engines.faiss_engine import FaissSemanticEngine
+from engines.hybrid_engine import HybridRetriever
+from build_faiss_index import ensure_index
 
-# Initialize the IntentClassifier
-intent_classifier = IntentClassifier()
 
-# Initialize the RetrievalEngine
-retrieval_engine = RetrievalEngine()
+def _load_models():
+    # Domain/intent classifiers and the RetrievalEngine; retrains swap in a
+    # new bundle through the registry without a restart
+    model_registry.active()
+    return model_registry
 
-# Initialize the FAISS semantic engine
-faiss_engine = FaissSemanticEngine()
 
-def handle_query(query: str):
-    domain, d_conf = predict_domain(query)
-    intent, i_conf = intent_classifier.predict(query)
-    difficulty = predict_difficulty(query)
-    risk = predict_risk(query)
+def _load_faiss(reuse=None):
+    if config.FAISS_AUTO_BUILD:
+        # Reloads over a changed knowledge base update the index with the
+        # encoder already loaded
+        ensure_index(reuse.model if reuse is not None else None)
+    return FaissSemanticEngine(
+        reuse=reuse,
+        batching=config.FAISS_BATCHING,
+        max_batch_size=config.FAISS_BATCH_MAX_SIZE,
+        max_wait_ms=config.FAISS_BATCH_MAX_WAIT_MS,
+        model_name=config.EMBEDDING_MODEL,
+        nprobe=config.FAISS_NPROBE,
+        ef_search=config.FAISS_EF_SEARCH,
+        mmap=config.FAISS_MMAP,
+        encoder_backend=config.EMBEDDING_BACKEND,
+        onnx_dir=config.EMBEDDING_ONNX_DIR,
+        onnx_variant=config.EMBEDDING_ONNX_VARIANT,
+        onnx_threads=config.EMBEDDING_ONNX_THREADS,
+    )
 
-    logging.info(f"Query: {query}")
-    logging.info(f"Predicted domain: {domain} (conf: {d_conf}) | intent: {intent} (conf: {i_conf})")
 
-    # Out-of-domain fallback
-    if domain != "STUDENT":
-        logging.info("Out-of-domain. Returning fallback.")
-        return {
-            "answer": "Sorry, I don’t have information on that topic. Please contact the administration for more details.",
-            "domain": domain,
-            "intent": None,
-            "difficulty": None,
-            "engine": "RULE",
-            "confidence": d_conf,
-            "quality": None,
-            "source": "rule"
-        }
+def _rebuild_retrievers(bundle):
+    # A reload that found a changed knowledge base rebuilds the dense and
+    # hybrid engines over it too, before the response cache is cleared
+    slot = engine_manager.slots["faiss"]
+    if slot.state != "ready" or slot.value.kb_generation == bundle.kb_generation:
+        return
+    logging.info("Knowledge base changed; rebuilding the FAISS and hybrid engines")
+    try:
+        engine_manager.replace("faiss", _load_faiss(reuse=slot.value))
+        if engine_manager.slots["hybrid"].state == "ready":
+            engine_manager.replace("hybrid", _load_hybrid())
+    except Exception as e:
+        # Keep serving the previous engines; the cache is still cleared
+        logging.error(f"Rebuilding the FAISS and hybrid engines failed: {e}")
 
-    # Academic integrity guard
-    forbidden_keywords = ["hack", "leak", "cheat", "predict marks", "get exam paper"]
-    if any(kw in query.lower() for kw in forbidden_keywords):
-        logging.info("Blocked by academic integrity guard.")
-        return {
-            "answer": "Sorry, this query is blocked due to academic integrity policies.",
-            "domain": domain,
-            "intent": intent,
-            "difficulty": difficulty,
-            "engine": "RULE",
-            "confidence": round((d_conf + i_conf) / 2, 2),
-            "quality": None,
-            "source": "rule"
-        }
 
-    # Key fix: fallback to CALCULATOR for numeric queries
-    result = None
-    engine = None
-    if intent == "NUMERIC" or ("calculate" in query.lower() or "cgpa" in query.lower() or "percentage" in query.lower()):
-        result = calculate(query)
-        engine = "CALCULATOR"
-        logging.info("Engine selected: CALCULATOR (fallback)")
-    elif intent == "FACTUAL" and domain == "STUDENT":
-        # Try FAISS semantic search first
-        faiss_result = faiss_engine.search(query, top_k=3)
-        logging.info(f"FAISS top-3 scores: {[faiss_result['score'] for faiss_result in [faiss_engine.search(query, top_k=i+1) for i in range(3)]]}")
-        # Lower threshold for testing (e.g., < 5.0)
-        if faiss_result and faiss_result['score'] < 5.0:
-            result = {
-                "answer": faiss_result['text'],
-                "confidence": 1.0 - faiss_result['score'],
-                "source": faiss_result['metadata'].get('source', None)
-            }
-            engine = "FAISS_SEMANTIC"
-            logging.info("Engine selected: FAISS_SEMANTIC")
+def _load_hybrid():
+    return HybridRetriever(
+        engine_manager.get("faiss"),
+        fusion=config.HYBRID_FUSION,
+        dense_weight=config.HYBRID_DENSE_WEIGHT,
+        rrf_k=config.HYBRID_RRF_K,
+        candidates=config.HYBRID_CANDIDATES,
+        dense_threshold=config.FAISS_MIN_SIMILARITY,
+        sparse_threshold=config.HYBRID_SPARSE_THRESHOLD,
+    )
+
+
+# Heavy engines are loaded in parallel at startup (see app lifespan) or on
+# first use, instead of serially at import time
+engine_manager = EngineManager(max_workers=config.ENGINE_LOAD_WORKERS)
+engine_manager.register("models", _load_models)
+engine_manager.register("faiss", _load_faiss)
+engine_manager.register("hybrid", _load_hybrid)
+engine_manager.register("transformer", load_transformer)
+
+# Answers for repeated questions; cleared whenever the registry swaps in new
+# models or a rebuilt knowledge base
+response_cache = ResponseCache(
+    max_entries=config.CACHE_MAX_ENTRIES,
+    ttl_s=config.CACHE_TTL_S,
+    semantic_threshold=config.CACHE_SEMANTIC_THRESHOLD,
+    enabled=config.CACHE_ENABLED,
+)
+model_registry.listeners.append(_rebuild_retrievers)
+model_registry.listeners.append(response_cache.invalidate)
+# Cached guard and calculator answers depend on the rules
+routing_rules.listeners.append(response_cache.invalidate)
+
+# Bounds how many requests are inside flan-t5 and dense retrieval at once, so
+# a burst of EXPLANATION queries cannot occupy every worker thread while cheap
+# calculator and rule answers wait
+admission = AdmissionController(mode=config.ADMISSION_MODE)
+admission.add("transformer", config.TRANSFORMER_MAX_CONCURRENCY, config.TRANSFORMER_MAX_QUEUE,
+              config.ADMISSION_QUEUE_TIMEOUT_MS / 1000.0)
+admission.add("hybrid", config.HYBRID_MAX_CONCURRENCY, config.HYBRID_MAX_QUEUE,
+              config.ADMISSION_QUEUE_TIMEOUT_MS / 1000.0)
+
+# Only answers from these intents/engines are matched by embedding similarity;
+# calculator and rule answers depend on exact wording and stay exact-only
+SEMANTIC_CACHE_INTENTS = ("FACTUAL", "EXPLANATION")
+SEMANTIC_CACHE_ENGINES = ("HYBRID", "RETRIEVAL", "TRANSFORMER")
+
+
+def _out_of_domain(domain, d_conf):
+    return {
+        "answer": "Sorry, I don’t have information on that topic. Please contact the administration for more details.",
+        "domain": domain,
+        "intent": None,
+        "difficulty": None,
+        "engine": "RULE",
+        "confidence": d_conf,
+        "quality": None,
+        "source": "rule"
+    }
+
+
+def _is_forbidden(analysis):
+    return analysis.forbidden
+
+
+def _integrity_block(domain, intent, difficulty, d_conf, i_conf):
+    return {
+        "answer": "Sorry, this query is blocked due to academic integrity policies.",
+        "domain": domain,
+        "intent": intent,
+        "difficulty": difficulty,
+        "engine": "RULE",
+        "confidence": round((d_conf + i_conf) / 2, 2),
+        "quality": None,
+        "source": "rule"
+    }
+
+
+def _is_numeric(analysis, intent):
+    return intent == "NUMERIC" or analysis.numeric
+
+
+def _candidate_result(candidate):
+    return {
+        "answer": candidate["answer"],
+        "confidence": candidate["score"],
+        "source": candidate["source"],
+    }
+
+
+def _hybrid_answer(candidates):
+    # One threshold on the fused, calibrated score
+    if candidates and candidates[0]["score"] >= config.HYBRID_MIN_SCORE:
+        return _candidate_result(candidates[0])
+    return None
+
+
+def _retrieval_answer(result):
+    # TF-IDF QA answers are served only at RETRIEVAL_MIN_CONFIDENCE or above
+    if result["source"] is not None and result["confidence"] >= config.RETRIEVAL_MIN_CONFIDENCE:
+        return result
+    return None
+
+
+def _fallback_result(candidates):
+    # Best below-threshold candidate, served if generation times out
+    return _candidate_result(candidates[0]) if candidates else None
+
+
+DEADLINE_MESSAGE = "Sorry, this is taking longer than expected. Please try again in a moment."
+
+
+def _busy_result(timed_out=False):
+    # Traced as SHED, or as DEADLINE when generation ran out of time
+    return {
+        "answer": DEADLINE_MESSAGE if timed_out else "The assistant is busy right now. Please try again in a moment.",
+        "confidence": None,
+        "source": "deadline" if timed_out else "busy",
+        "degraded": True,
+    }
+
+
+def _degraded_answer(query, models, fallback=None, timed_out=False):
+    # Answer for a query the chosen engine could not serve in time: the best
+    # hybrid candidate, else a TF-IDF answer that clears the retrieval bar,
+    # else a busy notice. Each is served (and logged) under the engine that
+    # produced it.
+    if fallback is not None:
+        return dict(fallback, degraded=True), "HYBRID"
+    result = _retrieval_answer(models.retrieval.retrieve(query))
+    if result is None:
+        return _busy_result(timed_out), "RULE"
+    return dict(result, degraded=True), "RETRIEVAL"
+
+
+def _shed_answer(query, models, busy, fallback=None):
+    # A request shed by admission control: re-raised in "reject" mode (503 at
+    # the API), otherwise given a degraded answer
+    admission.shed(busy)
+    logging.info("%s engine at capacity, serving a degraded answer", busy.engine)
+    return _degraded_answer(query, models, fallback)
+
+
+def _hybrid_search(query, embedding=None):
+    with admission.admit("hybrid"):
+        return engine_manager.get("hybrid").search(query, top_k=3, embedding=embedding)
+
+
+def _plan(query, intent, models):
+    # Engines to try for a FACTUAL/EXPLANATION query, ending with the
+    # transformer: the learned order when a router is loaded, else the fixed
+    # cascade
+    if models.router is None:
+        return FIXED_CASCADE[intent]
+    with tracer.stage("router"):
+        return models.router.plan(query, intent)
+
+
+def _cascade(query, intent, models, embedding=None):
+    # Runs the plan up to the transformer. Returns (result, engine, fallback):
+    # result is None when the transformer should answer, with fallback the
+    # best below-threshold hybrid candidate to serve if generation times out.
+    fallback = None
+    for engine in _plan(query, intent, models)[:-1]:
+        if engine == "HYBRID":
+            # Dense and sparse retrieval in one pass (reusing the cache embedding)
+            try:
+                candidates = _hybrid_search(query, embedding)
+            except EngineBusy as busy:
+                return (*_shed_answer(query, models, busy), None)
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug("Hybrid top-3: %s", [(c["id"], c["score"], c["dense"], c["sparse"]) for c in candidates])
+            result = _hybrid_answer(candidates)
+            fallback = fallback or _fallback_result(candidates)
         else:
-            retrieval_result = retrieval_engine.retrieve(query)
-            logging.info(f"Retrieval confidence: {retrieval_result.get('confidence', 0)}")
-            if retrieval_result and retrieval_result.get("confidence", 0) >= 0.8:
-                result = retrieval_result
-                engine = "RETRIEVAL"
-                logging.info("Engine selected: RETRIEVAL")
-            else:
-                result = explain(query)
-                engine = "TRANSFORMER"
-                logging.info("Engine selected: TRANSFORMER")
-    elif intent == "EXPLANATION":
-        result = explain(query)
-        engine = "TRANSFORMER"
-        logging.info("Engine selected: TRANSFORMER (EXPLANATION)")
-    elif intent == "UNSAFE":
-        result = rule_engine("Unsafe or blocked query")
-        engine = "RULE"
-        logging.info("Engine selected: RULE (UNSAFE)")
-    else:
-        result = rule_engine("Unknown engine")
-        engine = "RULE"
-        logging.info("Engine selected: RULE (Unknown)")
-
-    # Quality prediction
-    quality = predict_quality(result["answer"])
-    # Relax validation for explanations
-    if quality == "RISKY" or (not validate(result["answer"]) and intent != "EXPLANATION"):
-        logging.info("Blocked by quality or validation.")
+            result = _retrieval_answer(models.retrieval.retrieve(query))
+        if result:
+            return result, engine, None
+    return None, "TRANSFORMER", fallback
+
+
+def _explain_or_fallback(query, models, fallback=None, deadline_s=None):
+    # Bounded-cost generation: past the deadline, serve a degraded answer
+    if deadline_s is None:
+        deadline_s = config.TRANSFORMER_DEADLINE_MS / 1000.0
+    gate = admission.gates["transformer"]
+    try:
+        admitted = gate.enter()
+    except EngineBusy as busy:
+        return _shed_answer(query, models, busy, fallback)
+    try:
+        # The slot is held until the generation itself finishes or is
+        # cancelled, not just while this request waits for it, so timed-out
+        # generations still count against the limit
+        with tracer.stage("transformer"):
+            return explain(query, deadline_s=deadline_s, on_done=lambda: gate.leave(admitted)), "TRANSFORMER"
+    except GenerationTimeout:
+        logging.info("Transformer deadline exceeded, serving a degraded answer")
+        # Degraded answers are not cached; the generation still completes and
+        # is served from the generation cache next time
+        return _degraded_answer(query, models, fallback, timed_out=True)
+
+
+def _finalize(result, engine, domain, intent, difficulty, d_conf, i_conf, trace=None):
+    with tracer.stage("quality", trace):
+        # Quality prediction
+        quality = predict_quality(result["answer"])
+        # Relax validation for explanations
+        blocked = quality == "RISKY" or (not validate(result["answer"]) and intent != "EXPLANATION")
+    if blocked:
+        logging.debug("Blocked by quality or validation.")
         return {
             "answer": "Sorry, I cannot confidently answer this question. Please consult official resources or staff.",
             "domain": domain,
@@ -122,7 +295,6 @@ def handle_query(query: str):
             "source": "rule"
         }
 
-    logging.info(f"Final engine: {engine} | Answer: {result['answer']}")
     return {
         "answer": result["answer"],
         "domain": domain,
@@ -133,3 +305,500 @@ def handle_query(query: str):
         "quality": quality,
         "source": result.get("source", None)
     }
+
+
+class Route:
+    # How far routing got before generation: either a finished response, or
+    # what is needed to finish a transformer-bound query
+    def __init__(self, query, response=None, models=None, domain=None, intent=None, difficulty=None,
+                 d_conf=None, i_conf=None, embedding=None, generation=None, fallback=None, cached=False):
+        self.query = query
+        self.response = response
+        self.cached = cached
+        self.models = models
+        self.domain = domain
+        self.intent = intent
+        self.difficulty = difficulty
+        self.d_conf = d_conf
+        self.i_conf = i_conf
+        self.embedding = embedding
+        self.generation = generation
+        # Served (degraded) if generation times out
+        self.fallback = fallback
+        # Answered by a fallback after a timeout or load shedding
+        self.degraded = False
+
+    def meta(self):
+        if self.response is not None:
+            return {key: self.response.get(key) for key in ("domain", "intent", "difficulty", "engine")}
+        return {"domain": self.domain, "intent": self.intent, "difficulty": self.difficulty, "engine": "TRANSFORMER"}
+
+
+def _trace_engine(response, cached=False):
+    # Latency histograms are labelled by the engine that answered; cache hits,
+    # notices for requests that ran out of time (DEADLINE) and notices for
+    # requests shed by admission control (SHED) get labels of their own
+    if cached:
+        return "CACHE"
+    if response is None:
+        return None
+    return {"deadline": "DEADLINE", "busy": "SHED"}.get(response.get("source"), response.get("engine"))
+
+
+def _complete(route, result, engine, trace=None):
+    route.response = _finalize(result, engine, route.domain, route.intent, route.difficulty,
+                               route.d_conf, route.i_conf, trace)
+    logging.debug("Final engine: %s | Answer: %s", engine, route.response["answer"])
+    embedding = route.embedding if engine in SEMANTIC_CACHE_ENGINES else None
+    route.degraded = bool(result.get("degraded"))
+    if not route.degraded:
+        response_cache.put(route.query, route.response, embedding=embedding, scope=route.intent,
+                           generation=route.generation)
+    return route
+
+
+def route_query(query: str):
+    # Everything in handle_query up to transformer generation, shared with
+    # the streaming endpoint
+    with tracer.stage("cache"):
+        cached = response_cache.get(query)
+    if cached is not None:
+        logging.debug("Cache hit (exact): %s", query)
+        return Route(query, cached, cached=True)
+    generation = response_cache.generation
+
+    # One snapshot per request so every stage sees the same model version
+    models = engine_manager.get("models").active()
+    with tracer.stage("classify"):
+        (domain, d_conf), (intent, i_conf) = models.classify(query)
+    # Normalized and matched against the routing rules once for every stage
+    with tracer.stage("guard"):
+        analysis = routing_rules.analyze(query)
+    difficulty = predict_difficulty(query, analysis)
+    risk = predict_risk(query, analysis)
+
+    logging.debug("Query: %s", query)
+    logging.debug("Predicted domain: %s (conf: %s) | intent: %s (conf: %s)", domain, d_conf, intent, i_conf)
+
+    # Out-of-domain fallback
+    if domain != "STUDENT":
+        logging.debug("Out-of-domain. Returning fallback.")
+        response = _out_of_domain(domain, d_conf)
+        response_cache.put(query, response, generation=generation)
+        return Route(query, response)
+
+    # Academic integrity guard
+    if _is_forbidden(analysis):
+        logging.debug("Blocked by academic integrity guard.")
+        response = _integrity_block(domain, intent, difficulty, d_conf, i_conf)
+        response_cache.put(query, response, generation=generation)
+        return Route(query, response)
+
+    # Semantic cache tier: the MiniLM embedding computed here is reused for
+    # the hybrid search below, so a miss costs no extra encode
+    numeric = _is_numeric(analysis, intent)
+    embedding = None
+    if response_cache.enabled and not numeric and intent in SEMANTIC_CACHE_INTENTS:
+        embedding = engine_manager.get("faiss").encode([query])[0]
+        with tracer.stage("cache"):
+            cached = response_cache.get_semantic(embedding, scope=intent)
+        if cached is not None:
+            logging.debug("Cache hit (semantic): %s", query)
+            response_cache.put(query, cached, generation=generation)
+            return Route(query, cached, cached=True)
+
+    route = Route(query, models=models, domain=domain, intent=intent, difficulty=difficulty,
+                  d_conf=d_conf, i_conf=i_conf, embedding=embedding, generation=generation)
+    # Key fix: fallback to CALCULATOR for numeric queries
+    if numeric:
+        logging.debug("Engine selected: CALCULATOR (fallback)")
+        with tracer.stage("calculator"):
+            result = calculate(query, analysis)
+        return _complete(route, result, "CALCULATOR")
+    elif intent in ROUTED_INTENTS:
+        result, engine, route.fallback = _cascade(query, intent, models, embedding)
+        if result is None:
+            return route
+        logging.debug("Engine selected: %s", engine)
+        return _complete(route, result, engine)
+    elif intent == "UNSAFE":
+        logging.debug("Engine selected: RULE (UNSAFE)")
+        return _complete(route, rule_engine("Unsafe or blocked query"), "RULE")
+    else:
+        logging.debug("Engine selected: RULE (Unknown)")
+        return _complete(route, rule_engine("Unknown engine"), "RULE")
+
+
+def handle_query(query: str):
+    trace = tracer.start(query)
+    route = None
+    try:
+        route = route_query(query)
+        if route.response is None:
+            result, engine = _explain_or_fallback(query, route.models, route.fallback)
+            logging.debug("Engine selected: %s (%s)", engine, route.intent)
+            _complete(route, result, engine)
+        return route.response
+    finally:
+        tracer.finish(trace, route and _trace_engine(route.response, route.cached))
+
+
+def stream_query(query: str):
+    # Yields (event, data) pairs: routing metadata as soon as the engine is
+    # known, generated text as it is decoded, then the finalized response.
+    # The final answer is authoritative: quality prediction/validation may
+    # replace the streamed text ("blocked"), and a stalled generation or a
+    # shed request is answered by the retrieval fallback ("degraded").
+    # Routing and transformer admission happen before the first yield, so a
+    # request rejected by admission control fails before anything is streamed.
+    trace = tracer.start(query)
+    admitted = None
+    try:
+        route = route_query(query)
+        if route.response is None:
+            try:
+                admitted = admission.gates["transformer"].enter()
+            except EngineBusy as busy:
+                _complete(route, *_shed_answer(query, route.models, busy, route.fallback), trace)
+    except Exception:
+        tracer.finish(trace, None)
+        raise
+    try:
+        yield from _stream_route(query, route, trace)
+    finally:
+        # Also runs when the client goes away mid-stream
+        if admitted is not None:
+            admission.gates["transformer"].leave(admitted)
+
+
+def _stream_route(query, route, trace):
+    # Each step of the generator may run in a different context, so stages
+    # after the first yield name the trace explicitly
+    yield "meta", route.meta()
+    if route.response is not None:
+        tracer.finish(trace, _trace_engine(route.response, route.cached))
+        yield "token", {"text": route.response["answer"]}
+        yield "done", dict(route.response, blocked=False, degraded=route.degraded)
+        return
+
+    stall_s = config.TRANSFORMER_STREAM_STALL_MS / 1000.0 or None
+    pieces = []
+    try:
+        with tracer.stage("transformer", trace):
+            for piece in stream_generate(query, stall_s=stall_s):
+                pieces.append(piece)
+                yield "token", {"text": piece}
+    except GenerationTimeout:
+        logging.info("Transformer stream stalled, serving a degraded answer")
+        _complete(route, *_degraded_answer(query, route.models, route.fallback, timed_out=True), trace)
+        tracer.finish(trace, _trace_engine(route.response))
+        yield "done", dict(route.response, blocked=False, degraded=True)
+        return
+    text = "".join(pieces).strip()
+    _complete(route, {"answer": text, "confidence": 1.0, "source": "transformer"}, "TRANSFORMER", trace)
+    tracer.finish(trace, "TRANSFORMER")
+    yield "done", dict(route.response, blocked=route.response["answer"] != text, degraded=False)
+
+
+def _deadline_response(domain=None, intent=None):
+    return {
+        "answer": DEADLINE_MESSAGE,
+        "domain": domain,
+        "intent": intent,
+        "difficulty": None,
+        "engine": "RULE",
+        "confidence": None,
+        "quality": None,
+        "source": "deadline"
+    }
+
+
+def _generation_budget(expires_at):
+    # The generation deadline never outlives what is left of the request budget
+    budget = config.TRANSFORMER_DEADLINE_MS / 1000.0
+    remaining = expires_at - time.monotonic()
+    if remaining == float("inf"):
+        return budget
+    # Leave headroom so a timed-out generation can still fall back to
+    # retrieval before the request deadline fires
+    remaining = max(0.001, remaining - min(0.05, remaining * 0.2))
+    return min(budget, remaining) if budget else remaining
+
+
+async def _get_engine(name):
+    # Engines still loading (lazy mode) are loaded off the event loop
+    slot = engine_manager.slots[name]
+    if slot.state == "ready":
+        return slot.value
+    return await asyncio.to_thread(engine_manager.get, name)
+
+
+def _timed(name, fn, *args):
+    with tracer.stage(name):
+        return fn(*args)
+
+
+# Worker threads for the dense and sparse halves of async hybrid searches,
+# two per admitted search
+_fanout_pool = ThreadPoolExecutor(max_workers=2 * max(1, config.HYBRID_MAX_CONCURRENCY),
+                                  thread_name_prefix="hybrid-fanout")
+
+
+def _leave_when_done(gate, admitted, futures):
+    # The slot is given back once every future has finished or been
+    # cancelled, so work a request stopped waiting for still counts
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            gate.leave(admitted)
+
+    for future in futures:
+        future.add_done_callback(done)
+
+
+async def _gather_or_cancel(*futures):
+    # Awaits every future; the rest are cancelled as soon as one fails or the
+    # caller is cancelled
+    try:
+        return await asyncio.gather(*futures)
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _start_hybrid_halves(hybrid, query, embeddings):
+    # Waits for a hybrid slot and submits both halves in one call, so a
+    # request cancelled while queued cannot leave the slot taken
+    gate = admission.gates["hybrid"]
+    admitted = gate.enter()
+    futures = [
+        # Each half runs in its own copy of the context, so its stages land
+        # in the request's trace
+        _fanout_pool.submit(contextvars.copy_context().run, hybrid.dense_search, [query], embeddings),
+        _fanout_pool.submit(contextvars.copy_context().run, hybrid.sparse_search, [query]),
+    ]
+    _leave_when_done(gate, admitted, futures)
+    return futures
+
+
+async def _hybrid_search_async(query, embedding=None):
+    # _hybrid_search with the dense half (encode and FAISS scan) and the
+    # sparse half (TF-IDF) running concurrently
+    hybrid = await _get_engine("hybrid")
+    embeddings = None if embedding is None else embedding.reshape(1, -1)
+    futures = await asyncio.to_thread(_start_hybrid_halves, hybrid, query, embeddings)
+    dense, sparse = await _gather_or_cancel(*map(asyncio.wrap_future, futures))
+    return hybrid.fuse_batch(dense, sparse, top_k=3)[0]
+
+
+async def _cascade_async(query, intent, models, embedding=None):
+    # _cascade with every step before the transformer started at once.
+    # Answers are still taken in plan order, and once a step accepts, the
+    # steps after it are cancelled.
+    plan = _plan(query, intent, models)[:-1]
+    tasks = {}
+    for engine in plan:
+        if engine == "HYBRID":
+            tasks[engine] = asyncio.create_task(_hybrid_search_async(query, embedding))
+        else:
+            tasks[engine] = asyncio.create_task(asyncio.to_thread(models.retrieval.retrieve, query))
+    fallback = None
+    try:
+        for engine in plan:
+            if engine == "HYBRID":
+                try:
+                    candidates = await tasks[engine]
+                except EngineBusy as busy:
+                    return (*await asyncio.to_thread(_shed_answer, query, models, busy), None)
+                result = _hybrid_answer(candidates)
+                fallback = fallback or _fallback_result(candidates)
+            else:
+                result = _retrieval_answer(await tasks[engine])
+            if result:
+                return result, engine, None
+        return None, "TRANSFORMER", fallback
+    finally:
+        for task in tasks.values():
+            if task.done() and not task.cancelled():
+                # Retrieve the outcome of a step that lost, so a failure in
+                # it is not reported as never retrieved
+                task.exception()
+            task.cancel()
+
+
+async def _handle_query_async(query, expires_at, state):
+    with tracer.stage("cache"):
+        cached = response_cache.get(query)
+    if cached is not None:
+        state["cached"] = True
+        return cached
+    generation = response_cache.generation
+
+    models = (await _get_engine("models")).active()
+    (domain, d_conf), (intent, i_conf) = await asyncio.to_thread(_timed, "classify", models.classify, query)
+    state.update(domain=domain, intent=intent)
+    with tracer.stage("guard"):
+        analysis = routing_rules.analyze(query)
+    difficulty = predict_difficulty(query, analysis)
+
+    if domain != "STUDENT":
+        response = _out_of_domain(domain, d_conf)
+        response_cache.put(query, response, generation=generation)
+        return response
+    if _is_forbidden(analysis):
+        response = _integrity_block(domain, intent, difficulty, d_conf, i_conf)
+        response_cache.put(query, response, generation=generation)
+        return response
+
+    numeric = _is_numeric(analysis, intent)
+    embedding = None
+    if response_cache.enabled and not numeric and intent in SEMANTIC_CACHE_INTENTS:
+        faiss_engine = await _get_engine("faiss")
+        embedding = (await asyncio.to_thread(faiss_engine.encode, [query]))[0]
+        with tracer.stage("cache"):
+            cached = response_cache.get_semantic(embedding, scope=intent)
+        if cached is not None:
+            state["cached"] = True
+            response_cache.put(query, cached, generation=generation)
+            return cached
+
+    if numeric:
+        with tracer.stage("calculator"):
+            result, engine = calculate(query, analysis), "CALCULATOR"
+    elif intent in ROUTED_INTENTS:
+        result, engine, fallback = await _cascade_async(query, intent, models, embedding)
+        if result is None:
+            result, engine = await asyncio.to_thread(
+                _explain_or_fallback, query, models, fallback, _generation_budget(expires_at)
+            )
+    elif intent == "UNSAFE":
+        result, engine = rule_engine("Unsafe or blocked query"), "RULE"
+    else:
+        result, engine = rule_engine("Unknown engine"), "RULE"
+
+    response = _finalize(result, engine, domain, intent, difficulty, d_conf, i_conf)
+    logging.debug("Final engine: %s | Answer: %s", engine, response["answer"])
+    if engine not in SEMANTIC_CACHE_ENGINES:
+        embedding = None
+    if not result.get("degraded"):
+        response_cache.put(query, response, embedding=embedding, scope=intent, generation=generation)
+    return response
+
+
+async def handle_query_async(query: str, deadline_s=None):
+    # asyncio variant of handle_query with concurrent retrieval and an
+    # overall request deadline
+    if deadline_s is None:
+        deadline_s = config.QUERY_DEADLINE_MS / 1000.0
+    trace = tracer.start(query)
+    state = {}
+    response = None
+    try:
+        if not deadline_s:
+            response = await _handle_query_async(query, float("inf"), state)
+        else:
+            response = await asyncio.wait_for(
+                _handle_query_async(query, time.monotonic() + deadline_s, state), timeout=deadline_s
+            )
+    except asyncio.TimeoutError:
+        logging.warning("Query exceeded %.0f ms deadline: %s", deadline_s * 1000, query)
+        response = _deadline_response(state.get("domain"), state.get("intent"))
+    finally:
+        tracer.finish(trace, _trace_engine(response, state.get("cached", False)))
+    return response
+
+
+def handle_queries(queries):
+    # Batched variant of handle_query: one vectorizer pass and one predict_proba
+    # per classifier, one hybrid retrieval pass and one transformer pipeline
+    # call for the whole batch. Batches bypass the response cache so offline
+    # replays always exercise the engines.
+    queries = list(queries)
+    if not queries:
+        return []
+    # Stage timings cover the whole batch
+    trace = tracer.start(f"<batch of {len(queries)}>")
+    try:
+        return _handle_queries(queries)
+    finally:
+        tracer.finish(trace, "BATCH")
+
+
+def _cascade_batch(engine, queries, models):
+    # One batched _cascade step: the accepted answer per query, or None
+    if engine == "HYBRID":
+        return [_hybrid_answer(hits) for hits in engine_manager.get("hybrid").search_batch(queries, top_k=3)]
+    return [_retrieval_answer(result) for result in models.retrieval.retrieve_batch(queries)]
+
+
+def _handle_queries(queries):
+    models = engine_manager.get("models").active()
+    with tracer.stage("classify"):
+        domains, intents = zip(*models.classify_batch(queries))
+    # One rules snapshot for the whole batch
+    with tracer.stage("guard"):
+        rules = routing_rules.current()
+        analyses = [rules.analyze(query) for query in queries]
+
+    responses = [None] * len(queries)
+    routed = {}
+    cascaded = []
+    transformer = []
+    for i, query in enumerate(queries):
+        domain, d_conf = domains[i]
+        intent, i_conf = intents[i]
+        if domain != "STUDENT":
+            responses[i] = _out_of_domain(domain, d_conf)
+        elif _is_forbidden(analyses[i]):
+            responses[i] = _integrity_block(domain, intent, predict_difficulty(query, analyses[i]), d_conf, i_conf)
+        elif _is_numeric(analyses[i], intent):
+            routed[i] = (calculate(query, analyses[i]), "CALCULATOR")
+        elif intent in ROUTED_INTENTS:
+            cascaded.append(i)
+        elif intent == "UNSAFE":
+            routed[i] = (rule_engine("Unsafe or blocked query"), "RULE")
+        else:
+            routed[i] = (rule_engine("Unknown engine"), "RULE")
+
+    if cascaded:
+        if models.router is None:
+            plans = [FIXED_CASCADE[intents[i][0]] for i in cascaded]
+        else:
+            with tracer.stage("router"):
+                plans = models.router.plan_batch([queries[i] for i in cascaded], [intents[i][0] for i in cascaded])
+        # Each round runs every query's next engine, one batched call per
+        # engine; queries left unanswered move on to their next engine
+        pending = {i: list(plan) for i, plan in zip(cascaded, plans)}
+        while True:
+            rounds = {}
+            for i, plan in pending.items():
+                if plan[0] != "TRANSFORMER":
+                    rounds.setdefault(plan.pop(0), []).append(i)
+            if not rounds:
+                break
+            for engine, batch in rounds.items():
+                for i, result in zip(batch, _cascade_batch(engine, [queries[i] for i in batch], models)):
+                    if result:
+                        routed[i] = (result, engine)
+                        del pending[i]
+        transformer.extend(pending)
+
+    if transformer:
+        transformer.sort()
+        with tracer.stage("transformer"):
+            results = explain_batch([queries[i] for i in transformer])
+        for i, result in zip(transformer, results):
+            routed[i] = (result, "TRANSFORMER")
+
+    for i, (result, engine) in routed.items():
+        domain, d_conf = domains[i]
+        intent, i_conf = intents[i]
+        responses[i] = _finalize(result, engine, domain, intent, predict_difficulty(queries[i], analyses[i]), d_conf, i_conf)
+
+    logging.info("Batch of %d queries: %d cascaded, %d transformer", len(queries), len(cascaded), len(transformer))
+    return responses
@@ -0,0 +1,187 @@
+import datetime
+import logging
+import os
+import threading
+import time
+
+import joblib
+
+import config
+from core.domain_classifier import DomainClassifier
+from core.fused_classifier import FUSED_PATH, FusedClassifier
+from core.intent_classifier import IntentClassifier
+from core.learned_router import ROUTER_PATH, LearnedRouter
+from engines.kb_store import open_store, store_generation
+from engines.retrieval_engine import RetrievalEngine
+
+WARMUP_QUERIES = [
+    "What is the minimum attendance required?",
+    "Explain the grading system",
+    "Calculate CGPA for 8.5 and 9.0",
+]
+
+
+# Everything one request needs from the trainable models, loaded together so a
+# request never mixes heads from two different versions
+class ModelBundle:
+    def __init__(self, version, source, domain, intent, retrieval, fused=None, router=None, artifact=None):
+        self.version = version
+        # What triggered the load ("manual", "online-v3", ...) and which
+        # classifier artifact it chose
+        self.source = source
+        self.artifact = artifact or source
+        self.domain = domain
+        self.intent = intent
+        self.retrieval = retrieval
+        self.fused = fused
+        # Learned engine order; None keeps the fixed cascade
+        self.router = router
+        # Knowledge base the retrieval engine was built over
+        self.kb_generation = store_generation()
+        self.loaded_at = datetime.datetime.utcnow().isoformat()
+
+    def classify(self, query: str):
+        return self.classify_batch([query])[0]
+
+    def classify_batch(self, queries):
+        # ((domain, conf), (intent, conf)) per query; the fused artifact
+        # featurizes each query once for both heads
+        if self.fused is not None:
+            return self.fused.predict_heads(queries, ("domain", "intent"))
+        return list(zip(self.domain.predict_batch(queries), self.intent.predict_batch(queries)))
+
+
+def _published_at(*paths):
+    # When an artifact was last published (its newest file), None if incomplete
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    return max(os.path.getmtime(path) for path in paths)
+
+
+def choose_artifact():
+    # The most recently published classifier artifact: incremental online
+    # heads, the fused artifact from ml/train.py, or the per-head baseline
+    # models (also written by ml/train.py). A fused publish rewrites the
+    # baseline files too, so ties go to the fused artifact.
+    online_dir = config.ONLINE_MODELS_DIR
+    candidates = [
+        ("fused", _published_at(FUSED_PATH)),
+        ("online", _published_at(os.path.join(online_dir, "domain_online.pkl"),
+                                  os.path.join(online_dir, "intent_online.pkl"))),
+        ("baseline", _published_at(*(os.path.join("models", f"{name}_{kind}.pkl")
+                                     for name in ("domain", "intent") for kind in ("model", "vectorizer")))),
+    ]
+    published = [(at, -rank, name) for rank, (name, at) in enumerate(candidates) if at is not None]
+    return max(published)[2] if published else "baseline"
+
+
+def load_bundle(version, source=None):
+    fused = None
+    artifact = choose_artifact()
+    if artifact == "online":
+        domain = joblib.load(os.path.join(config.ONLINE_MODELS_DIR, "domain_online.pkl"))
+        intent = joblib.load(os.path.join(config.ONLINE_MODELS_DIR, "intent_online.pkl"))
+    elif artifact == "fused":
+        fused = FusedClassifier()
+        domain = fused.head("domain")
+        intent = fused.head("intent")
+        artifact = f"fused-{fused.version}"
+    else:
+        domain = DomainClassifier()
+        intent = IntentClassifier()
+    router = None
+    if config.ROUTER_ENABLED and os.path.exists(ROUTER_PATH):
+        router = LearnedRouter(min_success=config.ROUTER_MIN_SUCCESS)
+    # Picks up a rebuilt store or edited JSON sources
+    open_store(refresh=True)
+    retrieval = RetrievalEngine(scoring=config.RETRIEVAL_SCORING)
+    return ModelBundle(version, source or artifact, domain, intent, retrieval, fused, router, artifact)
+
+
+def warm_up(bundle, queries=WARMUP_QUERIES):
+    bundle.classify_batch(queries)
+    bundle.retrieval.retrieve_batch(queries)
+    if bundle.router is not None:
+        bundle.router.plan_batch(queries, ["FACTUAL"] * len(queries))
+    for query in queries:
+        bundle.classify(query)
+        bundle.retrieval.retrieve(query)
+
+
+# Holds the active ModelBundle behind a single reference. Reloads build and
+# warm the next bundle off the request path, then swap it in with one
+# assignment; concurrent reload requests coalesce into one follow-up load.
+class ModelRegistry:
+    def __init__(self, loader=load_bundle):
+        self.loader = loader
+        self.listeners = []
+        self._active = None
+        self._version = 0
+        self._build_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._loading = False
+        self._pending_source = None
+        self.last_error = None
+
+    def active(self):
+        bundle = self._active
+        if bundle is None:
+            with self._build_lock:
+                if self._active is None:
+                    self._active = self._build(None)
+                bundle = self._active
+        return bundle
+
+    def _build(self, source):
+        started = time.perf_counter()
+        self._version += 1
+        bundle = self.loader(self._version, source)
+        warm_up(bundle)
+        logging.info(f"Model bundle v{bundle.version} ({bundle.source}, {bundle.artifact} heads) loaded in {time.perf_counter() - started:.2f}s")
+        return bundle
+
+    def reload(self, source=None):
+        with self._build_lock:
+            bundle = self._build(source)
+            self._active = bundle
+        for listener in list(self.listeners):
+            listener(bundle)
+        return bundle
+
+    def reload_async(self, source=None):
+        with self._state_lock:
+            self._pending_source = source or "reload"
+            if self._loading:
+                return
+            self._loading = True
+        threading.Thread(target=self._reload_loop, name="model-reload", daemon=True).start()
+
+    def _reload_loop(self):
+        while True:
+            with self._state_lock:
+                source, self._pending_source = self._pending_source, None
+                if source is None:
+                    self._loading = False
+                    return
+            try:
+                self.reload(source)
+                self.last_error = None
+            except Exception as e:
+                # Keep serving the previous bundle
+                self.last_error = str(e)
+                logging.error(f"Model reload failed, keeping v{self._active.version if self._active else None}: {e}")
+
+    def status(self):
+        bundle = self._active
+        return {
+            "version": bundle.version if bundle else None,
+            "source": bundle.source if bundle else None,
+            "artifact": bundle.artifact if bundle else None,
+            "loaded_at": bundle.loaded_at if bundle else None,
+            "router": bundle.router.version if bundle and bundle.router else None,
+            "reloading": self._loading,
+            "last_error": self.last_error,
+        }
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,162 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+_PUNCT = re.compile(r"[^\w\s%.]|(?<!\d)\.|\.(?!\d)")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_query(query: str):
+    # Case, punctuation and whitespace differences map to the same key;
+    # decimal points are kept so numeric queries stay distinct
+    return _SPACES.sub(" ", _PUNCT.sub(" ", query.lower())).strip()
+
+
+class _Entry:
+    __slots__ = ("response", "expires", "scope", "slot")
+
+    def __init__(self, response, expires, scope, slot):
+        self.response = response
+        self.expires = expires
+        self.scope = scope
+        self.slot = slot
+
+
+# Two-tier answer cache: an exact tier keyed on normalized query text and a
+# semantic tier that matches query embeddings by cosine similarity. Both share
+# one bounded LRU with a TTL; embeddings live in a preallocated matrix so a
+# semantic lookup is a single matrix-vector product.
+class ResponseCache:
+    def __init__(self, max_entries=1024, ttl_s=600.0, semantic_threshold=0.95, enabled=True):
+        self.enabled = enabled
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl_s
+        self.semantic_threshold = semantic_threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._slot_keys = [None] * self.max_entries
+        self._scopes = np.empty(self.max_entries, dtype=object)
+        self._used = np.zeros(self.max_entries, dtype=bool)
+        self._free = list(range(self.max_entries - 1, -1, -1))
+        # Bumped on invalidation so answers computed before it are not stored
+        self.generation = 0
+        self.lookups = 0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, query):
+        if not self.enabled:
+            return None
+        key = normalize_query(query)
+        with self._lock:
+            self.lookups += 1
+            entry = self._entries.get(key)
+            if entry is not None and self._alive(key, entry):
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return dict(entry.response)
+            return None
+
+    def get_semantic(self, embedding, scope):
+        # Only entries stored under the same scope (e.g. the intent) can match
+        if not self.enabled:
+            return None
+        with self._lock:
+            if self._vectors is None:
+                return None
+            candidates = self._used & (self._scopes == scope)
+            if not candidates.any():
+                return None
+            sims = self._vectors @ _unit(embedding)
+            sims[~candidates] = -np.inf
+            slot = int(np.argmax(sims))
+            if sims[slot] < self.semantic_threshold:
+                return None
+            key = self._slot_keys[slot]
+            entry = self._entries.get(key)
+            if entry is None or not self._alive(key, entry):
+                return None
+            self._entries.move_to_end(key)
+            self.semantic_hits += 1
+            return dict(entry.response)
+
+    def put(self, query, response, embedding=None, scope=None, generation=None):
+        if not self.enabled:
+            return
+        key = normalize_query(query)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._release(old)
+            while len(self._entries) >= self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._release(evicted)
+                self.evictions += 1
+            slot = None
+            if embedding is not None and scope is not None:
+                vector = _unit(embedding)
+                if self._vectors is None:
+                    self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                slot = self._free.pop()
+                self._vectors[slot] = vector
+                self._slot_keys[slot] = key
+                self._scopes[slot] = scope
+                self._used[slot] = True
+            self._entries[key] = _Entry(dict(response), time.monotonic() + self.ttl, scope, slot)
+
+    def invalidate(self, *args):
+        # Accepts and ignores listener arguments so it can be registered directly
+        with self._lock:
+            self._entries.clear()
+            self._slot_keys = [None] * self.max_entries
+            self._scopes[:] = None
+            self._used[:] = False
+            self._free = list(range(self.max_entries - 1, -1, -1))
+            self.generation += 1
+            self.invalidations += 1
+
+    def stats(self):
+        hits = self.exact_hits + self.semantic_hits
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "semantic_entries": int(self._used.sum()),
+            "max_entries": self.max_entries,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.lookups - hits,
+            "hit_rate": round(hits / self.lookups, 4) if self.lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    def _alive(self, key, entry):
+        if entry.expires > time.monotonic():
+            return True
+        del self._entries[key]
+        self._release(entry)
+        self.expirations += 1
+        return False
+
+    def _release(self, entry):
+        if entry.slot is not None:
+            self._used[entry.slot] = False
+            self._slot_keys[entry.slot] = None
+            self._scopes[entry.slot] = None
+            self._free.append(entry.slot)
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
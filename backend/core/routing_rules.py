@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import config
+from engines.calculator import OPERATIONS
+
+NUMBER = re.compile(r"\d+\.\d+|\d+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(query: str):
+    return _SPACES.sub(" ", query.lower()).strip()
+
+
+# Everything the routing rules say about one query, computed once per request
+# and shared by the guard, calculator dispatch, risk and difficulty checks
+class QueryAnalysis:
+    __slots__ = ("query", "normalized", "numbers", "matches", "calculator_op", "risk", "difficulty")
+
+    def __init__(self, query, normalized, numbers, matches, calculator_op, risk, difficulty):
+        self.query = query
+        self.normalized = normalized
+        self.numbers = numbers
+        # group -> set of matched rule values, e.g. {"calculator": {"average"}}
+        self.matches = matches
+        self.calculator_op = calculator_op
+        self.risk = risk
+        self.difficulty = difficulty
+
+    @property
+    def forbidden(self):
+        return "guard" in self.matches
+
+    @property
+    def numeric(self):
+        return "numeric" in self.matches
+
+
+# One rules file compiled into a single regex: every keyword of every group is
+# an alternative inside a lookahead, so one scan finds the longest keyword at
+# each position, overlapping matches included.
+class RoutingRules:
+    def __init__(self, spec):
+        tags = {}
+
+        def add(group, value, keywords):
+            for keyword in keywords:
+                tags.setdefault(normalize(keyword), set()).add((group, value))
+
+        add("guard", "forbidden", spec["guard"]["forbidden"])
+        add("numeric", "numeric", spec["numeric"]["keywords"])
+        self.calculator = []
+        for rule in spec["calculator"]:
+            if rule["op"] not in OPERATIONS:
+                raise ValueError(f"unknown calculator op {rule['op']!r}")
+            add("calculator", rule["op"], rule["keywords"])
+            self.calculator.append((rule["op"], rule.get("min_numbers", 0), rule.get("max_numbers")))
+        tags.pop("", None)
+
+        # Only the longest keyword at a position is reported, so each keyword
+        # also carries the tags of every shorter keyword it contains
+        self._tags = {
+            keyword: set().union(*(tags[other] for other in tags if other in keyword))
+            for keyword in tags
+        }
+        alternatives = "|".join(re.escape(keyword) for keyword in sorted(tags, key=len, reverse=True))
+        self._pattern = re.compile(f"(?=({alternatives}))") if tags else None
+        self.high_risk_prefixes = tuple(normalize(p) for p in spec["risk"]["high_risk_prefixes"])
+        self.easy_below_words = spec["difficulty"]["easy_below_words"]
+        self.medium_below_words = spec["difficulty"]["medium_below_words"]
+
+    def analyze(self, query: str):
+        normalized = normalize(query)
+        matches = {}
+        if self._pattern is not None:
+            for match in self._pattern.finditer(normalized):
+                for group, value in self._tags[match.group(1)]:
+                    matches.setdefault(group, set()).add(value)
+        numbers = [float(n) for n in NUMBER.findall(query)]
+        return QueryAnalysis(
+            query,
+            normalized,
+            numbers,
+            matches,
+            self._calculator_op(matches.get("calculator", ()), len(numbers)),
+            "HIGH_RISK" if normalized.startswith(self.high_risk_prefixes) else "LOW_RISK",
+            self._difficulty(len(query.split())),
+        )
+
+    def _calculator_op(self, ops, count):
+        # First rule, in file order, whose keywords matched and whose number
+        # count fits
+        for op, min_numbers, max_numbers in self.calculator:
+            if op in ops and count >= min_numbers and (max_numbers is None or count <= max_numbers):
+                return op
+        return None
+
+    def _difficulty(self, words):
+        if words < self.easy_below_words:
+            return "EASY"
+        if words < self.medium_below_words:
+            return "MEDIUM"
+        return "HARD"
+
+
+# Serves the compiled rules behind one reference and recompiles them when the
+# file changes, checked at most every check_interval_s. A file that fails to
+# parse or compile is logged and the previous rules stay active.
+class RoutingRulesLoader:
+    def __init__(self, path, check_interval_s=2.0):
+        self.path = path
+        self.check_interval_s = check_interval_s
+        self.listeners = []
+        self.version = 0
+        self.loaded_at = None
+        self.last_error = None
+        self._rules = None
+        self._mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def current(self):
+        now = time.monotonic()
+        if self._rules is None or now >= self._next_check:
+            self._next_check = now + self.check_interval_s
+            self._refresh(force=False)
+        return self._rules
+
+    def analyze(self, query: str):
+        return self.current().analyze(query)
+
+    def reload(self):
+        self._refresh(force=True)
+        return self.status()
+
+    def _refresh(self, force):
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if not force and self._rules is not None and mtime == self._mtime:
+                    return
+                with open(self.path, "r", encoding="utf-8") as f:
+                    rules = RoutingRules(json.load(f))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                self.last_error = str(e)
+                if self._rules is None:
+                    raise
+                logging.error(f"Routing rules reload failed, keeping v{self.version}: {e}")
+                return
+            self._rules = rules
+            self._mtime = mtime
+            self.version += 1
+            self.loaded_at = time.time()
+            self.last_error = None
+        logging.info(f"Routing rules v{self.version} loaded from {self.path}")
+        for listener in list(self.listeners):
+            listener(rules)
+
+    def status(self):
+        return {
+            "path": self.path,
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "last_error": self.last_error,
+        }
+
+
+routing_rules = RoutingRulesLoader(config.ROUTING_RULES_PATH, config.ROUTING_RULES_CHECK_S)
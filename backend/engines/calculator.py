@@ -1,27 +1,27 @@
-import re
 import logging
 
-def calculate(query: str):
-    nums = list(map(float, re.findall(r"\d+\.\d+|\d+", query)))
-    answer = None
-    ql = query.lower()
-    logging.info(f"Calculator query: {query}")
-    logging.info(f"Extracted numbers: {nums}")
-    if "multiply" in ql and len(nums) >= 2:
-        answer = str(nums[0] * nums[1])
-        logging.info(f"Calculation type: multiply | Answer: {answer}")
-    elif "add" in ql and len(nums) >= 2:
-        answer = str(sum(nums))
-        logging.info(f"Calculation type: add | Answer: {answer}")
-    elif ("percentage" in ql or "percent" in ql) and len(nums) == 2:
-        answer = f"{round((nums[0] / nums[1]) * 100, 2)}%"
-        logging.info(f"Calculation type: percentage | Answer: {answer}")
-    elif ("average" in ql or "cgpa" in ql or "gpa" in ql) and len(nums) >= 2:
-        answer = f"{round(sum(nums) / len(nums), 2)}"
-        logging.info(f"Calculation type: average/cgpa/gpa | Answer: {answer}")
+# Operations the routing rules can dispatch to; which keywords select them is
+# declared in datasets/routing_rules.json
+OPERATIONS = {
+    "multiply": lambda nums: str(nums[0] * nums[1]),
+    "add": lambda nums: str(sum(nums)),
+    "percentage": lambda nums: f"{round((nums[0] / nums[1]) * 100, 2)}%",
+    "average": lambda nums: f"{round(sum(nums) / len(nums), 2)}",
+}
+
+def calculate(query: str, analysis=None):
+    if analysis is None:
+        from core.routing_rules import routing_rules
+        analysis = routing_rules.analyze(query)
+    nums = analysis.numbers
+    logging.debug("Calculator query: %s", query)
+    logging.debug("Extracted numbers: %s", nums)
+    op = analysis.calculator_op
+    if op is not None:
+        answer = OPERATIONS[op](nums)
     else:
         answer = "Calculation not supported."
-        logging.info(f"Calculation type: unsupported | Answer: {answer}")
+    logging.debug("Calculation type: %s | Answer: %s", op or "unsupported", answer)
     return {
         "answer": answer,
         "confidence": 1.0,
@@ -0,0 +1,120 @@
+import json
+import os
+
+import numpy as np
+
+# Sentence encoders behind one interface: encode(texts) -> float32 array, as
+# sentence-transformers' SentenceTransformer.encode. "torch" runs the
+# sentence-transformers model eagerly; "onnx" runs the graph written by
+# export_onnx_encoder.py, which includes mean pooling and normalization, on
+# ONNX Runtime with only the tokenizers library in front of it.
+#
+#   <onnx_dir>/encoder_manifest.json   model, pooling, max_seq_length and the
+#                                      parity result of each exported variant
+#   <onnx_dir>/model.onnx              fp32 export
+#   <onnx_dir>/model.int8.onnx         dynamically quantized export (optional)
+#   <onnx_dir>/tokenizer.json          the model's fast tokenizer
+
+BACKENDS = ('torch', 'onnx')
+ONNX_MANIFEST = 'encoder_manifest.json'
+ONNX_VARIANTS = {'fp32': 'model.onnx', 'int8': 'model.int8.onnx'}
+
+
+def load_encoder(model_name, backend='torch', onnx_dir=None, variant='int8', threads=0):
+    if backend == 'torch':
+        # Imported here so torch is only loaded when this backend is chosen
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    if backend == 'onnx':
+        return OnnxEncoder(onnx_dir, model_name=model_name, variant=variant, threads=threads)
+    raise ValueError(f"Unknown encoder backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+
+
+def read_onnx_manifest(onnx_dir):
+    path = os.path.join(onnx_dir, ONNX_MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class OnnxEncoder:
+    def __init__(self, onnx_dir, model_name=None, variant='int8', threads=0, require_parity=True):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("The onnx encoder backend needs onnxruntime and tokenizers "
+                              "(pip install onnxruntime tokenizers)") from e
+        manifest = read_onnx_manifest(onnx_dir)
+        if manifest is None:
+            raise FileNotFoundError(f"No ONNX encoder in {onnx_dir}; run export_onnx_encoder.py")
+        problems = []
+        if model_name and manifest.get('model') != model_name:
+            problems.append(f"model {manifest.get('model')!r} != {model_name!r}")
+        exported = manifest.get('variants', {}).get(variant)
+        if exported is None:
+            problems.append(f"variant {variant!r} was not exported")
+        elif require_parity and not exported.get('parity', {}).get('passed'):
+            # An export that drifted from the index would silently change which
+            # records queries match
+            problems.append(f"variant {variant!r} failed its parity check")
+        if problems:
+            raise ValueError(f"ONNX encoder {onnx_dir} cannot be used: {'; '.join(problems)}")
+
+        self.manifest = manifest
+        self.variant = variant
+        self.model_name = manifest['model']
+        self.dim = manifest['dim']
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(onnx_dir, exported['file']), options, providers=['CPUExecutionProvider']
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(onnx_dir, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=manifest['max_seq_length'])
+        self.tokenizer.enable_padding(pad_id=manifest['pad_token_id'], pad_token=manifest['pad_token'])
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, show_progress_bar=False, **kwargs):
+        # Same call shape as SentenceTransformer.encode; always returns numpy.
+        # Texts are batched in length order so each batch pads to similar lengths.
+        if isinstance(texts, str):
+            return self.encode([texts], batch_size)[0]
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            out[rows] = self._run([texts[i] for i in rows])
+        return out
+
+    def _run(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            'input_ids': np.array([e.ids for e in encodings], dtype=np.int64),
+            'attention_mask': np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            'token_type_ids': np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        return self.session.run(None, {name: v for name, v in feeds.items() if name in self.input_names})[0]
+
+
+def cosine_parity(embeddings, reference, tolerance):
+    # Row-wise cosine between two encodings of the same texts; passes when no
+    # row drifts below 1 - tolerance
+    a = np.asarray(embeddings, dtype=np.float32)
+    b = np.asarray(reference, dtype=np.float32)
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    cos = np.sum(a * b, axis=1)
+    return {
+        'count': int(len(cos)),
+        'min_cosine': round(float(cos.min()), 6) if len(cos) else None,
+        'mean_cosine': round(float(cos.mean()), 6) if len(cos) else None,
+        'tolerance': tolerance,
+        'passed': bool(len(cos)) and bool(cos.min() >= 1.0 - tolerance),
+    }
@@ -1,40 +1,165 @@
 import faiss
 import json
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from pathlib import Path
+from core.latency import tracer
+from engines.batch_encoder import BatchingEncoder
+from engines.encoder import load_encoder
+from engines.kb_store import load_corpus, open_store, store_generation
+
+# Map the index file instead of copying it into each worker's heap; flat codes
+# stay on disk and are paged in through the shared page cache
+MMAP_FLAGS = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
 
 class FaissSemanticEngine:
-    def __init__(self, index_path=None, mapping_path=None, data_path=None, threshold=0.7):
+    def __init__(self, index_path=None, mapping_path=None, data_path=None, threshold=0.7,
+                 batching=False, max_batch_size=32, max_wait_ms=5.0, manifest_path=None,
+                 model_name='all-MiniLM-L6-v2', nprobe=None, ef_search=None, mmap=True, store=None,
+                 encoder_backend='torch', onnx_dir=None, onnx_variant='int8', onnx_threads=0, reuse=None):
         base = Path(__file__).parent.parent / 'datasets'
         self.index_path = index_path or (base / 'knowledge_base_faiss.index')
         self.mapping_path = mapping_path or (base / 'knowledge_base_faiss_mapping.json')
         self.data_path = data_path or (base / 'knowledge_base_vector.jsonl')
+        self.manifest_path = Path(manifest_path or (base / 'knowledge_base_faiss_manifest.json'))
         self.threshold = threshold
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.index = faiss.read_index(str(self.index_path))
+        self.model_name = model_name
+        # torch or ONNX Runtime; either way the index manifest is checked
+        # against model_name below. A rebuild over a changed knowledge base
+        # reuses the previous engine's encoder and batching queue.
+        if reuse is not None:
+            self.model = reuse.model
+        else:
+            self.model = load_encoder(model_name, encoder_backend, onnx_dir, onnx_variant, onnx_threads)
+        self.index = faiss.read_index(str(self.index_path), MMAP_FLAGS if mmap else 0)
+        self.manifest = self._load_manifest()
+        self.metric = self.manifest['metric']
+        self._tune(nprobe, ef_search)
+        # Records come from the memory-mapped store when one is built, and
+        # are otherwise parsed from the JSON sources into this process
+        self.store = store or open_store()
+        self.kb_generation = store_generation()
+        if self.store is None:
+            self._load_records()
+        # Concurrent searches share one forward pass through the batching queue
+        if reuse is not None:
+            self.encoder = reuse.encoder
+        else:
+            self.encoder = BatchingEncoder(self.model, max_batch_size, max_wait_ms) if batching else None
+
+    def _load_records(self):
         with open(self.mapping_path, 'r', encoding='utf-8') as f:
-            self.id_map = json.load(f)
-        with open(self.data_path, 'r', encoding='utf-8') as f:
-            self.records = [json.loads(line) for line in f]
+            mapping = json.load(f)
+        # Legacy indexes map positions to ids with a list; IndexIDMap indexes
+        # map int64 labels to {"id", "hash"} entries
+        if isinstance(mapping, list):
+            self.label_to_id = dict(enumerate(mapping))
+        else:
+            self.label_to_id = {int(label): entry['id'] for label, entry in mapping.items()}
+        self.records = {rec['id']: rec for rec in load_corpus(self.data_path)}
+
+    def _load_manifest(self):
+        if not self.manifest_path.exists():
+            # Index built before manifests existed: IndexFlatL2 over MiniLM
+            return {'model': 'all-MiniLM-L6-v2', 'dim': self.index.d, 'metric': 'l2',
+                    'index_type': 'flat', 'count': self.index.ntotal, 'id_map': False}
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        problems = []
+        if manifest.get('model') != self.model_name:
+            problems.append(f"model {manifest.get('model')!r} != {self.model_name!r}")
+        if manifest.get('dim') != self.index.d:
+            problems.append(f"dim {manifest.get('dim')} != index dim {self.index.d}")
+        if manifest.get('metric') not in ('cosine', 'l2'):
+            problems.append(f"unknown metric {manifest.get('metric')!r}")
+        if manifest.get('count') != self.index.ntotal:
+            problems.append(f"count {manifest.get('count')} != index size {self.index.ntotal}")
+        if problems:
+            raise ValueError(f"FAISS manifest {self.manifest_path} does not match: {'; '.join(problems)}")
+        return manifest
+
+    def _tune(self, nprobe, ef_search):
+        index = self.index
+        if isinstance(index, faiss.IndexIDMap):
+            index = faiss.downcast_index(index.index)
+        if nprobe and hasattr(index, 'nprobe'):
+            index.nprobe = nprobe
+        if ef_search and hasattr(index, 'hnsw'):
+            index.hnsw.efSearch = ef_search
+
+    def encode(self, texts):
+        # Already-batched inputs go straight to the model
+        with tracer.stage("faiss_encode"):
+            if self.encoder is not None and len(texts) == 1:
+                return self.encoder.encode(texts)
+            return self.model.encode(texts, convert_to_numpy=True)
+
+    def search_topk(self, query, top_k=3, embedding=None):
+        # Encode once and scan the index once; every hit carries its own scores.
+        # Callers that already encoded the query can pass the embedding in.
+        if embedding is not None:
+            return self.search_embeddings(np.asarray(embedding, dtype=np.float32).reshape(1, -1), top_k)[0]
+        return self.search_batch([query], top_k=top_k)[0]
+
+    def search_batch(self, queries, top_k=3):
+        # One encode and one index scan for the whole batch of queries
+        return self.search_embeddings(self.encode(queries), top_k)
+
+    def _search(self, query_embs, top_k):
+        query_embs = np.array(query_embs, dtype=np.float32)
+        if self.metric == 'cosine':
+            faiss.normalize_L2(query_embs)
+        with tracer.stage("faiss_search"):
+            return self.index.search(query_embs, top_k)
+
+    def search_embeddings(self, query_embs, top_k=3):
+        D, I = self._search(query_embs, top_k)
+        return [self._hits(ids, scores) for ids, scores in zip(I, D)]
+
+    def search_labels(self, query_embs, top_k=3):
+        # Cosine similarities and raw FAISS labels (-1 past the index size),
+        # best first, for callers that resolve labels themselves
+        D, I = self._search(query_embs, top_k)
+        return self._similarity(D), I
+
+    def _similarity(self, score):
+        if self.metric == 'cosine':
+            # Inner product of unit vectors is the cosine similarity
+            return score
+        # Squared L2 between unit-length MiniLM embeddings: cos = 1 - d^2 / 2
+        return 1.0 - score / 2.0
+
+    def _record(self, label):
+        if self.store is not None:
+            return self.store.record(label)
+        return self.records[self.label_to_id[label]]
+
+    def _hits(self, ids, scores):
+        hits = []
+        for label, score in zip(ids, scores):
+            if label < 0:
+                # FAISS pads with -1 when top_k exceeds the index size
+                continue
+            record = self._record(int(label))
+            if record is None:
+                continue
+            hits.append({
+                'id': record['id'],
+                'text': record['text'],
+                'metadata': record['metadata'],
+                # Raw index score: squared L2 distance (lower is better) or
+                # inner product (higher is better), depending on the metric
+                'score': float(score),
+                'similarity': float(self._similarity(score)),
+            })
+        return hits
 
     def search(self, query, top_k=1):
-        query_emb = self.model.encode([query], convert_to_numpy=True)
-        D, I = self.index.search(query_emb, top_k)
-        best_idx = I[0][0]
-        best_score = D[0][0]
-        # FAISS returns L2 distance, lower is better. Convert to similarity (optional)
-        # For thresholding, you may want to use a max distance or compute cosine similarity
-        record = self.records[best_idx]
-        # Optionally, add a threshold check here
-        return {
-            'id': record['id'],
-            'text': record['text'],
-            'metadata': record['metadata'],
-            'score': float(best_score)
-        }
+        hits = self.search_topk(query, top_k=top_k)
+        return hits[0] if hits else None
 
 # Example usage:
 # engine = FaissSemanticEngine()
 # result = engine.search('What is the grading system?')
 # print(result)
+# hits = engine.search_topk('What is the grading system?', top_k=3)
+# print([(h['id'], h['score'], h['similarity']) for h in hits])
@@ -0,0 +1,122 @@
+import numpy as np
+
+from core.latency import tracer
+from engines.kb_store import load_corpus, open_store
+from engines.retrieval_engine import fit_tfidf
+
+
+def calibrate(similarity, threshold):
+    # Piecewise-linear map that puts each modality's old pass mark at 0.5 and
+    # 1.0 at 1.0, so dense and sparse cosines can be combined on one scale
+    s = np.clip(similarity, 0.0, 1.0)
+    return np.where(s < threshold, 0.5 * s / threshold, 0.5 + 0.5 * (s - threshold) / (1.0 - threshold))
+
+
+# Scores every query against dense (MiniLM/FAISS) and sparse (TF-IDF) views of
+# one shared corpus and fuses them, so a FACTUAL query costs one encode, one
+# index scan and one sparse matmul whichever side ends up finding the answer.
+class HybridRetriever:
+    def __init__(self, dense, fusion='weighted', dense_weight=0.6, rrf_k=60, candidates=20,
+                 dense_threshold=0.35, sparse_threshold=0.8, store=None):
+        if fusion not in ('weighted', 'rrf'):
+            raise ValueError(f"unknown fusion {fusion!r}")
+        self.dense = dense
+        self.fusion = fusion
+        self.dense_weight = dense_weight
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        self.dense_threshold = dense_threshold
+        self.sparse_threshold = sparse_threshold
+        store = store or dense.store or open_store()
+        if store is not None:
+            self.docs = store.records
+            self.vectorizer, self.matrix = store.tfidf['records']
+            self._row = store.row
+            indexed_rows = store.indexed_rows()
+        else:
+            self.docs = load_corpus(dense.data_path)
+            self.vectorizer, self.matrix = fit_tfidf([doc['text'] for doc in self.docs])
+            rows = {doc['id']: i for i, doc in enumerate(self.docs)}
+            label_rows = {label: rows[rid] for label, rid in dense.label_to_id.items() if rid in rows}
+            self._row = label_rows.get
+            indexed_rows = list(label_rows.values())
+        # Documents with no vector in the FAISS index (added since it was
+        # built) are scored on TF-IDF alone
+        self.indexed = np.zeros(len(self.docs), dtype=bool)
+        self.indexed[indexed_rows] = True
+
+    def search(self, query, top_k=3, embedding=None):
+        embeddings = None if embedding is None else np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        return self.search_batch([query], top_k=top_k, embeddings=embeddings)[0]
+
+    def search_batch(self, queries, top_k=3, embeddings=None):
+        return self.fuse_batch(self.dense_search(queries, embeddings), self.sparse_search(queries), top_k)
+
+    # The two halves of search_batch, for callers that run them concurrently
+
+    def dense_search(self, queries, embeddings=None):
+        if embeddings is None:
+            embeddings = self.dense.encode(queries)
+        return self.dense.search_labels(embeddings, self.candidates)
+
+    def sparse_search(self, queries):
+        # TF-IDF rows are L2-normalized, so the matmul gives cosine similarities
+        with tracer.stage("tfidf"):
+            return (self.vectorizer.transform(queries) @ self.matrix.T).toarray()
+
+    def fuse_batch(self, dense, sparse_sims, top_k=3):
+        dense_sims, dense_labels = dense
+        return [
+            self._fuse(dense_sims[i], dense_labels[i], sparse_sims[i], top_k)
+            for i in range(len(sparse_sims))
+        ]
+
+    def _fuse(self, dense_sims, dense_labels, sparse_sims, top_k):
+        dense = {}
+        for label, sim in zip(dense_labels, dense_sims):
+            row = self._row(int(label)) if label >= 0 else None
+            if row is not None:
+                dense[row] = float(sim)
+        # An indexed document outside a full dense list scores at most its
+        # last entry
+        full = (dense_labels >= 0).sum() == self.candidates
+        floor = float(dense_sims[-1]) if full else 0.0
+
+        n = min(self.candidates, len(sparse_sims))
+        sparse_top = np.argpartition(-sparse_sims, n - 1)[:n] if n else []
+        rows = np.array(sorted(set(dense) | {int(r) for r in sparse_top}), dtype=np.int64)
+        if not len(rows):
+            return []
+        d = np.array([dense.get(int(r), floor) for r in rows])
+        s = sparse_sims[rows]
+        sparse_score = calibrate(s, self.sparse_threshold)
+        score = np.where(
+            self.indexed[rows],
+            self.dense_weight * calibrate(d, self.dense_threshold) + (1.0 - self.dense_weight) * sparse_score,
+            sparse_score,
+        )
+        if self.fusion == 'rrf':
+            # Rank by reciprocal-rank fusion; the calibrated score is still
+            # what callers threshold on
+            dense_rank = np.argsort(np.argsort(-d, kind='stable'), kind='stable') + 1
+            sparse_rank = np.argsort(np.argsort(-s, kind='stable'), kind='stable') + 1
+            key = (self.dense_weight / (self.rrf_k + dense_rank)
+                   + (1.0 - self.dense_weight) / (self.rrf_k + sparse_rank))
+        else:
+            key = score
+        order = np.argsort(-key, kind='stable')[:top_k]
+        return [self._candidate(int(rows[i]), score[i], d[i], s[i]) for i in order]
+
+    def _candidate(self, row, score, dense, sparse):
+        doc = self.docs[row]
+        metadata = doc.get('metadata') or {}
+        return {
+            'id': doc['id'],
+            'text': doc['text'],
+            'answer': metadata.get('answer', doc['text']),
+            'metadata': metadata,
+            'source': metadata.get('source'),
+            'score': round(float(score), 4),
+            'dense': round(float(dense), 4),
+            'sparse': round(float(sparse), 4),
+        }
@@ -0,0 +1,294 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import struct
+import threading
+import zipfile
+from pathlib import Path
+
+import joblib
+import numpy as np
+import scipy.sparse as sp
+
+import config
+
+# Read-only, memory-mapped knowledge base shared by every worker process.
+#
+#   records.{id,text,metadata}.bin   UTF-8 blobs, row i at offsets[i]:offsets[i + 1]
+#   records.*.offsets.npy            int64 offsets into the blobs
+#   labels.npy / label_rows.npy      sorted FAISS labels and the record row of each
+#   qa.{question,answer,category}.*  question/answer pairs used by TF-IDF retrieval
+#   {qa,records}_tfidf.npz           uncompressed CSR matrices, mapped in place
+#   {qa,records}_vectorizer.pkl      their fitted TfidfVectorizers
+#   manifest.json                    counts and fingerprints of the source files
+#
+# Pages are shared through the OS page cache, so N workers hold one copy.
+
+STORE_VERSION = 2
+BASE = Path(__file__).parent.parent / 'datasets'
+RECORDS_PATH = BASE / 'knowledge_base_vector.jsonl'
+FACTS_PATH = BASE / 'knowledge_base.json'
+RECORD_COLUMNS = ('id', 'text', 'metadata')
+QA_COLUMNS = ('question', 'answer', 'category')
+JSON_COLUMNS = ('metadata', 'category')
+
+
+def load_qa_entries(path=FACTS_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        facts = json.load(f)['facts']
+    # Only use entries with a 'question' key for TF-IDF fitting
+    return [entry for entry in facts if 'question' in entry]
+
+
+def fact_record(entry):
+    # A curated QA fact as a corpus record: matched on its question, answered
+    # with its answer
+    return {
+        'id': f"fact:{hashlib.sha1(entry['question'].encode('utf-8')).hexdigest()[:12]}",
+        'text': entry['question'],
+        'metadata': {
+            'answer': entry['answer'],
+            'category': entry.get('category'),
+            'source': entry.get('category'),
+        },
+    }
+
+
+def load_corpus(records_path=RECORDS_PATH, facts_path=FACTS_PATH):
+    # Regulation chunks plus the QA facts: the one corpus indexed both by
+    # FAISS and by TF-IDF for hybrid retrieval
+    with open(records_path, 'r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if os.path.exists(facts_path):
+        records.extend(fact_record(entry) for entry in load_qa_entries(facts_path))
+    return records
+
+
+def _memmap(path):
+    if os.path.getsize(path) == 0:
+        # np.memmap refuses empty files
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode='r')
+
+
+class Column:
+    def __init__(self, directory, name):
+        self.offsets = np.load(directory / f'{name}.offsets.npy', mmap_mode='r')
+        self.blob = _memmap(directory / f'{name}.bin')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+
+class Table:
+    # Sequence of dict rows, decoded from the mapped columns on access
+    def __init__(self, directory, name, columns):
+        self.columns = {column: Column(directory, f'{name}.{column}') for column in columns}
+        self._length = len(next(iter(self.columns.values())))
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        if not -self._length <= i < self._length:
+            raise IndexError(i)
+        i = int(i) % self._length
+        row = {}
+        for column, values in self.columns.items():
+            value = values[i]
+            row[column] = json.loads(value) if column in JSON_COLUMNS else value
+        return row
+
+    def __iter__(self):
+        return (self[i] for i in range(self._length))
+
+
+def load_npz_mmap(path):
+    # np.load ignores mmap_mode for .npz archives; members of an uncompressed
+    # archive are plain .npy files, so map each one at its offset instead
+    arrays = {}
+    with open(path, 'rb') as f, zipfile.ZipFile(f) as archive:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path}: member {info.filename} is compressed and cannot be mapped")
+            f.seek(info.header_offset)
+            name_len, extra_len = struct.unpack('<HH', f.read(30)[26:30])
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-len('.npy')]
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                         order='F' if fortran else 'C')
+    return arrays
+
+
+def load_csr_mmap(path):
+    arrays = load_npz_mmap(path)
+    shape = tuple(int(n) for n in arrays['shape'])
+    return sp.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=shape, copy=False)
+
+
+def fingerprint(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+class KnowledgeBaseStore:
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        with open(self.directory / 'manifest.json', 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('version') != STORE_VERSION:
+            raise ValueError(f"knowledge base store version {self.manifest.get('version')} != {STORE_VERSION}")
+        self.records = Table(self.directory, 'records', RECORD_COLUMNS)
+        self.qa = Table(self.directory, 'qa', QA_COLUMNS)
+        self._labels = np.load(self.directory / 'labels.npy', mmap_mode='r')
+        self._label_rows = np.load(self.directory / 'label_rows.npy', mmap_mode='r')
+        # name -> (vectorizer, CSR matrix), one per TF-IDF view of the corpus
+        self.tfidf = {
+            name: (joblib.load(self.directory / f'{name}_vectorizer.pkl'),
+                   load_csr_mmap(self.directory / f'{name}_tfidf.npz'))
+            for name in self.manifest['tfidf']
+        }
+
+    def row(self, label):
+        # FAISS label -> record row, or None for a label the store does not know
+        pos = int(np.searchsorted(self._labels, label))
+        if pos < len(self._labels) and self._labels[pos] == label:
+            return int(self._label_rows[pos])
+        return None
+
+    def indexed_rows(self):
+        # Rows that have a vector in the FAISS index
+        return np.asarray(self._label_rows[np.asarray(self._labels) >= 0])
+
+    def record(self, label):
+        row = self.row(label)
+        return self.records[row] if row is not None else None
+
+    def stale_sources(self):
+        # Sources that changed since the build; missing ones are fine, since a
+        # deployment may ship the store without the JSON it was built from
+        return [
+            path for path, expected in self.manifest.get('sources', {}).items()
+            if os.path.exists(path) and fingerprint(path) != expected
+        ]
+
+
+def _write_column(directory, name, values):
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    with open(directory / f'{name}.bin', 'wb') as f:
+        for i, value in enumerate(values):
+            data = value.encode('utf-8')
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    np.save(directory / f'{name}.offsets.npy', offsets)
+
+
+def _write_table(directory, name, rows, columns):
+    for column in columns:
+        values = [row.get(column) for row in rows]
+        if column in JSON_COLUMNS:
+            values = [json.dumps(value, ensure_ascii=False) for value in values]
+        _write_column(directory, f'{name}.{column}', values)
+
+
+def write_store(directory, records, labels, qa_entries, tfidf, sources=()):
+    # Built next to the target and swapped in, so running workers keep their
+    # mappings of the old files until they restart
+    directory = Path(directory)
+    tmp = directory.with_name(f'{directory.name}.tmp')
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    _write_table(tmp, 'records', records, RECORD_COLUMNS)
+    labels = np.asarray(labels, dtype=np.int64)
+    order = np.argsort(labels, kind='stable')
+    np.save(tmp / 'labels.npy', labels[order])
+    np.save(tmp / 'label_rows.npy', order.astype(np.int64))
+    _write_table(tmp, 'qa', qa_entries, QA_COLUMNS)
+    for name, (vectorizer, matrix) in tfidf.items():
+        sp.save_npz(tmp / f'{name}_tfidf.npz', sp.csr_matrix(matrix), compressed=False)
+        joblib.dump(vectorizer, tmp / f'{name}_vectorizer.pkl')
+    with open(tmp / 'manifest.json', 'w', encoding='utf-8') as f:
+        json.dump({
+            'version': STORE_VERSION,
+            'records': len(records),
+            'qa_entries': len(qa_entries),
+            'tfidf': {name: len(vectorizer.vocabulary_) for name, (vectorizer, _) in tfidf.items()},
+            'sources': {str(Path(path).resolve()): fingerprint(path) for path in sources},
+        }, f, indent=2)
+
+    old = directory.with_name(f'{directory.name}.old')
+    shutil.rmtree(old, ignore_errors=True)
+    if directory.exists():
+        os.replace(directory, old)
+    os.replace(tmp, directory)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+_store = None
+_store_key = None
+_store_generation = 0
+_store_lock = threading.Lock()
+
+
+def _knowledge_base_key(directory):
+    # Changes whenever the store is rebuilt or a JSON source is edited
+    paths = (os.path.join(directory, 'manifest.json'), RECORDS_PATH, FACTS_PATH)
+    return tuple(tuple(fingerprint(path).values()) if os.path.exists(path) else None for path in paths)
+
+
+def open_store(directory=None, refresh=False):
+    # One mapping per process, shared by every engine instance; None when the
+    # store is disabled, not built or older than its sources. refresh (model
+    # reloads) re-checks the store and its sources and reopens it when either
+    # changed, bumping store_generation().
+    global _store, _store_key, _store_generation
+    directory = directory or config.KB_STORE_DIR
+    with _store_lock:
+        if _store is None or refresh:
+            key = _knowledge_base_key(directory)
+            if _store is None or key != _store_key:
+                if _store is not None:
+                    _store_generation += 1
+                    logging.info(f"Knowledge base changed; reopening (generation {_store_generation})")
+                _store = _open(directory) or False
+                _store_key = key
+        return _store or None
+
+
+def store_generation():
+    # Engines built over the knowledge base record this, so a reload can tell
+    # whether they are serving an outdated copy
+    return _store_generation
+
+
+def _open(directory):
+    if not config.KB_STORE_ENABLED:
+        return None
+    if not os.path.exists(os.path.join(directory, 'manifest.json')):
+        logging.info(f"No knowledge base store at {directory}; loading JSON sources")
+        return None
+    try:
+        store = KnowledgeBaseStore(directory)
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"Knowledge base store at {directory} unusable ({e}); loading JSON sources")
+        return None
+    stale = store.stale_sources()
+    if stale:
+        logging.warning(f"Knowledge base store at {directory} is older than {', '.join(stale)}; "
+                        f"loading JSON sources (rebuild with build_kb_store.py)")
+        return None
+    return store
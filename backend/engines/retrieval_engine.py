@@ -1,33 +1,113 @@
-import os
-import json
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 
-# Load knowledge base
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_PATH = os.path.join(BASE_DIR, "../datasets/knowledge_base.json")
+from core.latency import tracer
+from engines.kb_store import load_qa_entries, open_store
+
+SCORING = ("inverted", "matmul")
+
+
+def fit_tfidf(questions):
+    vectorizer = TfidfVectorizer(stop_words="english")
+    return vectorizer, vectorizer.fit_transform(questions)
+
+
+def select_top_k(docs, scores, k):
+    # Best k (doc, score) pairs, highest score first and lowest doc on ties,
+    # as argmax would pick; argpartition keeps this linear in len(scores)
+    if len(scores) > k:
+        kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        keep = scores >= kth
+        docs, scores = docs[keep], scores[keep]
+    order = np.lexsort((docs, -scores))[:k]
+    return docs[order], scores[order]
+
 
 class RetrievalEngine:
-    def __init__(self, threshold=0.7):
+    # scoring="inverted" scores only the questions sharing a term with the
+    # query, through a term -> (question, weight) postings index; "matmul"
+    # scores every stored question. Both give the same similarities.
+    def __init__(self, threshold=0.7, store=None, scoring="inverted", entries=None):
+        if scoring not in SCORING:
+            raise ValueError(f"unknown scoring {scoring!r}")
         self.threshold = threshold
-        self.knowledge_base = self._load_knowledge_base()
-        self.vectorizer = TfidfVectorizer(stop_words="english")
-        # Only use entries with a 'question' key for TF-IDF fitting
-        self.qa_entries = [entry for entry in self.knowledge_base if "question" in entry]
-        self.tfidf_matrix = self.vectorizer.fit_transform([entry["question"] for entry in self.qa_entries])
-
-    def _load_knowledge_base(self):
-        with open(DATA_PATH, "r") as file:
-            data = json.load(file)
-            return data["facts"]
+        self.scoring = scoring
+        store = store or (open_store() if entries is None else None)
+        if store is not None:
+            # Prebuilt by build_kb_store.py and mapped read-only, so rebuilding
+            # the engine on a model reload costs nothing
+            self.qa_entries = store.qa
+            self.vectorizer, self.tfidf_matrix = store.tfidf["qa"]
+        else:
+            self.qa_entries = entries if entries is not None else load_qa_entries()
+            self.vectorizer, self.tfidf_matrix = fit_tfidf([entry["question"] for entry in self.qa_entries])
+        # The inverted index is the transposed TF-IDF matrix: row t lists the
+        # questions containing term t with their weights
+        self.postings = self.tfidf_matrix.T.tocsr() if scoring == "inverted" else None
 
     def retrieve(self, query):
-        query_vec = self.vectorizer.transform([query])
-        similarities = cosine_similarity(query_vec, self.tfidf_matrix).flatten()
-        max_sim_index = np.argmax(similarities)
-        max_sim = similarities[max_sim_index]
+        return self.retrieve_batch([query])[0]
+
+    def retrieve_batch(self, queries):
+        return [
+            self._result(query, docs[0] if len(docs) else 0, scores[0] if len(scores) else 0.0)
+            for query, (docs, scores) in zip(queries, self._search(queries, 1))
+        ]
+
+    def retrieve_topk(self, query, top_k=5):
+        return self.retrieve_topk_batch([query], top_k)[0]
+
+    def retrieve_topk_batch(self, queries, top_k=5):
+        # Ranked candidates per query, without the confidence threshold or
+        # answer filtering that retrieve applies to its single answer
+        return [
+            [self._candidate(int(doc), score) for doc, score in zip(docs, scores)]
+            for docs, scores in self._search(queries, top_k)
+        ]
+
+    def _search(self, queries, k):
+        # (question rows, cosine similarities) per query, best first
+        with tracer.stage("tfidf"):
+            query_vecs = self.vectorizer.transform(queries)
+            if self.scoring == "inverted":
+                return [self._top_inverted(query_vecs[i], k) for i in range(len(queries))]
+            # TF-IDF rows are L2-normalized, so one sparse matmul gives the
+            # cosine similarity of every query against every stored question
+            similarities = (query_vecs @ self.tfidf_matrix.T).toarray()
+            matches = [np.flatnonzero(row) for row in similarities]
+            return [select_top_k(docs, row[docs], k) for docs, row in zip(matches, similarities)]
+
+    def _top_inverted(self, query_vec, k):
+        postings = self.postings
+        terms = query_vec.indices
+        starts, ends = postings.indptr[terms], postings.indptr[terms + 1]
+        if not (ends - starts).any():
+            # No stored question shares a term with the query
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        docs = np.concatenate([postings.indices[a:b] for a, b in zip(starts, ends)])
+        weights = np.concatenate([postings.data[a:b] * w for a, b, w in zip(starts, ends, query_vec.data)])
+        n_docs = postings.shape[1]
+        if len(docs) * 16 < n_docs:
+            # Few postings: group them by sorting instead of touching every question
+            docs, inverse = np.unique(docs, return_inverse=True)
+            return select_top_k(docs, np.bincount(inverse, weights), k)
+        # Long postings (common terms): accumulate into one score per question
+        # and cut to the top k before gathering rows
+        scores = np.bincount(docs, weights, minlength=n_docs)
+        kth = scores[np.argpartition(-scores, k - 1)[k - 1]] if n_docs > k else 0.0
+        docs = np.flatnonzero((scores >= kth) & (scores > 0))
+        return select_top_k(docs, scores[docs], k)
+
+    def _candidate(self, row, score):
+        entry = self.qa_entries[row]
+        return {
+            "question": entry["question"],
+            "answer": entry["answer"],
+            "source": entry.get("category", None),
+            "score": float(score),
+        }
 
+    def _result(self, query, max_sim_index, max_sim):
         if max_sim < self.threshold:
             return {
                 "answer": "I'm sorry, I cannot confidently answer this question.",
@@ -1,11 +1,187 @@
-from transformers import pipeline
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 
-model = pipeline("text2text-generation", model="google/flan-t5-small")
+import config
 
-def explain(query: str):
-    result = model(query, max_length=120)
+model = None
+_model_lock = threading.Lock()
+
+# Memoized generations keyed on (prompt, generation params)
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=config.TRANSFORMER_WORKERS, thread_name_prefix="generate")
+stats = {"cache_hits": 0, "cache_misses": 0, "timeouts": 0, "generations": 0, "cancelled": 0}
+# Counters are bumped from request threads and generation workers alike
+_stats_lock = threading.Lock()
+
+
+class GenerationTimeout(Exception):
+    pass
+
+
+def generation_params():
+    return {"max_length": config.TRANSFORMER_MAX_LENGTH}
+
+
+def build_pipeline(model_name, quantize=None, threads=0):
+    import torch
+    from transformers import pipeline
+    if threads > 0:
+        torch.set_num_threads(threads)
+    pipe = pipeline("text2text-generation", model=model_name)
+    if quantize == "int8":
+        # Dynamic int8 quantization of the Linear layers; CPU only
+        pipe.model = torch.ao.quantization.quantize_dynamic(pipe.model, {torch.nn.Linear}, dtype=torch.qint8)
+    return pipe
+
+
+def load_model():
+    # Deferred so importing this module does not pull in torch/transformers
+    global model
+    with _model_lock:
+        if model is None:
+            model = build_pipeline(
+                config.TRANSFORMER_MODEL,
+                quantize=config.TRANSFORMER_QUANTIZE,
+                threads=config.TORCH_INTRA_OP_THREADS,
+            )
+    return model
+
+def get_model():
+    return model if model is not None else load_model()
+
+def _answer(generated_text):
     return {
-        "answer": result[0]["generated_text"],
+        "answer": generated_text,
         "confidence": 1.0,  # Transformers are not probabilistic here, so use 1.0
         "source": "transformer"
     }
+
+def _count(name, n=1):
+    with _stats_lock:
+        stats[name] += n
+
+def _cache_key(prompt, params):
+    return (prompt, tuple(sorted(params.items())))
+
+def _cache_get(key):
+    with _cache_lock:
+        text = _cache.get(key)
+        if text is not None:
+            _cache.move_to_end(key)
+    _count("cache_hits" if text is not None else "cache_misses")
+    return text
+
+def _cache_put(key, text):
+    with _cache_lock:
+        _cache[key] = text
+        _cache.move_to_end(key)
+        while len(_cache) > config.TRANSFORMER_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+def generate(prompts, batch_size=8, **params):
+    # Only prompts missing from the memo cache reach the model, in one call
+    params = {**generation_params(), **params}
+    keys = [_cache_key(prompt, params) for prompt in prompts]
+    texts = [_cache_get(key) for key in keys]
+    missing = [i for i, text in enumerate(texts) if text is None]
+    if missing:
+        outputs = get_model()([prompts[i] for i in missing], batch_size=batch_size, **params)
+        _count("generations", len(missing))
+        for i, output in zip(missing, outputs):
+            texts[i] = (output[0] if isinstance(output, list) else output)["generated_text"]
+            _cache_put(keys[i], texts[i])
+    return texts
+
+def explain(query: str, deadline_s=None, on_done=None):
+    # With a deadline, generation runs on the worker pool and the caller gives
+    # up after deadline_s; a generation already running still finishes and
+    # lands in the cache, one still queued behind other work is cancelled.
+    # on_done runs once, when the generation has finished or been cancelled,
+    # which may be after explain has returned.
+    if not deadline_s:
+        try:
+            return _answer(generate([query])[0])
+        finally:
+            if on_done is not None:
+                on_done()
+    try:
+        # Loading the model (lazy mode, early startup) does not count against
+        # the generation deadline
+        get_model()
+        future = _executor.submit(generate, [query])
+    except BaseException:
+        if on_done is not None:
+            on_done()
+        raise
+    if on_done is not None:
+        future.add_done_callback(lambda _: on_done())
+    started = time.perf_counter()
+    try:
+        return _answer(future.result(timeout=deadline_s)[0])
+    except FutureTimeout:
+        _count("timeouts")
+        if future.cancel():
+            _count("cancelled")
+        logging.warning(f"Generation exceeded {deadline_s * 1000:.0f} ms deadline after {(time.perf_counter() - started) * 1000:.0f} ms")
+        raise GenerationTimeout(query)
+
+def stream_generate(prompt, stall_s=None, **params):
+    # Yields text pieces as they are decoded (word by word, via transformers'
+    # TextIteratorStreamer). A memoized generation is yielded in one piece.
+    # Raises GenerationTimeout if no piece arrives within stall_s.
+    params = {**generation_params(), **params}
+    key = _cache_key(prompt, params)
+    text = _cache_get(key)
+    if text is not None:
+        yield text
+        return
+    from transformers import TextIteratorStreamer
+    pipe = get_model()
+    streamer = TextIteratorStreamer(pipe.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=stall_s)
+    inputs = pipe.tokenizer(prompt, return_tensors="pt")
+    errors = []
+
+    def run():
+        # Runs to completion even if the client goes away, so the text still
+        # lands in the memo cache
+        try:
+            output = pipe.model.generate(**inputs, streamer=streamer, **params)
+            _count("generations")
+            _cache_put(key, pipe.tokenizer.decode(output[0], skip_special_tokens=True))
+        except Exception as e:
+            errors.append(e)
+            streamer.end()
+
+    future = _executor.submit(run)
+    try:
+        for piece in streamer:
+            if piece:
+                yield piece
+    except queue.Empty:
+        _count("timeouts")
+        logging.warning(f"Streaming generation stalled for {stall_s * 1000:.0f} ms")
+        raise GenerationTimeout(prompt)
+    finally:
+        # A client that went away (or stalled out) before the generation got
+        # a worker does not leave it queued
+        if future.cancel():
+            _count("cancelled")
+    if errors:
+        raise errors[0]
+
+def explain_batch(queries, batch_size=8):
+    # One pipeline call for all transformer-bound queries
+    return [_answer(text) for text in generate(list(queries), batch_size=batch_size)]
+
+def generation_stats():
+    with _cache_lock:
+        size = len(_cache)
+    with _stats_lock:
+        counters = dict(stats)
+    return {**counters, "cache_size": size, "quantize": config.TRANSFORMER_QUANTIZE,
+            "intra_op_threads": config.TORCH_INTRA_OP_THREADS, "deadline_ms": config.TRANSFORMER_DEADLINE_MS}
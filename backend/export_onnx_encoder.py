@@ -0,0 +1,212 @@
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sys
+
+import faiss
+import numpy as np
+
+import config
+from build_faiss_index import (
+    DATA_PATH, INDEX_PATH, MANIFEST_PATH, MAPPING_PATH, _write_json, read_manifest, record_label,
+)
+from engines.encoder import ONNX_MANIFEST, ONNX_VARIANTS, OnnxEncoder, cosine_parity
+from engines.kb_store import load_corpus
+
+# Exports the sentence-transformers encoder (transformer, mean pooling and, when
+# the model has it, L2 normalization) as one ONNX graph, optionally adds an
+# int8 dynamically quantized copy, and checks each against the torch model and
+# the vectors already in the FAISS index. The server only loads variants whose
+# parity check passed (EMBEDDING_BACKEND=onnx).
+#
+#   python export_onnx_encoder.py
+#   python export_onnx_encoder.py --no-quantize --tolerance 0.0005
+
+OPSET = 17
+
+
+def _pooling_mode(pooling):
+    # pooling_mode in sentence-transformers 5+, get_pooling_mode_str before
+    mode = getattr(pooling, 'pooling_mode', None)
+    if mode is None and hasattr(pooling, 'get_pooling_mode_str'):
+        mode = pooling.get_pooling_mode_str()
+    return mode
+
+
+def pooled_module(model):
+    import torch
+
+    modules = list(model)
+    if len(modules) < 2 or _pooling_mode(modules[1]) != 'mean':
+        raise ValueError("Only transformer + mean pooling sentence-transformers models can be exported")
+    normalize = any(type(m).__name__ == 'Normalize' for m in modules[2:])
+    transformer = modules[0].auto_model
+
+    class Pooled(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            tokens = self.transformer(input_ids=input_ids, attention_mask=attention_mask,
+                                      token_type_ids=token_type_ids)[0]
+            mask = attention_mask.unsqueeze(-1).to(tokens.dtype)
+            embeddings = (tokens * mask).sum(1) / mask.sum(1).clamp(min=1e-9)
+            if normalize:
+                embeddings = torch.nn.functional.normalize(embeddings, p=2, dim=1)
+            return embeddings
+
+    return Pooled().eval(), normalize
+
+
+def export(model, out_dir):
+    import torch
+
+    module, normalize = pooled_module(model)
+    sample = model.tokenizer(["export sample"], return_tensors='pt', padding=True)
+    inputs = tuple(sample.get(name, torch.zeros_like(sample['input_ids']))
+                   for name in ('input_ids', 'attention_mask', 'token_type_ids'))
+    axes = {0: 'batch', 1: 'sequence'}
+    with torch.no_grad():
+        torch.onnx.export(
+            module, inputs, os.path.join(out_dir, ONNX_VARIANTS['fp32']),
+            input_names=['input_ids', 'attention_mask', 'token_type_ids'],
+            output_names=['sentence_embedding'],
+            dynamic_axes={'input_ids': axes, 'attention_mask': axes, 'token_type_ids': axes,
+                          'sentence_embedding': {0: 'batch'}},
+            opset_version=OPSET,
+            # The TorchScript exporter; the dynamo one needs onnxscript
+            dynamo=False,
+        )
+    model.tokenizer.backend_tokenizer.save(os.path.join(out_dir, 'tokenizer.json'))
+    return normalize
+
+
+def quantize(out_dir):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(os.path.join(out_dir, ONNX_VARIANTS['fp32']), os.path.join(out_dir, ONNX_VARIANTS['int8']),
+                     weight_type=QuantType.QInt8)
+
+
+def sample_records(records, count):
+    # Evenly spaced over the corpus, so both regulation chunks and QA facts are in
+    if len(records) <= count:
+        return records
+    return [records[int(i)] for i in np.linspace(0, len(records) - 1, count)]
+
+
+def index_vectors(records, model_name, index_path=INDEX_PATH, mapping_path=MAPPING_PATH,
+                  manifest_path=MANIFEST_PATH):
+    # Vectors the FAISS index holds for records, as (rows of records found,
+    # vectors); None when the index was built with another model
+    manifest = read_manifest(manifest_path)
+    if not os.path.exists(index_path) or (manifest or {}).get('model', 'all-MiniLM-L6-v2') != model_name:
+        return None
+    index = base = faiss.read_index(str(index_path))
+    if isinstance(index, faiss.IndexIDMap):
+        labels = faiss.vector_to_array(index.id_map)
+        position = {int(label): i for i, label in enumerate(labels)}
+        keys = [position.get(record_label(rec['id'])) for rec in records]
+        # index stays referenced: it owns the wrapped index
+        base = faiss.downcast_index(index.index)
+    else:
+        # Legacy index: the mapping lists record ids by position
+        with open(mapping_path, 'r', encoding='utf-8') as f:
+            position = {rid: i for i, rid in enumerate(json.load(f))}
+        keys = [position.get(rec['id']) for rec in records]
+    if hasattr(base, 'make_direct_map'):
+        # IVF lists need a direct map before reconstruct
+        base.make_direct_map()
+    rows = [i for i, key in enumerate(keys) if key is not None]
+    if not rows:
+        return None
+    return rows, np.vstack([base.reconstruct(keys[i]) for i in rows])
+
+
+def check_parity(out_dir, variant, texts, torch_embeddings, indexed, tolerance):
+    # Encodes through OnnxEncoder, so the check covers the serving tokenizer path too
+    embeddings = OnnxEncoder(out_dir, variant=variant, require_parity=False).encode(texts)
+    result = {'torch': cosine_parity(embeddings, torch_embeddings, tolerance)}
+    if indexed is not None:
+        rows, vectors = indexed
+        result['index'] = cosine_parity(embeddings[rows], vectors, tolerance)
+    result['passed'] = all(check['passed'] for check in result.values())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the sentence encoder to ONNX and check its parity")
+    parser.add_argument('--model', default=config.EMBEDDING_MODEL)
+    parser.add_argument('--out', default=config.EMBEDDING_ONNX_DIR)
+    parser.add_argument('--no-quantize', action='store_true', help="skip the int8 variant")
+    parser.add_argument('--samples', type=int, default=256, help="corpus records used for the parity check")
+    parser.add_argument('--tolerance', type=float, default=1e-3,
+                        help="largest allowed 1 - cosine for the fp32 variant")
+    parser.add_argument('--int8-tolerance', type=float, default=0.02,
+                        help="largest allowed 1 - cosine for the int8 variant")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(args.model, device='cpu')
+
+    # Written beside the target and moved into place at the end, so a failed
+    # export leaves the previous one untouched
+    out_dir = os.path.normpath(args.out)
+    tmp = f'{out_dir}.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    normalize = export(model, tmp)
+    variants = ['fp32'] + ([] if args.no_quantize else ['int8'])
+    if 'int8' in variants:
+        quantize(tmp)
+
+    records = sample_records(load_corpus(DATA_PATH), args.samples)
+    texts = [rec['text'] for rec in records]
+    torch_embeddings = model.encode(texts, convert_to_numpy=True)
+    tokenizer = model.tokenizer
+    manifest = {
+        'model': args.model,
+        'dim': int(torch_embeddings.shape[1]),
+        'pooling': 'mean',
+        'normalize': normalize,
+        'max_seq_length': model.max_seq_length,
+        'pad_token': tokenizer.pad_token,
+        'pad_token_id': tokenizer.pad_token_id,
+        'opset': OPSET,
+        'exported_at': datetime.datetime.utcnow().isoformat(),
+        'variants': {variant: {'file': ONNX_VARIANTS[variant]} for variant in variants},
+    }
+    _write_json(os.path.join(tmp, ONNX_MANIFEST), manifest)
+
+    indexed = index_vectors(records, args.model)
+    if indexed is None:
+        print("FAISS index was built with another model; checking parity against torch only")
+
+    results = {}
+    for variant in variants:
+        tolerance = args.int8_tolerance if variant == 'int8' else args.tolerance
+        results[variant] = {
+            'file': ONNX_VARIANTS[variant],
+            'bytes': os.path.getsize(os.path.join(tmp, ONNX_VARIANTS[variant])),
+            'parity': check_parity(tmp, variant, texts, torch_embeddings, indexed, tolerance),
+        }
+    manifest['variants'] = results
+    _write_json(os.path.join(tmp, ONNX_MANIFEST), manifest)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.rename(tmp, out_dir)
+    for variant, result in results.items():
+        checks = {name: check for name, check in result['parity'].items() if name != 'passed'}
+        summary = ", ".join(f"{name} min cos {check['min_cosine']} over {check['count']}" for name, check in checks.items())
+        print(f"{variant:>5}: {result['bytes'] / 1e6:.1f} MB, {summary} -> "
+              f"{'ok' if result['parity']['passed'] else 'FAILED'}")
+    print(f"Wrote {out_dir}; serve it with EMBEDDING_BACKEND=onnx EMBEDDING_ONNX_VARIANT=<variant>")
+    if not all(result['parity']['passed'] for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from feedback.feedback_writer import COLUMNS
+
+# Exports the feedback log to daily Parquet partitions and rolls rows past the
+# retention window into feedback_daily.
+#
+#   python -m feedback.feedback_maintenance export --out feedback/exports
+#   python -m feedback.feedback_maintenance compact --retain-days 30
+
+DAILY_ROLLUP_SQL = """
+    INSERT INTO feedback_daily (day, engine, domain, intent, feedback, n)
+    SELECT substr(timestamp, 1, 10), COALESCE(engine, ''), COALESCE(domain, ''),
+           COALESCE(intent, ''), COALESCE(feedback, -1), COUNT(*)
+    FROM feedback
+    WHERE timestamp >= ? AND timestamp < ? AND id <= ?
+    GROUP BY 1, 2, 3, 4, 5
+    ON CONFLICT (day, engine, domain, intent, feedback) DO UPDATE SET n = n + excluded.n
+"""
+DELETE_DAY_SQL = "DELETE FROM feedback WHERE timestamp >= ? AND timestamp < ? AND id <= ?"
+EXPORT_SQL = f"SELECT id, {', '.join(COLUMNS)} FROM feedback WHERE id > ? ORDER BY id"
+MANIFEST = "_manifest.json"
+
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA busy_timeout = 30000")
+    return conn
+
+
+def compact(db_path, retain_days=30, keep_after_id=None, now=None):
+    # One transaction per day, so the feedback writer is never blocked for
+    # long. Rows above keep_after_id have not been consumed yet and stay.
+    now = now or datetime.datetime.utcnow()
+    cutoff = (now - datetime.timedelta(days=retain_days)).date().isoformat()
+    keep_after_id = (1 << 62) if keep_after_id is None else keep_after_id
+    days = rows = 0
+    conn = _connect(db_path)
+    try:
+        start = ""
+        while True:
+            (first,) = conn.execute(
+                "SELECT MIN(timestamp) FROM feedback WHERE timestamp >= ? AND timestamp < ?", (start, cutoff)
+            ).fetchone()
+            if first is None:
+                break
+            day = first[:10]
+            end = (datetime.date.fromisoformat(day) + datetime.timedelta(days=1)).isoformat()
+            with conn:
+                conn.execute(DAILY_ROLLUP_SQL, (day, end, keep_after_id))
+                deleted = conn.execute(DELETE_DAY_SQL, (day, end, keep_after_id)).rowcount
+            rows += deleted
+            days += bool(deleted)
+            start = end
+    finally:
+        conn.close()
+    if rows:
+        logging.info(f"Compacted {rows} feedback rows from {days} days before {cutoff}")
+    return {"cutoff": cutoff, "days": days, "rows": rows}
+
+
+def export_watermark(out_dir):
+    # Highest feedback id already exported to out_dir; None before the first export
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["last_id"]
+
+
+def _write_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def _arrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet export needs pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+
+def export_parquet(db_path, out_dir, chunk_rows=100_000):
+    # Appends rows logged since the last export as out_dir/day=YYYY-MM-DD/
+    # part-<first id>.parquet; a rerun after a crash rewrites the same files
+    pa = _arrow()
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("query", pa.string()),
+        ("feedback", pa.int8()),
+        ("domain", pa.string()),
+        ("intent", pa.string()),
+        ("engine", pa.string()),
+        ("timestamp", pa.timestamp("us")),
+    ])
+    # Timestamps are ISO strings in SQLite; Arrow parses them on the cast
+    raw = schema.set(6, pa.field("timestamp", pa.string()))
+    os.makedirs(out_dir, exist_ok=True)
+    last_id = export_watermark(out_dir) or 0
+    exported = files = 0
+    conn = _connect(db_path)
+    try:
+        cursor = conn.execute(EXPORT_SQL, (last_id,))
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            by_day = {}
+            for row in rows:
+                by_day.setdefault((row[-1] or "")[:10] or "unknown", []).append(row)
+            for day, day_rows in by_day.items():
+                table = pa.Table.from_arrays(
+                    [pa.array(values, type=field.type) for values, field in zip(zip(*day_rows), raw)],
+                    schema=raw,
+                ).cast(schema)
+                directory = os.path.join(out_dir, f"day={day}")
+                os.makedirs(directory, exist_ok=True)
+                path = os.path.join(directory, f"part-{day_rows[0][0]:012d}.parquet")
+                pa.parquet.write_table(table, f"{path}.tmp")
+                os.replace(f"{path}.tmp", path)
+                files += 1
+            exported += len(rows)
+            last_id = rows[-1][0]
+            _write_manifest(out_dir, {"last_id": last_id, "updated_at": time.time()})
+    finally:
+        conn.close()
+    if exported:
+        logging.info(f"Exported {exported} feedback rows to {files} Parquet files in {out_dir}")
+    return {"rows": exported, "files": files, "last_id": last_id}
+
+
+def load_export(out_dir, since=None, columns=None):
+    # Reads the export as one Arrow table; with since (an ISO date or
+    # timestamp), only partitions from that day on are opened
+    pa = _arrow()
+    dataset = pa.dataset.dataset(
+        out_dir, format="parquet",
+        partitioning=pa.dataset.partitioning(pa.schema([("day", pa.string())]), flavor="hive"),
+    )
+    condition = pa.dataset.field("day") >= since[:10] if since else None
+    return dataset.to_table(columns=columns, filter=condition)
+
+
+def load_history(db_path, out_dir=None, columns=COLUMNS):
+    # The Parquet export plus the rows logged since, as one DataFrame
+    import pandas as pd
+
+    frames = []
+    last_id = export_watermark(out_dir) if out_dir else None
+    if last_id is not None:
+        frames.append(load_export(out_dir, columns=list(columns)).to_pandas())
+    conn = _connect(db_path)
+    try:
+        # rowid is the id column once the writer has migrated the table
+        frames.append(pd.read_sql_query(
+            f"SELECT {', '.join(columns)} FROM feedback WHERE rowid > ? ORDER BY rowid", conn, params=(last_id or 0,)
+        ))
+    finally:
+        conn.close()
+    return pd.concat(frames, ignore_index=True)
+
+
+# Export and compaction every interval_s. Rows above consumed_id() have not
+# been read by the retrain scheduler yet and are never compacted.
+class FeedbackMaintenance:
+    def __init__(self, db_path, retain_days=30, interval_s=3600.0, export_dir=None, consumed_id=None, flush=None):
+        self.db_path = db_path
+        self.retain_days = retain_days
+        self.interval_s = interval_s
+        self.export_dir = export_dir
+        self.consumed_id = consumed_id
+        self.flush = flush
+        self.runs = 0
+        self.last_run = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None and self.interval_s > 0:
+            self._thread = threading.Thread(target=self._run, name="feedback-maintenance", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self):
+        started = time.time()
+        if self.flush:
+            self.flush()
+        keep_after = []
+        exported = None
+        if self.export_dir:
+            exported = export_parquet(self.db_path, self.export_dir)
+            keep_after.append(exported["last_id"])
+        if self.consumed_id:
+            keep_after.append(self.consumed_id())
+        compacted = compact(self.db_path, self.retain_days, keep_after_id=min(keep_after) if keep_after else None)
+        self.runs += 1
+        self.last_run = {"export": exported, "compaction": compacted, "seconds": round(time.time() - started, 3)}
+        return self.last_run
+
+    def stats(self):
+        return {
+            "retain_days": self.retain_days,
+            "interval_s": self.interval_s,
+            "export_dir": self.export_dir,
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "last_error": self.last_error,
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.run_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logging.error(f"Feedback maintenance failed: {e}")
+
+
+def main():
+    import config
+
+    parser = argparse.ArgumentParser(description="Export and compact the feedback log")
+    parser.add_argument("command", choices=("export", "compact", "all"))
+    parser.add_argument("--db", default=config.FEEDBACK_DB_PATH)
+    parser.add_argument("--out", default=config.FEEDBACK_EXPORT_DIR)
+    parser.add_argument("--retain-days", type=int, default=config.FEEDBACK_RETENTION_DAYS)
+    parser.add_argument("--keep-after-id", type=int, default=None,
+                        help="never compact rows with a higher id (default: the export watermark, if any)")
+    args = parser.parse_args()
+
+    if args.command in ("export", "all"):
+        print(export_parquet(args.db, args.out))
+    if args.command in ("compact", "all"):
+        keep_after_id = args.keep_after_id
+        if keep_after_id is None and args.out:
+            keep_after_id = export_watermark(args.out)
+        print(compact(args.db, args.retain_days, keep_after_id=keep_after_id))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,100 @@
 import sqlite3
-import pandas as pd
-from fastapi import APIRouter
+import threading
+import time
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+import config
+from feedback.feedback_store import feedback_writer
 
 router = APIRouter()
 
+# Reads the trigger-maintained feedback_summary table (see feedback_writer), so
+# the cost depends on the number of hour/engine/domain buckets, not on how many
+# rows the log holds
+SUMMARY_SQL = """
+    SELECT engine, domain, feedback, SUM(n) FROM feedback_summary
+    WHERE hour >= ? AND hour <= ?
+    GROUP BY engine, domain, feedback
+"""
+
+
+def _hour(timestamp, default):
+    # Summary rows are bucketed by "YYYY-MM-DDTHH", so windows are whole hours
+    if not timestamp:
+        return default
+    hour = timestamp.replace(" ", "T")[:13]
+    if len(hour) < 10:
+        raise ValueError(f"not an ISO timestamp: {timestamp!r}")
+    return hour
+
+
+class FeedbackMetrics:
+    def __init__(self, db_path, ttl_s=5.0):
+        self.db_path = db_path
+        self.ttl_s = ttl_s
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get(self, since=None, until=None):
+        # Counts from hour(since) through hour(until), both inclusive
+        window = (_hour(since, ""), _hour(until, "~"))
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(window)
+            if cached is not None and cached[0] > now:
+                return cached[1]
+        result = self._compute(*window)
+        result["window"] = {"since": since, "until": until}
+        with self._lock:
+            # Drop expired windows so ad-hoc ranges do not accumulate
+            self._cache = {key: value for key, value in self._cache.items() if value[0] > now}
+            self._cache[window] = (now + self.ttl_s, result)
+        return result
+
+    def _compute(self, since_hour, until_hour):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(SUMMARY_SQL, (since_hour, until_hour)).fetchall()
+        except sqlite3.OperationalError:
+            # Table not created yet: the writer migrates on startup
+            rows = []
+        finally:
+            conn.close()
+
+        count = helpful = not_helpful = 0
+        by_engine = {}
+        by_domain = {}
+        for engine, domain, feedback, n in rows:
+            count += n
+            if feedback < 0:
+                # Query log rows, not feedback
+                continue
+            helpful += n if feedback == 1 else 0
+            not_helpful += n if feedback == 0 else 0
+            # {name: {feedback value: count}}, the shape analytics-panel reads
+            for name, groups in ((engine, by_engine), (domain, by_domain)):
+                if name:
+                    counts = groups.setdefault(name, {})
+                    counts[feedback] = counts.get(feedback, 0) + n
+        return {
+            "count": count,
+            "helpful": helpful,
+            "not_helpful": not_helpful,
+            "by_engine": by_engine,
+            "by_domain": by_domain,
+        }
+
+
+feedback_metrics_cache = FeedbackMetrics(config.FEEDBACK_DB_PATH, ttl_s=config.FEEDBACK_METRICS_TTL_S)
+
 @router.get("/metrics/feedback")
-def feedback_metrics():
-    conn = sqlite3.connect("feedback/feedback.db")
-    df = pd.read_sql_query("SELECT * FROM feedback", conn)
-    conn.close()
-    if df.empty:
-        return {"count": 0, "helpful": 0, "not_helpful": 0, "by_engine": {}, "by_domain": {}}
-    helpful = df[df["feedback"] == 1].shape[0]
-    not_helpful = df[df["feedback"] == 0].shape[0]
-    by_engine = df.groupby("engine")["feedback"].value_counts().unstack(fill_value=0).to_dict()
-    by_domain = df.groupby("domain")["feedback"].value_counts().unstack(fill_value=0).to_dict()
-    return {
-        "count": int(df.shape[0]),
-        "helpful": int(helpful),
-        "not_helpful": int(not_helpful),
-        "by_engine": by_engine,
-        "by_domain": by_domain
-    }
+def feedback_metrics(since: Optional[str] = None, until: Optional[str] = None):
+    try:
+        return feedback_metrics_cache.get(since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/metrics/feedback/writer")
+def feedback_writer_metrics():
+    return feedback_writer.stats()
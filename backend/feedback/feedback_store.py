@@ -1,22 +1,18 @@
-import sqlite3
+import atexit
 import datetime
+import config
+from feedback.feedback_writer import FeedbackWriter
+
+# Rows are queued and committed in batches by the background writer thread
+feedback_writer = FeedbackWriter(
+    config.FEEDBACK_DB_PATH,
+    batch_size=config.FEEDBACK_BATCH_SIZE,
+    flush_interval_ms=config.FEEDBACK_FLUSH_INTERVAL_MS,
+    max_queue=config.FEEDBACK_QUEUE_MAX,
+)
+atexit.register(feedback_writer.close)
 
 def store_feedback(query, feedback, domain=None, intent=None, engine=None):
-    conn = sqlite3.connect("feedback/feedback.db")
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS feedback (
-            query TEXT,
-            feedback INTEGER,
-            domain TEXT,
-            intent TEXT,
-            engine TEXT,
-            timestamp TEXT
-        )
-    """)
-    cur.execute(
-        "INSERT INTO feedback (query, feedback, domain, intent, engine, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+    return feedback_writer.submit(
         (query, feedback, domain, intent, engine, datetime.datetime.utcnow().isoformat())
     )
-    conn.commit()
-    conn.close()
@@ -0,0 +1,230 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+from core.latency import tracer
+
+# Raw log columns, in insert order
+COLUMNS = ("query", "feedback", "domain", "intent", "engine", "timestamp")
+
+SCHEMA = [
+    # AUTOINCREMENT so ids are never reused once compaction deletes old rows;
+    # the retrain scheduler and the Parquet export both track progress by id
+    """
+    CREATE TABLE IF NOT EXISTS feedback (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        query TEXT,
+        feedback INTEGER,
+        domain TEXT,
+        intent TEXT,
+        engine TEXT,
+        timestamp TEXT
+    )
+    """,
+    # Row counts per hour, engine, domain and feedback value, kept current by
+    # the insert trigger below so /metrics/feedback never scans the log.
+    # NULLs are stored as '' (and -1 for feedback) so the upsert key matches.
+    """
+    CREATE TABLE IF NOT EXISTS feedback_summary (
+        hour TEXT NOT NULL,
+        engine TEXT NOT NULL,
+        domain TEXT NOT NULL,
+        feedback INTEGER NOT NULL,
+        n INTEGER NOT NULL,
+        PRIMARY KEY (hour, engine, domain, feedback)
+    ) WITHOUT ROWID
+    """,
+    # Raw rows older than the retention window, rolled up per day by
+    # feedback_compaction
+    """
+    CREATE TABLE IF NOT EXISTS feedback_daily (
+        day TEXT NOT NULL,
+        engine TEXT NOT NULL,
+        domain TEXT NOT NULL,
+        intent TEXT NOT NULL,
+        feedback INTEGER NOT NULL,
+        n INTEGER NOT NULL,
+        PRIMARY KEY (day, engine, domain, intent, feedback)
+    ) WITHOUT ROWID
+    """,
+]
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS feedback_timestamp ON feedback (timestamp)",
+    "CREATE INDEX IF NOT EXISTS feedback_engine ON feedback (engine, timestamp)",
+    "CREATE INDEX IF NOT EXISTS feedback_domain ON feedback (domain, timestamp)",
+    # The retrain scheduler looks up the latest logged row for a query's text
+    "CREATE INDEX IF NOT EXISTS feedback_query ON feedback (query)",
+]
+
+SUMMARY_KEY = """
+    COALESCE(substr({row}timestamp, 1, 13), ''), COALESCE({row}engine, ''),
+    COALESCE({row}domain, ''), COALESCE({row}feedback, -1)
+"""
+
+SUMMARY_TRIGGER = f"""
+    CREATE TRIGGER feedback_summary_insert AFTER INSERT ON feedback
+    BEGIN
+        INSERT INTO feedback_summary (hour, engine, domain, feedback, n)
+        VALUES ({SUMMARY_KEY.format(row="NEW.")}, 1)
+        ON CONFLICT (hour, engine, domain, feedback) DO UPDATE SET n = n + 1;
+    END
+"""
+
+# Rebuilds the summary from the log, for databases created before the trigger
+SUMMARY_BACKFILL = f"""
+    INSERT INTO feedback_summary (hour, engine, domain, feedback, n)
+    SELECT {SUMMARY_KEY.format(row="")}, COUNT(*) FROM feedback
+    GROUP BY 1, 2, 3, 4
+"""
+
+INSERT_SQL = f"INSERT INTO feedback ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+_STOP = object()
+
+
+def _add_ids(conn):
+    # Tables created before the id column are rebuilt once, keeping each row's
+    # rowid as its id so stored watermarks stay valid. The summary trigger
+    # goes with the old table and is recreated (with a backfill) below.
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(feedback)")]
+    if "id" in columns:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("ALTER TABLE feedback RENAME TO feedback_unkeyed")
+    conn.execute(SCHEMA[0])
+    conn.execute(f"INSERT INTO feedback (id, {', '.join(COLUMNS)}) "
+                 f"SELECT rowid, {', '.join(COLUMNS)} FROM feedback_unkeyed ORDER BY rowid")
+    conn.execute("DROP TABLE feedback_unkeyed")
+    conn.commit()
+
+
+def migrate(conn):
+    for statement in SCHEMA:
+        conn.execute(statement)
+    _add_ids(conn)
+    has_trigger = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'feedback_summary_insert'"
+    ).fetchone()
+    if not has_trigger:
+        # Same transaction as the trigger, so no insert is counted twice or missed
+        conn.execute("DELETE FROM feedback_summary")
+        conn.execute(SUMMARY_BACKFILL)
+        conn.execute(SUMMARY_TRIGGER)
+    for statement in INDEXES:
+        conn.execute(statement)
+    conn.commit()
+
+
+# Owns one long-lived WAL-mode connection and drains an in-memory queue of
+# feedback rows on a background thread, committing in batches by size or time.
+class FeedbackWriter:
+    def __init__(self, db_path, batch_size=64, flush_interval_ms=200, max_queue=10000):
+        self.db_path = db_path
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.0, float(flush_interval_ms)) / 1000.0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.errors = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            migrate(conn)
+            self._conn = conn
+            self._thread = threading.Thread(target=self._run, name="feedback-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, row):
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def flush(self):
+        # Blocks until every row submitted so far is committed
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join()
+        self._conn.close()
+        self._conn = None
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.unfinished_tasks,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "errors": self.errors,
+        }
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, rows):
+        try:
+            with tracer.stage("feedback_write"):
+                self._conn.executemany(INSERT_SQL, rows)
+                self._conn.commit()
+            self.written += len(rows)
+            self.batches += 1
+        except sqlite3.Error as e:
+            self.errors += 1
+            logging.error(f"Feedback writer failed to commit {len(rows)} rows: {e}")
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = self._collect(self._queue.get())
+            rows = [item for item in batch if item is not _STOP]
+            stopping = len(rows) != len(batch)
+            if rows:
+                self._write(rows)
+            for _ in batch:
+                self._queue.task_done()
+        # Flush anything that raced in behind the stop marker
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if rows:
+            self._write(rows)
+            for _ in rows:
+                self._queue.task_done()
+
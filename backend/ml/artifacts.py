@@ -0,0 +1,11 @@
+import os
+
+import joblib
+
+
+def atomic_dump(obj, path):
+    # Written next to the target and renamed over it, so a reader never
+    # loads a half-written pickle
+    tmp = f"{path}.tmp"
+    joblib.dump(obj, tmp)
+    os.replace(tmp, path)
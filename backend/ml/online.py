@@ -0,0 +1,57 @@
+import os
+import pandas as pd
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seed corpus and label column for each incrementally trained head
+HEADS = {
+    "domain": {"dataset": "domain_dataset.csv", "label": "domain", "ngram_range": (1, 1)},
+    "intent": {"dataset": "intent_dataset.csv", "label": "intent", "ngram_range": (1, 2)},
+    "quality": {"dataset": "quality_dataset.csv", "label": "quality", "ngram_range": (1, 1)},
+}
+
+
+# Stateless hashing features plus an SGD logistic model, so new feedback rows
+# can be folded in with partial_fit without refitting a vocabulary.
+class OnlineClassifier:
+    def __init__(self, classes, ngram_range=(1, 1)):
+        self.vectorizer = HashingVectorizer(
+            stop_words="english", ngram_range=ngram_range, n_features=2 ** 18, alternate_sign=False
+        )
+        self.model = SGDClassifier(loss="log_loss", alpha=1e-4, random_state=42)
+        self.classes_ = np.array(sorted(classes, key=str))
+        self.samples_seen = 0
+
+    def partial_fit(self, texts, labels):
+        # Labels the head was not seeded with cannot be learned incrementally
+        known = set(self.classes_.tolist())
+        pairs = [(t, l) for t, l in zip(texts, labels) if l in known]
+        if not pairs:
+            return 0
+        texts, labels = zip(*pairs)
+        self.model.partial_fit(self.vectorizer.transform(texts), list(labels), classes=self.classes_)
+        self.samples_seen += len(pairs)
+        return len(pairs)
+
+    def predict(self, query: str):
+        return self.predict_batch([query])[0]
+
+    def predict_batch(self, queries):
+        proba = self.model.predict_proba(self.vectorizer.transform(queries))
+        labels = self.model.classes_[proba.argmax(axis=1)]
+        return [(label, round(conf, 2)) for label, conf in zip(labels, proba.max(axis=1))]
+
+
+def bootstrap_head(name, epochs=5):
+    spec = HEADS[name]
+    df = pd.read_csv(os.path.join(BASE_DIR, "datasets", spec["dataset"]), on_bad_lines="skip")
+    df = df.dropna(subset=["query", spec["label"]])
+    head = OnlineClassifier(df[spec["label"]].unique(), ngram_range=spec["ngram_range"])
+    rng = np.random.default_rng(42)
+    for _ in range(epochs):
+        order = rng.permutation(len(df))
+        head.partial_fit(df["query"].iloc[order].tolist(), df[spec["label"]].iloc[order].tolist())
+    return head
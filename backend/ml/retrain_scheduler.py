@@ -0,0 +1,191 @@
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import joblib
+
+from ml.artifacts import atomic_dump
+from ml.online import HEADS, bootstrap_head
+
+# Feedback rows newer than the watermark, joined to the most recent logged
+# query with the same text to recover the domain/intent that were served
+NEW_FEEDBACK_SQL = """
+    SELECT f.rowid, f.query, f.feedback,
+           (SELECT q.domain FROM feedback q WHERE q.query = f.query AND q.domain IS NOT NULL
+            ORDER BY q.rowid DESC LIMIT 1),
+           (SELECT q.intent FROM feedback q WHERE q.query = f.query AND q.intent IS NOT NULL
+            ORDER BY q.rowid DESC LIMIT 1)
+    FROM feedback f
+    WHERE f.rowid > ? AND f.rowid <= ? AND f.feedback IS NOT NULL
+    ORDER BY f.rowid
+"""
+# First feedback row past the watermark, and the newest row of any kind
+PENDING_SQL = """
+    SELECT MIN(CASE WHEN feedback IS NOT NULL THEN rowid END), MAX(rowid)
+    FROM feedback WHERE rowid > ?
+"""
+
+
+# Debounced, coalescing retrain loop: any number of trigger() calls inside the
+# debounce window collapse into one run, at most one run is active, and
+# triggers arriving during a run schedule exactly one follow-up.
+class RetrainScheduler:
+    def __init__(self, db_path, models_dir, debounce_s=5.0, max_delay_s=60.0, flush=None, on_swap=None):
+        self.db_path = db_path
+        self.models_dir = models_dir
+        self.debounce = debounce_s
+        self.max_delay = max_delay_s
+        self.flush = flush
+        self.on_swap = on_swap
+        self.heads = None
+        self.watermark = 0
+        self.version = 0
+        self.triggers = 0
+        self.runs = 0
+        self.last_run = None
+        self._pending_since = None
+        self._last_trigger = 0.0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="retrain-scheduler", daemon=True)
+                self._thread.start()
+
+    def trigger(self):
+        self.start()
+        with self._cond:
+            now = time.monotonic()
+            if self._pending_since is None:
+                self._pending_since = now
+            self._last_trigger = now
+            self.triggers += 1
+            self._cond.notify()
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "triggers": self.triggers,
+            "runs": self.runs,
+            "pending": self._pending_since is not None,
+            "last_run": self.last_run,
+        }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending_since is None:
+                    self._cond.wait()
+                # Wait for a quiet period, but never longer than max_delay overall
+                while True:
+                    now = time.monotonic()
+                    due = min(self._last_trigger + self.debounce, self._pending_since + self.max_delay)
+                    if now >= due:
+                        break
+                    self._cond.wait(due - now)
+                self._pending_since = None
+            try:
+                self.retrain_once()
+            except Exception as e:
+                logging.error(f"Retraining failed: {e}")
+
+    def _watermark_path(self):
+        return os.path.join(self.models_dir, "watermark.json")
+
+    def _load_state(self):
+        heads = {}
+        for name in HEADS:
+            path = os.path.join(self.models_dir, f"{name}_online.pkl")
+            heads[name] = joblib.load(path) if os.path.exists(path) else bootstrap_head(name)
+        return heads, self._read_watermark()
+
+    def _read_watermark(self):
+        if not os.path.exists(self._watermark_path()):
+            return 0
+        with open(self._watermark_path()) as f:
+            return json.load(f).get("rowid", 0)
+
+    def _write_watermark(self, watermark):
+        tmp = self._watermark_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"rowid": watermark}, f)
+        os.replace(tmp, self._watermark_path())
+
+    def consumed_id(self):
+        # Highest id compaction may delete: every row before the first
+        # feedback row not yet trained on, so rows without a vote are not
+        # held back until the next retrain
+        watermark = self.watermark if self.heads is not None else self._read_watermark()
+        if not os.path.exists(self.db_path):
+            return watermark
+        conn = sqlite3.connect(self.db_path)
+        try:
+            pending, newest = conn.execute(PENDING_SQL, (watermark,)).fetchone()
+        finally:
+            conn.close()
+        if pending is not None:
+            return pending - 1
+        return max(watermark, newest or 0)
+
+    def retrain_once(self):
+        started = time.time()
+        if self.heads is None:
+            self.heads, self.watermark = self._load_state()
+        if self.flush:
+            # Rows may still be queued in the feedback writer
+            self.flush()
+        if not os.path.exists(self.db_path):
+            return
+        conn = sqlite3.connect(self.db_path)
+        try:
+            (scanned,) = conn.execute("SELECT MAX(rowid) FROM feedback").fetchone()
+            rows = conn.execute(NEW_FEEDBACK_SQL, (self.watermark, scanned or 0)).fetchall()
+        finally:
+            conn.close()
+        if not scanned or scanned <= self.watermark:
+            return
+        if not rows:
+            # Only query rows since the last run: nothing to train on, but
+            # the watermark still moves past them
+            os.makedirs(self.models_dir, exist_ok=True)
+            self._write_watermark(scanned)
+            self.watermark = scanned
+            return
+
+        # Only helpful answers confirm the served domain/intent labels
+        helpful = [r for r in rows if r[2] == 1]
+        batches = {
+            "domain": ([r[1] for r in helpful if r[3]], [r[3] for r in helpful if r[3]]),
+            "intent": ([r[1] for r in helpful if r[4]], [r[4] for r in helpful if r[4]]),
+            "quality": ([r[1] for r in rows], [int(r[2]) for r in rows]),
+        }
+        # Train copies so requests keep using the current heads until the swap
+        new_heads = {}
+        for name, head in self.heads.items():
+            texts, labels = batches[name]
+            if texts:
+                head = copy.deepcopy(head)
+                head.partial_fit(texts, labels)
+            new_heads[name] = head
+
+        os.makedirs(self.models_dir, exist_ok=True)
+        for name, head in new_heads.items():
+            atomic_dump(head, os.path.join(self.models_dir, f"{name}_online.pkl"))
+        watermark = scanned
+        self._write_watermark(watermark)
+
+        # Single reference assignment: readers see either the old or new set
+        self.heads = new_heads
+        self.watermark = watermark
+        self.version += 1
+        self.runs += 1
+        self.last_run = {"rows": len(rows), "watermark": watermark, "seconds": round(time.time() - started, 3)}
+        logging.info(f"Online retrain v{self.version}: {len(rows)} new feedback rows up to rowid {watermark}")
+        if self.on_swap:
+            self.on_swap(new_heads, self.version)
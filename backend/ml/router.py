@@ -0,0 +1,272 @@
+import argparse
+import collections
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import KFold
+
+from core.learned_router import (
+    FIXED_CASCADE, ROUTED_INTENTS, ROUTER_PATH, SKIPPABLE, LearnedRouter, router_features,
+)
+from ml.artifacts import atomic_dump
+from ml.online import BASE_DIR
+
+# Trains the learned router and replays it against the fixed cascade. The
+# feedback log only records which engine answered and the user's vote, so
+# per-engine outcomes are reconstructed by replay: every logged query the live
+# cascade would route is re-run through hybrid and TF-IDF retrieval with the
+# current models, timing each engine and recording whether it would have
+# accepted. An accepted answer counts as helpful unless votes on that engine
+# say otherwise; the transformer always answers, at --transformer-ms, and is
+# as helpful as its votes overall.
+#
+# By default the log is the full feedback history: the Parquet export (which
+# keeps rows that compaction deleted from feedback.db) plus the rows logged
+# since.
+#
+#   python -m ml.router train
+#   python -m ml.router evaluate --log datasets/feedback_export.csv --output router_eval.json
+
+LOG_COLUMNS = ["query", "feedback", "engine"]
+# Logged engine labels, including ones from before hybrid retrieval replaced
+# the FAISS engine
+ENGINE_ALIASES = {"FAISS_SEMANTIC": "HYBRID", "FAISS": "HYBRID", "HYBRID": "HYBRID",
+                  "RETRIEVAL": "RETRIEVAL", "TRANSFORMER": "TRANSFORMER"}
+ENGINES = (*SKIPPABLE, "TRANSFORMER")
+RANDOM_STATE = 42
+
+
+def load_log(source=None):
+    # feedback.db, a CSV export like datasets/feedback_export.csv, or the
+    # Parquet export directory written by feedback_maintenance; None reads the
+    # configured database together with its export
+    if source is None:
+        import config
+        from feedback.feedback_maintenance import load_history
+
+        if not config.FEEDBACK_EXPORT_DIR:
+            logging.warning("FEEDBACK_EXPORT_DIR is empty: feedback rows past the retention window are "
+                            f"compacted away, so only the last {config.FEEDBACK_RETENTION_DAYS} days are replayed")
+        return load_history(config.FEEDBACK_DB_PATH, config.FEEDBACK_EXPORT_DIR or None, LOG_COLUMNS)
+    if os.path.isdir(source):
+        from feedback.feedback_maintenance import load_export
+
+        return load_export(source, columns=LOG_COLUMNS).to_pandas()
+    if source.endswith(".csv"):
+        return pd.read_csv(source, usecols=LOG_COLUMNS, on_bad_lines="skip")
+    conn = sqlite3.connect(source)
+    try:
+        return pd.read_sql_query(f"SELECT {', '.join(LOG_COLUMNS)} FROM feedback", conn)
+    finally:
+        conn.close()
+
+
+def collect_votes(log):
+    # {query: {engine: [votes]}}; queries without votes are kept, since their
+    # outcomes can still be replayed
+    votes = {}
+    for query, feedback, engine in log[LOG_COLUMNS].itertuples(index=False):
+        if not isinstance(query, str) or not query.strip():
+            continue
+        per_engine = votes.setdefault(query.strip(), {})
+        engine = ENGINE_ALIASES.get(str(engine).upper())
+        if engine is not None and not pd.isna(feedback):
+            per_engine.setdefault(engine, []).append(float(feedback))
+    return votes
+
+
+def _timed_ms(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def replay(votes, transformer_ms):
+    # One example per routable query: which engines accept it, how long each
+    # took, and how helpful each engine's answer is (0..1)
+    from core.meta_controller import _hybrid_answer, _retrieval_answer, engine_manager
+    from core.routing_rules import routing_rules
+
+    models = engine_manager.get("models").active()
+    hybrid = engine_manager.get("hybrid")
+    queries = list(votes)
+    transformer_votes = [v for per_engine in votes.values() for v in per_engine.get("TRANSFORMER", ())]
+    transformer_prior = statistics.mean(transformer_votes) if transformer_votes else 1.0
+    if queries:
+        # Keep model loading and first-call overhead out of the timings
+        hybrid.search(queries[0], top_k=3)
+        models.retrieval.retrieve(queries[0])
+
+    examples = []
+    for query, ((domain, _), (intent, _)) in zip(queries, models.classify_batch(queries)):
+        analysis = routing_rules.analyze(query)
+        if domain != "STUDENT" or intent not in ROUTED_INTENTS or analysis.forbidden or analysis.numeric:
+            continue
+        candidates, hybrid_ms = _timed_ms(hybrid.search, query)
+        retrieved, retrieval_ms = _timed_ms(models.retrieval.retrieve, query)
+        defaults = {"HYBRID": 1.0, "RETRIEVAL": 1.0, "TRANSFORMER": transformer_prior}
+        examples.append({
+            "query": query,
+            "intent": intent,
+            "accepted": {"HYBRID": _hybrid_answer(candidates) is not None,
+                         "RETRIEVAL": _retrieval_answer(retrieved) is not None, "TRANSFORMER": True},
+            "latency_ms": {"HYBRID": hybrid_ms, "RETRIEVAL": retrieval_ms, "TRANSFORMER": transformer_ms},
+            "helpful": {engine: statistics.mean(votes[query][engine]) if votes[query].get(engine) else default
+                        for engine, default in defaults.items()},
+        })
+    return examples
+
+
+def succeeded(example, engine):
+    return example["accepted"][engine] and example["helpful"][engine] >= 0.5
+
+
+def fit_router(examples, transformer_ms):
+    queries = [example["query"] for example in examples]
+    vectorizer = TfidfVectorizer(stop_words="english", ngram_range=(1, 2)).fit(queries)
+    X = router_features(vectorizer, queries, [example["intent"] for example in examples])
+    heads = {}
+    for engine in SKIPPABLE:
+        y = np.array([succeeded(example, engine) for example in examples])
+        # A constant probability when every outcome was the same
+        heads[engine] = LogisticRegression(max_iter=1000).fit(X, y) if len(set(y)) > 1 else float(y.mean())
+    heads["TRANSFORMER"] = float(np.mean([example["helpful"]["TRANSFORMER"] for example in examples]))
+    costs_ms = {engine: statistics.median(example["latency_ms"][engine] for example in examples)
+                for engine in SKIPPABLE}
+    return {
+        "version": datetime.datetime.utcnow().strftime("%Y%m%d-%H%M%S"),
+        "vectorizer": vectorizer,
+        "heads": heads,
+        "costs_ms": dict(costs_ms, TRANSFORMER=transformer_ms),
+        "examples": len(examples),
+    }
+
+
+def _plans(artifact, examples, min_success):
+    router = LearnedRouter(min_success=min_success, artifact=artifact)
+    return router.plan_batch([example["query"] for example in examples], [example["intent"] for example in examples])
+
+
+def simulate(example, plan):
+    # (answering engine, latency, helpfulness) of running plan on the example
+    latency_ms = 0.0
+    for engine in plan:
+        latency_ms += example["latency_ms"][engine]
+        if example["accepted"][engine]:
+            return engine, latency_ms, example["helpful"][engine]
+    raise ValueError(f"plan {plan} has no engine that always answers")
+
+
+def oracle_plan(example):
+    # The cheapest engine that would have given a helpful answer
+    engines = [engine for engine in ENGINES if succeeded(example, engine)] or ["TRANSFORMER"]
+    return (min(engines, key=example["latency_ms"].get),)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def summarize(outcomes):
+    engines, latencies, helpful = zip(*outcomes)
+    return {
+        "queries": len(outcomes),
+        "mean_latency_ms": round(statistics.mean(latencies), 3),
+        "p95_latency_ms": round(percentile(latencies, 95), 3),
+        "answer_rate": round(statistics.mean(helpful), 4),
+        "engines": dict(collections.Counter(engines)),
+    }
+
+
+def evaluate(examples, transformer_ms, min_success, folds=5):
+    # Router plans come from k-fold cross-validation, so no query is routed
+    # by a router that was trained on it
+    if len(examples) < 2:
+        raise SystemExit(f"Need at least 2 routable queries in the log, found {len(examples)}")
+    router_plans = [None] * len(examples)
+    splitter = KFold(n_splits=min(folds, len(examples)), shuffle=True, random_state=RANDOM_STATE)
+    for train_idx, test_idx in splitter.split(examples):
+        artifact = fit_router([examples[i] for i in train_idx], transformer_ms)
+        for i, plan in zip(test_idx, _plans(artifact, [examples[i] for i in test_idx], min_success)):
+            router_plans[i] = plan
+
+    policies = {
+        "fixed": [FIXED_CASCADE[example["intent"]] for example in examples],
+        "router": router_plans,
+        "oracle": [oracle_plan(example) for example in examples],
+    }
+    report = {}
+    for name, plans in policies.items():
+        outcomes = [simulate(example, plan) for example, plan in zip(examples, plans)]
+        report[name] = summarize(outcomes)
+        report[name]["by_intent"] = {
+            intent: summarize([o for o, example in zip(outcomes, examples) if example["intent"] == intent])
+            for intent in ROUTED_INTENTS if any(example["intent"] == intent for example in examples)
+        }
+    return report
+
+
+def print_report(report):
+    print(f"{'policy':>7} {'intent':>11} {'queries':>8} {'mean ms':>9} {'p95 ms':>9} {'answer rate':>12}  engines")
+    for name, summary in report.items():
+        for intent, row in [("all", summary), *summary["by_intent"].items()]:
+            mix = ", ".join(f"{engine} {count}" for engine, count in sorted(row["engines"].items()))
+            print(f"{name:>7} {intent:>11} {row['queries']:>8} {row['mean_latency_ms']:>9.2f} "
+                  f"{row['p95_latency_ms']:>9.2f} {row['answer_rate']:>12.3f}  {mix}")
+
+
+def main():
+    import config
+
+    parser = argparse.ArgumentParser(description="Train and evaluate the learned engine router")
+    parser.add_argument("command", choices=("train", "evaluate"))
+    parser.add_argument("--log", default=None,
+                        help="feedback.db, a CSV export, or a Parquet export directory "
+                             "(default: FEEDBACK_DB_PATH plus its export in FEEDBACK_EXPORT_DIR)")
+    parser.add_argument("--transformer-ms", type=float, default=config.ROUTER_TRANSFORMER_COST_MS)
+    parser.add_argument("--min-success", type=float, default=config.ROUTER_MIN_SUCCESS)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--output", help="evaluate: write the report as JSON")
+    parser.add_argument("--path", help=f"train: where to write the router (default: {ROUTER_PATH})")
+    args = parser.parse_args()
+
+    # Paths on the command line are relative to where it was run, not to
+    # BASE_DIR, which the models and datasets are loaded from
+    args.log = args.log and os.path.abspath(args.log)
+    args.output = args.output and os.path.abspath(args.output)
+    args.path = os.path.abspath(args.path) if args.path else os.path.join(BASE_DIR, ROUTER_PATH)
+    os.chdir(BASE_DIR)
+    examples = replay(collect_votes(load_log(args.log)), args.transformer_ms)
+    logging.info(f"Replayed {len(examples)} routable queries from {args.log or 'the feedback history'}")
+
+    if args.command == "train":
+        if not examples:
+            raise SystemExit(f"No routable queries in {args.log or 'the feedback history'}")
+        artifact = fit_router(examples, args.transformer_ms)
+        os.makedirs(os.path.dirname(args.path), exist_ok=True)
+        atomic_dump(artifact, args.path)
+        print(f"Router {artifact['version']} trained on {len(examples)} queries, written to {args.path}; "
+              f"costs {json.dumps({e: round(ms, 2) for e, ms in artifact['costs_ms'].items()})}")
+        print("POST /models/reload to start routing with it")
+        return
+
+    report = evaluate(examples, args.transformer_ms, args.min_success, args.folds)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
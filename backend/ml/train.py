@@ -0,0 +1,200 @@
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, confusion_matrix, precision_recall_fscore_support
+from sklearn.model_selection import train_test_split
+
+from ml.online import BASE_DIR, HEADS
+
+# Trains the domain, intent and quality heads in parallel processes, sharing
+# one vectorizer between heads with the same TF-IDF settings. By default they
+# all use FUSED_SPEC and are also published together as classifier_heads.pkl.
+#
+#   python -m ml.train                    # all heads, fused
+#   python -m ml.train intent --no-publish
+#   python -m ml.train --separate         # per-head vectorizer settings
+
+MODELS_DIR = os.path.join(BASE_DIR, "models")
+VERSIONS_DIR = os.path.join(MODELS_DIR, "versions")
+FEATURE_CACHE_DIR = os.path.join(MODELS_DIR, ".feature_cache")
+FUSED_ARTIFACT = "classifier_heads.pkl"
+# Shared featurization for the fused artifact: intent needs bigrams, and the
+# other heads lose nothing by having them
+FUSED_SPEC = {"stop_words": "english", "ngram_range": (1, 2)}
+TEST_SIZE = 0.2
+RANDOM_STATE = 42
+
+
+def load_corpus(name):
+    spec = HEADS[name]
+    df = pd.read_csv(os.path.join(BASE_DIR, "datasets", spec["dataset"]), on_bad_lines="skip")
+    df = df.dropna(subset=["query", spec["label"]])
+    return df["query"].astype(str).tolist(), df[spec["label"]].tolist()
+
+
+def vectorizer_spec(name, fused=True):
+    if fused:
+        return dict(FUSED_SPEC)
+    return {"stop_words": "english", "ngram_range": tuple(HEADS[name]["ngram_range"])}
+
+
+def featurize(corpora, fused=True, cache_dir=FEATURE_CACHE_DIR):
+    # {head: texts} -> {head: (vectorizer, matrix)}, one fit per distinct spec
+    groups = {}
+    for name in corpora:
+        groups.setdefault(json.dumps(vectorizer_spec(name, fused), sort_keys=True), []).append(name)
+
+    features = {}
+    for spec_key, names in groups.items():
+        texts = sorted({text for name in names for text in corpora[name]})
+        digest = hashlib.sha1("\n".join([spec_key, *texts]).encode("utf-8")).hexdigest()[:16]
+        path = os.path.join(cache_dir, f"tfidf-{digest}.joblib")
+        if os.path.exists(path):
+            vectorizer, matrix = joblib.load(path)
+        else:
+            spec = json.loads(spec_key)
+            vectorizer = TfidfVectorizer(stop_words=spec["stop_words"], ngram_range=tuple(spec["ngram_range"]))
+            matrix = vectorizer.fit_transform(texts)
+            os.makedirs(cache_dir, exist_ok=True)
+            joblib.dump((vectorizer, matrix), f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+        row = {text: i for i, text in enumerate(texts)}
+        for name in names:
+            features[name] = (vectorizer, matrix[[row[text] for text in corpora[name]]])
+    return features
+
+
+def fit_head(X, y):
+    # Runs in a worker process: split, fit and evaluate one head
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=TEST_SIZE, random_state=RANDOM_STATE)
+    model = LogisticRegression(max_iter=1000)
+    model.fit(X_train, y_train)
+    pred = model.predict(X_test)
+    labels = sorted(set(y), key=str)
+    precision, recall, f1, _ = precision_recall_fscore_support(
+        y_test, pred, labels=labels, average="weighted", zero_division=0
+    )
+    metrics = {
+        "accuracy": round(float(accuracy_score(y_test, pred)), 4),
+        "precision": round(float(precision), 4),
+        "recall": round(float(recall), 4),
+        "f1_score": round(float(f1), 4),
+        "labels": [str(label) for label in labels],
+        "confusion_matrix": confusion_matrix(y_test, pred, labels=labels).tolist(),
+        "dataset_size": len(y),
+        "test_size": len(y_test),
+    }
+    return model, metrics
+
+
+def new_version():
+    return datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S%fZ")
+
+
+def write_version(version, results, vectorizers, fused=False, versions_dir=VERSIONS_DIR):
+    # Built under a temporary name and renamed into place, so a version
+    # directory is either complete or absent
+    final = os.path.join(versions_dir, version)
+    tmp = os.path.join(versions_dir, f".{version}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, (model, metrics) in results.items():
+        joblib.dump(model, os.path.join(tmp, f"{name}_model.pkl"))
+        joblib.dump(vectorizers[name], os.path.join(tmp, f"{name}_vectorizer.pkl"))
+        with open(os.path.join(tmp, f"{name}_metrics.json"), "w", encoding="utf-8") as f:
+            json.dump(metrics, f, indent=2)
+    if fused:
+        # Plain dict so loading it does not depend on this module
+        joblib.dump({
+            "version": version,
+            "vectorizer": next(iter(vectorizers.values())),
+            "heads": {name: model for name, (model, _) in results.items()},
+        }, os.path.join(tmp, FUSED_ARTIFACT))
+    with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": version, "heads": sorted(results), "fused": fused}, f, indent=2)
+    os.rename(tmp, final)
+    return final
+
+
+def publish(version_dir, heads, fused=False, models_dir=MODELS_DIR):
+    # Atomically replaces the files the server loads with one version's
+    files = [f"{name}_{suffix}" for name in heads for suffix in ("model.pkl", "vectorizer.pkl", "metrics.json")]
+    for filename in files + ([FUSED_ARTIFACT] if fused else []):
+        target = os.path.join(models_dir, filename)
+        shutil.copyfile(os.path.join(version_dir, filename), f"{target}.tmp")
+        os.replace(f"{target}.tmp", target)
+    if not fused and set(HEADS) <= set(heads) and os.path.exists(os.path.join(models_dir, FUSED_ARTIFACT)):
+        # Every head was just replaced by a separate model, which the stale
+        # fused artifact would shadow
+        os.remove(os.path.join(models_dir, FUSED_ARTIFACT))
+    current = os.path.join(models_dir, "CURRENT")
+    with open(f"{current}.tmp", "w", encoding="utf-8") as f:
+        f.write(os.path.basename(version_dir) + "\n")
+    os.replace(f"{current}.tmp", current)
+
+
+def train(heads=tuple(HEADS), workers=None, publish_models=True, fused=True):
+    if publish_models and not set(HEADS) <= set(heads) and os.path.exists(os.path.join(MODELS_DIR, FUSED_ARTIFACT)):
+        # The live fused artifact serves every head: publishing some of them
+        # alone would leave it serving the old ones
+        if not fused:
+            raise SystemExit(f"{FUSED_ARTIFACT} is live; retrain every head with --separate to replace it")
+        logging.info(f"{FUSED_ARTIFACT} is live, so every head is retrained to refit it")
+        heads = tuple(HEADS)
+    # The fused artifact serves domain and intent together, so it needs both
+    fused = fused and {"domain", "intent"} <= set(heads)
+    version = new_version()
+    corpora = {}
+    labels = {}
+    for name in heads:
+        corpora[name], labels[name] = load_corpus(name)
+    features = featurize(corpora, fused)
+
+    with ProcessPoolExecutor(max_workers=workers or min(len(heads), os.cpu_count() or 1)) as pool:
+        futures = {name: pool.submit(fit_head, features[name][1], np.asarray(labels[name])) for name in heads}
+        results = {name: future.result() for name, future in futures.items()}
+
+    evaluated = datetime.datetime.utcnow().isoformat()
+    for name, (_, metrics) in results.items():
+        metrics.update(last_evaluated=evaluated, model_version=version,
+                       explanation=f"LogisticRegression on TF-IDF {vectorizer_spec(name, fused)['ngram_range']}-grams, "
+                                   f"{int(TEST_SIZE * 100)}% held out.")
+    version_dir = write_version(version, results, {name: features[name][0] for name in heads}, fused)
+    if publish_models:
+        publish(version_dir, heads, fused)
+    return version_dir, {name: metrics for name, (_, metrics) in results.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the domain, intent and quality heads")
+    parser.add_argument("heads", nargs="*", help=f"any of {', '.join(HEADS)} (default: all)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no-publish", action="store_true", help="only write the version directory")
+    parser.add_argument("--separate", action="store_true",
+                        help="give each head its own vectorizer settings and skip the fused artifact")
+    args = parser.parse_args(argv)
+    unknown = set(args.heads) - set(HEADS)
+    if unknown:
+        parser.error(f"unknown heads: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.INFO)
+    version_dir, metrics = train(args.heads or tuple(HEADS), workers=args.workers,
+                                 publish_models=not args.no_publish, fused=not args.separate)
+    for name, m in metrics.items():
+        print(f"{name:>8}: accuracy {m['accuracy']:.3f}  f1 {m['f1_score']:.3f}  ({m['dataset_size']} rows)")
+    print(f"Wrote {version_dir}" + ("" if args.no_publish else "; published to models/ (POST /models/reload to serve)"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+from core.admission import AdmissionController, AdmissionGate, EngineBusy
+
+
+def hold(gate, entered, release):
+    with gate.admit():
+        entered.set()
+        release.wait(5)
+
+
+def test_requests_within_the_limit_are_admitted():
+    gate = AdmissionGate("transformer", limit=2)
+
+    first, second = gate.enter(), gate.enter()
+    assert gate.stats()["active"] == 2
+    gate.leave(first)
+    gate.leave(second)
+    assert gate.stats()["active"] == 0
+    assert gate.stats()["admitted"] == 2
+
+
+def test_full_queue_sheds_immediately():
+    gate = AdmissionGate("transformer", limit=1, queue_size=0, timeout_s=5.0)
+    entered, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=hold, args=(gate, entered, release))
+    holder.start()
+    entered.wait(5)
+
+    started = time.monotonic()
+    with pytest.raises(EngineBusy) as busy:
+        gate.enter()
+    assert time.monotonic() - started < 1.0
+    release.set()
+    holder.join()
+
+    assert busy.value.engine == "transformer"
+    assert busy.value.retry_after_s >= 1
+    assert gate.stats()["shed"] == {"queue_full": 1, "timeout": 0, "total": 1}
+
+
+def test_queued_request_is_shed_after_the_timeout():
+    gate = AdmissionGate("hybrid", limit=1, queue_size=1, timeout_s=0.05)
+    entered, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=hold, args=(gate, entered, release))
+    holder.start()
+    entered.wait(5)
+
+    with pytest.raises(EngineBusy):
+        gate.enter()
+    release.set()
+    holder.join()
+
+    stats = gate.stats()
+    assert stats["shed"]["timeout"] == 1
+    assert stats["peak_queue_depth"] == 1
+    assert stats["queue_depth"] == 0
+
+
+def test_queued_request_is_admitted_when_a_slot_frees():
+    gate = AdmissionGate("hybrid", limit=1, queue_size=1, timeout_s=5.0)
+    entered, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=hold, args=(gate, entered, release))
+    holder.start()
+    entered.wait(5)
+
+    threading.Timer(0.05, release.set).start()
+    gate.leave(gate.enter())
+    holder.join()
+
+    assert gate.stats()["admitted"] == 2
+    assert gate.stats()["shed"]["total"] == 0
+
+
+def test_zero_limit_only_counts():
+    gate = AdmissionGate("hybrid", limit=0)
+
+    tokens = [gate.enter() for _ in range(50)]
+    assert gate.stats()["active"] == 50
+    for token in tokens:
+        gate.leave(token)
+
+
+def test_shed_degrades_or_rejects_by_mode():
+    degrade = AdmissionController(mode="degrade")
+    degrade.add("transformer", 1)
+    degrade.shed(EngineBusy("transformer", 1))
+    assert degrade.stats()["engines"]["transformer"]["degraded"] == 1
+
+    reject = AdmissionController(mode="reject")
+    reject.add("transformer", 1)
+    with pytest.raises(EngineBusy):
+        reject.shed(EngineBusy("transformer", 1))
+    assert reject.stats()["engines"]["transformer"]["rejected"] == 1
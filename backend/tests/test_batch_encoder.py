@@ -0,0 +1,85 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from engines.batch_encoder import BatchingEncoder
+
+
+class FakeModel:
+    # Encodes each text as [len(text), batch size], recording every batch
+    def __init__(self, delay_s=0.0, fail=False):
+        self.delay_s = delay_s
+        self.fail = fail
+        self.batches = []
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True):
+        self.batches.append(list(texts))
+        time.sleep(self.delay_s)
+        if self.fail:
+            raise RuntimeError("encoder failed")
+        return np.array([[len(text), len(texts)] for text in texts], dtype=np.float32)
+
+
+def test_concurrent_submits_share_one_forward_pass():
+    model = FakeModel()
+    encoder = BatchingEncoder(model, max_batch_size=8, max_wait_ms=200)
+    barrier = threading.Barrier(4)
+    results = {}
+
+    def submit(text):
+        barrier.wait()
+        results[text] = encoder.submit(text).result(timeout=5)
+
+    threads = [threading.Thread(target=submit, args=("x" * n,)) for n in range(1, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    encoder.close()
+
+    assert len(model.batches) == 1
+    assert sorted(model.batches[0]) == ["x", "xx", "xxx", "xxxx"]
+    # Each caller gets its own row back
+    assert {text: row[0] for text, row in results.items()} == {"x": 1, "xx": 2, "xxx": 3, "xxxx": 4}
+    assert encoder.stats()["avg_batch_size"] == 4
+
+
+def test_batches_are_capped_at_max_batch_size():
+    model = FakeModel()
+    encoder = BatchingEncoder(model, max_batch_size=3, max_wait_ms=200)
+
+    embeddings = encoder.encode([f"q{i}" for i in range(7)])
+    encoder.close()
+
+    assert embeddings.shape == (7, 2)
+    assert [len(batch) for batch in model.batches] == [3, 3, 1]
+    assert encoder.stats()["batches"] == 3
+
+
+def test_encode_keeps_input_order():
+    encoder = BatchingEncoder(FakeModel(), max_batch_size=2, max_wait_ms=0)
+
+    embeddings = encoder.encode(["aaa", "a", "aa"])
+    encoder.close()
+
+    assert embeddings[:, 0].tolist() == [3, 1, 2]
+
+
+def test_encoder_errors_reach_every_caller_in_the_batch():
+    encoder = BatchingEncoder(FakeModel(fail=True), max_batch_size=4, max_wait_ms=50)
+
+    futures = [encoder.submit(text) for text in ("a", "b")]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="encoder failed"):
+            future.result(timeout=5)
+    encoder.close()
+
+
+def test_submit_after_close_fails():
+    encoder = BatchingEncoder(FakeModel())
+    encoder.close()
+
+    with pytest.raises(RuntimeError):
+        encoder.submit("late")
@@ -0,0 +1,101 @@
+import datetime
+import sqlite3
+
+from feedback.feedback_maintenance import FeedbackMaintenance, compact, export_watermark
+from feedback.feedback_writer import INSERT_SQL, migrate
+from ml.retrain_scheduler import RetrainScheduler
+
+NOW = datetime.datetime(2026, 6, 1, 12)
+OLD = (NOW - datetime.timedelta(days=40)).isoformat()
+RECENT = (NOW - datetime.timedelta(days=1)).isoformat()
+
+
+def make_db(path, rows):
+    # rows: (query, feedback, timestamp); ids are assigned 1, 2, ... in order
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.executemany(INSERT_SQL, [(query, feedback, "STUDENT", "FACTUAL", "HYBRID", ts)
+                                  for query, feedback, ts in rows])
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def remaining_ids(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute("SELECT id FROM feedback ORDER BY id")]
+    finally:
+        conn.close()
+
+
+def test_compact_keeps_rows_after_keep_after_id(tmp_path):
+    db = make_db(tmp_path / "feedback.db", [("a", None, OLD), ("b", None, OLD), ("c", None, OLD), ("d", None, RECENT)])
+
+    result = compact(db, retain_days=30, keep_after_id=2, now=NOW)
+
+    assert result["rows"] == 2
+    assert remaining_ids(db) == [3, 4]
+
+
+def test_compact_rolls_deleted_rows_into_daily_aggregates(tmp_path):
+    db = make_db(tmp_path / "feedback.db", [("a", 1, OLD), ("b", 1, OLD), ("c", None, OLD)])
+
+    compact(db, retain_days=30, now=NOW)
+
+    conn = sqlite3.connect(db)
+    daily = dict(conn.execute("SELECT feedback, n FROM feedback_daily").fetchall())
+    conn.close()
+    assert daily == {1: 2, -1: 1}
+    assert remaining_ids(db) == []
+
+
+def test_query_only_rows_are_compacted_before_any_vote(tmp_path):
+    db = make_db(tmp_path / "feedback.db", [("a", None, OLD), ("b", None, OLD), ("c", None, RECENT)])
+    scheduler = RetrainScheduler(db, str(tmp_path / "online"))
+
+    assert scheduler.consumed_id() == 3
+    compact(db, retain_days=30, keep_after_id=scheduler.consumed_id(), now=NOW)
+    assert remaining_ids(db) == [3]
+
+
+def test_unconsumed_vote_and_later_rows_are_kept(tmp_path):
+    db = make_db(tmp_path / "feedback.db", [("a", None, OLD), ("a", 1, OLD), ("b", None, OLD)])
+    scheduler = RetrainScheduler(db, str(tmp_path / "online"))
+
+    assert scheduler.consumed_id() == 1
+    compact(db, retain_days=30, keep_after_id=scheduler.consumed_id(), now=NOW)
+    assert remaining_ids(db) == [2, 3]
+
+
+def test_retrain_watermark_moves_past_query_only_rows(tmp_path):
+    db = make_db(tmp_path / "feedback.db", [("a", None, OLD), ("a", 1, OLD), ("b", None, OLD), ("c", None, OLD)])
+    scheduler = RetrainScheduler(db, str(tmp_path / "online"))
+
+    scheduler.retrain_once()
+    assert scheduler.watermark == 4
+    assert scheduler.last_run["rows"] == 1
+
+    conn = sqlite3.connect(db)
+    conn.execute(INSERT_SQL, ("d", None, None, None, None, RECENT))
+    conn.commit()
+    conn.close()
+    scheduler.retrain_once()
+    # Nothing to train on, but the watermark still advances
+    assert scheduler.watermark == 5
+    assert scheduler.runs == 1
+    assert RetrainScheduler(db, str(tmp_path / "online")).consumed_id() == 5
+
+
+def test_maintenance_bounds_compaction_by_export_and_consumed_id(tmp_path):
+    db = make_db(tmp_path / "feedback.db", [("a", None, OLD), ("b", 1, OLD), ("c", None, OLD)])
+    exports = str(tmp_path / "exports")
+    scheduler = RetrainScheduler(db, str(tmp_path / "online"))
+    maintenance = FeedbackMaintenance(db, retain_days=30, export_dir=exports, consumed_id=scheduler.consumed_id)
+
+    result = maintenance.run_once()
+
+    # Everything was exported, but the vote in row 2 has not been trained on
+    assert export_watermark(exports) == 3
+    assert result["compaction"]["rows"] == 1
+    assert remaining_ids(db) == [2, 3]
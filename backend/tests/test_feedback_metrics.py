@@ -0,0 +1,90 @@
+import sqlite3
+
+from feedback.feedback_metrics import FeedbackMetrics
+from feedback.feedback_writer import FeedbackWriter, INSERT_SQL, migrate
+
+
+def row(query, feedback=None, engine="HYBRID", timestamp="2026-06-01T12:00:00"):
+    return (query, feedback, "STUDENT", "FACTUAL", engine, timestamp)
+
+
+def read(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def make_db(path, rows):
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.executemany(INSERT_SQL, rows)
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def test_summary_trigger_counts_every_insert(tmp_path):
+    db = str(tmp_path / "feedback.db")
+    writer = FeedbackWriter(db, batch_size=4, flush_interval_ms=10)
+    for r in [row("a"), row("a", 1), row("b", 1), row("c", 0, engine="TRANSFORMER"),
+              row("d", timestamp="2026-06-01T13:05:00"), row("e", None, engine=None)]:
+        writer.submit(r)
+    writer.close()
+
+    summary = read(db, "SELECT hour, engine, domain, feedback, n FROM feedback_summary ORDER BY 1, 2, 4")
+    assert summary == [
+        ("2026-06-01T12", "", "STUDENT", -1, 1),
+        ("2026-06-01T12", "HYBRID", "STUDENT", -1, 1),
+        ("2026-06-01T12", "HYBRID", "STUDENT", 1, 2),
+        ("2026-06-01T12", "TRANSFORMER", "STUDENT", 0, 1),
+        ("2026-06-01T13", "HYBRID", "STUDENT", -1, 1),
+    ]
+
+
+def test_metrics_come_from_the_summary_table(tmp_path):
+    db = make_db(tmp_path / "feedback.db", [row("a"), row("a", 1), row("b", 0), row("c", 1, engine="TRANSFORMER")])
+
+    metrics = FeedbackMetrics(db, ttl_s=0).get()
+
+    assert (metrics["count"], metrics["helpful"], metrics["not_helpful"]) == (4, 2, 1)
+    assert metrics["by_engine"] == {"HYBRID": {1: 1, 0: 1}, "TRANSFORMER": {1: 1}}
+    assert metrics["by_domain"] == {"STUDENT": {1: 2, 0: 1}}
+    # The raw log is not read: clearing it leaves the counts unchanged
+    conn = sqlite3.connect(db)
+    conn.execute("DELETE FROM feedback")
+    conn.commit()
+    conn.close()
+    assert FeedbackMetrics(db, ttl_s=0).get()["count"] == 4
+
+
+def test_windows_cover_whole_hours(tmp_path):
+    db = make_db(tmp_path / "feedback.db", [
+        row("a", 1, timestamp="2026-06-01T10:59:00"),
+        row("b", 1, timestamp="2026-06-01T11:30:00"),
+        row("c", 0, timestamp="2026-06-01T12:01:00"),
+    ])
+    metrics = FeedbackMetrics(db, ttl_s=0)
+
+    assert metrics.get(since="2026-06-01T11:45:00")["count"] == 2
+    assert metrics.get(until="2026-06-01 11:00")["count"] == 2
+    assert metrics.get(since="2026-06-01T11:00", until="2026-06-01T11:00")["helpful"] == 1
+
+
+def test_results_are_reused_within_the_ttl(tmp_path):
+    db = make_db(tmp_path / "feedback.db", [row("a", 1)])
+    metrics = FeedbackMetrics(db, ttl_s=60)
+    assert metrics.get()["count"] == 1
+
+    conn = sqlite3.connect(db)
+    conn.execute(INSERT_SQL, row("b", 1))
+    conn.commit()
+    conn.close()
+
+    assert metrics.get()["count"] == 1
+    assert FeedbackMetrics(db, ttl_s=60).get()["count"] == 2
+
+
+def test_missing_table_reads_as_empty(tmp_path):
+    assert FeedbackMetrics(str(tmp_path / "missing.db"), ttl_s=0).get()["count"] == 0
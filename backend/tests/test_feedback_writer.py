@@ -0,0 +1,81 @@
+import sqlite3
+
+from feedback.feedback_writer import COLUMNS, FeedbackWriter, migrate
+
+
+def row(query, feedback=None, engine="HYBRID", timestamp="2026-06-01T12:00:00"):
+    return (query, feedback, "STUDENT", "FACTUAL", engine, timestamp)
+
+
+def read(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def test_rows_are_committed_in_batches(tmp_path):
+    db = str(tmp_path / "feedback.db")
+    writer = FeedbackWriter(db, batch_size=3, flush_interval_ms=200)
+
+    for i in range(7):
+        assert writer.submit(row(f"q{i}"))
+    writer.flush()
+
+    assert writer.stats()["written"] == 7
+    assert writer.stats()["batches"] == 3
+    assert writer.stats()["queue_depth"] == 0
+    assert read(db, "SELECT query FROM feedback ORDER BY id") == [(f"q{i}",) for i in range(7)]
+    writer.close()
+
+
+def test_a_partial_batch_is_committed_after_the_flush_interval(tmp_path):
+    db = str(tmp_path / "feedback.db")
+    writer = FeedbackWriter(db, batch_size=100, flush_interval_ms=20)
+
+    writer.submit(row("only"))
+    writer.flush()
+
+    assert read(db, "SELECT COUNT(*) FROM feedback") == [(1,)]
+    writer.close()
+
+
+def test_close_commits_queued_rows(tmp_path):
+    db = str(tmp_path / "feedback.db")
+    writer = FeedbackWriter(db, batch_size=2, flush_interval_ms=1000)
+
+    for i in range(5):
+        writer.submit(row(f"q{i}"))
+    writer.close()
+
+    assert read(db, "SELECT COUNT(*) FROM feedback") == [(5,)]
+
+
+def test_full_queue_drops_rows(tmp_path):
+    writer = FeedbackWriter(str(tmp_path / "feedback.db"), max_queue=1)
+    # Looks started to submit(), but no thread drains the queue
+    writer._thread = object()
+
+    assert writer.submit(row("kept"))
+    assert not writer.submit(row("dropped"))
+    assert writer.stats()["dropped"] == 1
+
+
+def test_migration_keys_legacy_rows_and_backfills_the_summary(tmp_path):
+    db = str(tmp_path / "feedback.db")
+    conn = sqlite3.connect(db)
+    # The table as it was before ids and the summary existed
+    conn.execute("CREATE TABLE feedback (query TEXT, feedback INTEGER, domain TEXT, intent TEXT, "
+                 "engine TEXT, timestamp TEXT)")
+    conn.executemany(f"INSERT INTO feedback ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)",
+                     [row("a", 1), row("b", 0), row("c")])
+    conn.execute("DELETE FROM feedback WHERE query = 'b'")
+    conn.commit()
+
+    migrate(conn)
+    migrate(conn)
+    conn.close()
+
+    assert read(db, "SELECT id, query FROM feedback ORDER BY id") == [(1, "a"), (3, "c")]
+    assert read(db, "SELECT SUM(n) FROM feedback_summary") == [(2,)]
@@ -0,0 +1,101 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from engines.hybrid_engine import HybridRetriever, calibrate
+from engines.retrieval_engine import fit_tfidf
+
+DOCS = [
+    {"id": "a", "text": "minimum attendance for the exam", "metadata": {"source": "rules"}},
+    {"id": "b", "text": "credits needed to graduate", "metadata": {"source": "rules"}},
+    {"id": "c", "text": "revaluation fee for answer sheets", "metadata": {"answer": "500 rupees", "source": "fees"}},
+    {"id": "d", "text": "hostel curfew timings", "metadata": {"source": "hostel"}},
+]
+# FAISS label -> record row; "d" was added after the index was built
+LABEL_ROWS = {10: 0, 11: 1, 12: 2}
+
+
+def make_retriever(**kwargs):
+    vectorizer, matrix = fit_tfidf([doc["text"] for doc in DOCS])
+    store = SimpleNamespace(
+        records=DOCS,
+        tfidf={"records": (vectorizer, matrix)},
+        row=LABEL_ROWS.get,
+        indexed_rows=lambda: np.array(sorted(LABEL_ROWS.values())),
+    )
+    dense = SimpleNamespace(
+        store=None,
+        encode=lambda queries: np.zeros((len(queries), 4), dtype=np.float32),
+        search_labels=lambda embeddings, k: (np.array([[0.9, 0.4, 0.1]] * len(embeddings)),
+                                             np.array([[10, 11, 12]] * len(embeddings))),
+    )
+    return HybridRetriever(dense, store=store, **kwargs)
+
+
+def fuse(retriever, dense, sparse, top_k=4):
+    labels = np.array([label for label, _ in dense])
+    sims = np.array([sim for _, sim in dense])
+    return retriever.fuse_batch((sims[None], labels[None]), np.array([sparse], dtype=float), top_k)[0]
+
+
+def test_calibrate_maps_the_threshold_to_one_half():
+    assert calibrate(0.35, 0.35) == pytest.approx(0.5)
+    assert calibrate(1.0, 0.35) == pytest.approx(1.0)
+    assert calibrate(0.0, 0.35) == pytest.approx(0.0)
+    assert calibrate(-0.2, 0.8) == pytest.approx(0.0)
+    assert calibrate(1.3, 0.8) == pytest.approx(1.0)
+    values = calibrate(np.linspace(0, 1, 21), 0.8)
+    assert np.all(np.diff(values) > 0)
+
+
+def test_weighted_and_rrf_fusion_rank_differently():
+    # a: dense only, b: middling on both, c: sparse only
+    dense = [(10, 0.99), (11, 0.5), (12, 0.3)]
+    sparse = [0.0, 0.5, 0.95, 0.0]
+
+    weighted = fuse(make_retriever(fusion="weighted"), dense, sparse, top_k=3)
+    rrf = fuse(make_retriever(fusion="rrf"), dense, sparse, top_k=3)
+
+    assert [c["id"] for c in weighted] == ["c", "a", "b"]
+    assert [c["id"] for c in rrf] == ["a", "b", "c"]
+    # RRF only changes the order; callers still threshold on the calibrated score
+    assert {c["id"]: c["score"] for c in weighted} == {c["id"]: c["score"] for c in rrf}
+    c = weighted[0]
+    assert c["score"] == pytest.approx(0.6 * calibrate(0.3, 0.35) + 0.4 * calibrate(0.95, 0.8), abs=1e-4)
+    assert c["answer"] == "500 rupees"
+    assert (c["dense"], c["sparse"], c["source"]) == (0.3, 0.95, "fees")
+
+
+def test_unindexed_documents_are_scored_on_sparse_alone():
+    candidates = fuse(make_retriever(), [(10, 0.2)], [0.0, 0.0, 0.0, 0.9])
+
+    assert candidates[0]["id"] == "d"
+    assert candidates[0]["score"] == pytest.approx(float(calibrate(0.9, 0.8)), abs=1e-4)
+
+
+def test_indexed_documents_outside_a_full_dense_list_score_at_its_floor():
+    retriever = make_retriever(candidates=2)
+    candidates = {c["id"]: c for c in fuse(retriever, [(10, 0.9), (11, 0.6)], [0.0, 0.0, 0.5, 0.0])}
+
+    assert candidates["c"]["dense"] == 0.6
+
+
+def test_labels_the_store_does_not_know_are_ignored():
+    candidates = fuse(make_retriever(), [(99, 0.9), (-1, 0.0)], [0.0, 0.3, 0.0, 0.0])
+
+    assert candidates[0]["id"] == "b"
+    assert all(c["dense"] == 0.0 for c in candidates)
+
+
+def test_search_combines_both_halves():
+    candidates = make_retriever().search("minimum attendance for the exam", top_k=1)
+
+    assert candidates[0]["id"] == "a"
+    assert candidates[0]["dense"] == 0.9
+    assert candidates[0]["sparse"] == pytest.approx(1.0)
+
+
+def test_unknown_fusion_is_rejected():
+    with pytest.raises(ValueError):
+        make_retriever(fusion="max")
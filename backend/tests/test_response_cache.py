@@ -0,0 +1,101 @@
+import numpy as np
+
+from core import response_cache as response_cache_module
+from core.response_cache import ResponseCache, normalize_query
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def answer(text):
+    return {"answer": text, "engine": "HYBRID"}
+
+
+def test_exact_tier_matches_normalized_queries():
+    cache = ResponseCache(max_entries=4)
+    cache.put("What is the Attendance policy?", answer("75%"))
+
+    assert cache.get("what is the attendance   policy") == answer("75%")
+    assert cache.get("What is the grading policy?") is None
+    # Decimal points are part of the key
+    assert normalize_query("2.5 + 1") != normalize_query("25 + 1")
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache_module, "time", clock)
+    cache = ResponseCache(max_entries=4, ttl_s=10.0)
+    cache.put("q", answer("a"))
+
+    clock.now += 9.9
+    assert cache.get("q") == answer("a")
+    clock.now += 0.2
+    assert cache.get("q") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", answer("a"))
+    cache.put("b", answer("b"))
+    cache.get("a")
+    cache.put("c", answer("c"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") == answer("a")
+    assert cache.get("c") == answer("c")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_semantic_tier_matches_within_scope_and_threshold():
+    cache = ResponseCache(max_entries=4, semantic_threshold=0.95)
+    cache.put("minimum attendance", answer("75%"), embedding=np.array([1.0, 0.0]), scope="FACTUAL")
+
+    assert cache.get_semantic(np.array([0.99, 0.05]), scope="FACTUAL") == answer("75%")
+    assert cache.get_semantic(np.array([0.99, 0.05]), scope="EXPLANATION") is None
+    assert cache.get_semantic(np.array([0.7, 0.7]), scope="FACTUAL") is None
+
+
+def test_evicted_entries_free_their_semantic_slot():
+    cache = ResponseCache(max_entries=1)
+    cache.put("a", answer("a"), embedding=np.array([1.0, 0.0]), scope="FACTUAL")
+    cache.put("b", answer("b"), embedding=np.array([0.0, 1.0]), scope="FACTUAL")
+
+    assert cache.get_semantic(np.array([1.0, 0.0]), scope="FACTUAL") is None
+    assert cache.get_semantic(np.array([0.0, 1.0]), scope="FACTUAL") == answer("b")
+    assert cache.stats()["semantic_entries"] == 1
+
+
+def test_answers_from_before_an_invalidation_are_not_stored():
+    cache = ResponseCache(max_entries=4)
+    cache.put("old", answer("old"))
+    generation = cache.generation
+
+    # A model reload lands while a request is still computing its answer
+    cache.invalidate()
+    cache.put("q", answer("stale"), generation=generation)
+
+    assert cache.get("old") is None
+    assert cache.get("q") is None
+    cache.put("q", answer("fresh"), generation=cache.generation)
+    assert cache.get("q") == answer("fresh")
+
+
+def test_returned_responses_are_copies():
+    cache = ResponseCache(max_entries=4)
+    cache.put("q", answer("a"))
+
+    cache.get("q")["answer"] = "changed"
+    assert cache.get("q") == answer("a")
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResponseCache(enabled=False)
+    cache.put("q", answer("a"))
+
+    assert cache.get("q") is None
@@ -0,0 +1,65 @@
+import threading
+import time
+
+from ml.retrain_scheduler import RetrainScheduler
+
+
+class CountingScheduler(RetrainScheduler):
+    # retrain_once replaced by a counter that can be held open mid-run
+    def __init__(self, **kwargs):
+        super().__init__("unused.db", "unused", **kwargs)
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+        self.entered = threading.Event()
+
+    def retrain_once(self):
+        self.calls += 1
+        self.entered.set()
+        self.release.wait(5)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_triggers_inside_the_debounce_window_coalesce_into_one_run():
+    scheduler = CountingScheduler(debounce_s=0.1, max_delay_s=5.0)
+    for _ in range(10):
+        scheduler.trigger()
+
+    assert wait_for(lambda: scheduler.calls == 1)
+    time.sleep(0.3)
+    assert scheduler.calls == 1
+    assert scheduler.stats()["triggers"] == 10
+    assert not scheduler.stats()["pending"]
+
+
+def test_max_delay_bounds_a_steady_stream_of_triggers():
+    scheduler = CountingScheduler(debounce_s=0.2, max_delay_s=0.3)
+    start = time.monotonic()
+    # Each trigger lands inside the previous debounce window
+    while scheduler.calls == 0 and time.monotonic() - start < 2.0:
+        scheduler.trigger()
+        time.sleep(0.05)
+
+    assert scheduler.calls == 1
+    assert time.monotonic() - start < 1.0
+
+
+def test_triggers_during_a_run_schedule_one_follow_up():
+    scheduler = CountingScheduler(debounce_s=0.05, max_delay_s=5.0)
+    scheduler.release.clear()
+    scheduler.trigger()
+    assert scheduler.entered.wait(5)
+
+    for _ in range(5):
+        scheduler.trigger()
+    scheduler.release.set()
+
+    assert wait_for(lambda: scheduler.calls == 2)
+    time.sleep(0.2)
+    assert scheduler.calls == 2
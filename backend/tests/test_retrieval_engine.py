@@ -0,0 +1,84 @@
+import csv
+import os
+import random
+
+import numpy as np
+import pytest
+
+from engines.kb_store import load_qa_entries
+from engines.retrieval_engine import RetrievalEngine, select_top_k
+
+DATASETS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "datasets")
+
+
+def synthetic_entries(n=400, seed=7):
+    # A few very common terms (long postings, the bincount path) and many
+    # rare ones (short postings, the sort path), with some duplicate questions
+    rng = random.Random(seed)
+    common = ["exam", "credits", "attendance", "semester"]
+    rare = [f"term{i}" for i in range(300)]
+    questions = []
+    for _ in range(n):
+        words = rng.sample(common, rng.randint(0, 2)) + rng.sample(rare, rng.randint(1, 4))
+        questions.append(" ".join(words))
+    questions += questions[:10]
+    return [{"question": q, "answer": f"answer to {q}", "category": "test"} for q in questions]
+
+
+def synthetic_queries(seed=11):
+    rng = random.Random(seed)
+    vocab = ["exam", "credits", "attendance", "semester"] + [f"term{i}" for i in range(320)]
+    return [" ".join(rng.sample(vocab, rng.randint(1, 5))) for _ in range(200)] + ["", "nothing matches here"]
+
+
+def dataset_queries():
+    with open(os.path.join(DATASETS, "intent_dataset.csv"), encoding="utf-8") as f:
+        return [row["query"] for row in csv.DictReader(f)]
+
+
+def assert_same_top_k(inverted, matmul, queries, k):
+    for query, a, b in zip(queries, inverted.retrieve_topk_batch(queries, k), matmul.retrieve_topk_batch(queries, k)):
+        assert [c["question"] for c in a] == [c["question"] for c in b], query
+        assert [c["score"] for c in a] == pytest.approx([c["score"] for c in b], abs=1e-9), query
+
+
+@pytest.mark.parametrize("k", [1, 3, 10])
+def test_inverted_and_matmul_rank_the_same_synthetic_questions(k):
+    entries = synthetic_entries()
+    inverted = RetrievalEngine(scoring="inverted", entries=entries)
+    matmul = RetrievalEngine(scoring="matmul", entries=entries)
+
+    assert_same_top_k(inverted, matmul, synthetic_queries(), k)
+
+
+def test_inverted_and_matmul_agree_on_the_knowledge_base():
+    entries = load_qa_entries()
+    inverted = RetrievalEngine(scoring="inverted", entries=entries)
+    matmul = RetrievalEngine(scoring="matmul", entries=entries)
+    queries = dataset_queries() + [entry["question"] for entry in entries]
+
+    assert_same_top_k(inverted, matmul, queries, 5)
+    assert inverted.retrieve_batch(queries) == matmul.retrieve_batch(queries)
+
+
+def test_retrieve_applies_the_threshold():
+    entries = [{"question": "what is the minimum attendance", "answer": "Seventy five percent.", "category": "rules"}]
+    engine = RetrievalEngine(threshold=0.7, entries=entries)
+
+    assert engine.retrieve("minimum attendance")["source"] == "rules"
+    assert engine.retrieve("grading system")["source"] is None
+
+
+def test_select_top_k_breaks_ties_on_the_lowest_doc():
+    docs = np.array([9, 4, 7, 2, 5])
+    scores = np.array([0.5, 0.9, 0.5, 0.1, 0.5])
+
+    top_docs, top_scores = select_top_k(docs, scores, 3)
+    assert top_docs.tolist() == [4, 5, 7]
+    assert top_scores.tolist() == [0.9, 0.5, 0.5]
+    assert select_top_k(docs, scores, 10)[0].tolist() == [4, 5, 7, 9, 2]
+
+
+def test_unknown_scoring_is_rejected():
+    with pytest.raises(ValueError):
+        RetrievalEngine(scoring="bm25", entries=synthetic_entries(10))
@@ -0,0 +1,128 @@
+import csv
+import json
+import os
+import re
+
+import pytest
+
+import config
+from core.routing_rules import RoutingRules
+from engines.calculator import calculate
+
+DATASETS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "datasets")
+
+# The hard-coded checks routing_rules.json replaced, kept as the reference
+FORBIDDEN_KEYWORDS = ["hack", "leak", "cheat", "predict marks", "get exam paper"]
+
+
+def old_forbidden(query):
+    ql = query.lower()
+    return any(kw in ql for kw in FORBIDDEN_KEYWORDS)
+
+
+def old_numeric(query):
+    ql = query.lower()
+    return "calculate" in ql or "cgpa" in ql or "percentage" in ql
+
+
+def old_calculator_op(query):
+    nums = re.findall(r"\d+\.\d+|\d+", query)
+    ql = query.lower()
+    if "multiply" in ql and len(nums) >= 2:
+        return "multiply"
+    if "add" in ql and len(nums) >= 2:
+        return "add"
+    if ("percentage" in ql or "percent" in ql) and len(nums) == 2:
+        return "percentage"
+    if ("average" in ql or "cgpa" in ql or "gpa" in ql) and len(nums) >= 2:
+        return "average"
+    return None
+
+
+def old_risk(query):
+    return "HIGH_RISK" if query.lower().startswith(("who", "when", "where")) else "LOW_RISK"
+
+
+def old_difficulty(query):
+    words = len(query.split())
+    return "EASY" if words < 4 else "MEDIUM" if words < 8 else "HARD"
+
+
+def dataset_queries():
+    queries = []
+    for name in ("intent_dataset.csv", "domain_dataset.csv", "quality_dataset.csv"):
+        with open(os.path.join(DATASETS, name), encoding="utf-8") as f:
+            queries.extend(row["query"] for row in csv.DictReader(f) if row.get("query"))
+    return queries
+
+
+EDGE_CASES = [
+    # Keywords inside longer words and keywords that overlap
+    "What is my address for the exam?",
+    "Calculate my CGPA from 8.5 and 9",
+    "What percentage is 45 of 60?",
+    "percent of 3 in 4",
+    "Average GPA of 7, 8 and 9.5",
+    "Can I cheat or hack the portal?",
+    "How do I get exam paper leaks",
+    "Predict marks for 3 subjects",
+    "Multiply 3 and 4 then add 5",
+    "add 2.5 and 2.5",
+    "percentage 10",
+    "Who is the principal?",
+    "WHERE is the library",
+    "whenever I study",
+    "",
+    "hello",
+]
+
+
+@pytest.fixture(scope="module")
+def rules():
+    with open(config.ROUTING_RULES_PATH, encoding="utf-8") as f:
+        return RoutingRules(json.load(f))
+
+
+@pytest.mark.parametrize("query", dataset_queries() + EDGE_CASES)
+def test_rules_match_the_old_keyword_checks(rules, query):
+    analysis = rules.analyze(query)
+
+    assert analysis.forbidden == old_forbidden(query)
+    assert analysis.numeric == old_numeric(query)
+    assert analysis.calculator_op == old_calculator_op(query)
+    assert analysis.risk == old_risk(query)
+    assert analysis.difficulty == old_difficulty(query)
+
+
+def test_overlapping_keywords_are_all_reported(rules):
+    analysis = rules.analyze("cgpa percentage")
+
+    # "gpa" sits inside "cgpa", "percent" inside "percentage"
+    assert analysis.matches["calculator"] == {"average", "percentage"}
+    assert analysis.numeric
+
+
+def test_runs_of_whitespace_are_collapsed(rules):
+    # Unlike the old substring checks, extra spaces do not defeat a
+    # multi-word keyword
+    assert rules.analyze("predict   marks").forbidden
+    assert not old_forbidden("predict   marks")
+
+
+def test_calculator_answers_from_the_analysis(rules):
+    assert calculate("multiply 3 and 4", rules.analyze("multiply 3 and 4"))["answer"] == "12.0"
+    assert calculate("percentage 45 of 60", rules.analyze("percentage 45 of 60"))["answer"] == "75.0%"
+    assert calculate("average 7 8 9", rules.analyze("average 7 8 9"))["answer"] == "8.0"
+    assert calculate("hello", rules.analyze("hello"))["answer"] == "Calculation not supported."
+
+
+def test_unknown_calculator_op_is_rejected():
+    spec = {
+        "guard": {"forbidden": []},
+        "numeric": {"keywords": []},
+        "calculator": [{"op": "divide", "keywords": ["divide"]}],
+        "risk": {"high_risk_prefixes": []},
+        "difficulty": {"easy_below_words": 4, "medium_below_words": 8},
+    }
+    with pytest.raises(ValueError):
+        RoutingRules(spec)